@@ -9,9 +9,11 @@ from app.agents.tools.db_tools import (
     get_user_history,
 )
 from app.models import InterventionOutput
+from app.services.agent_policy import raise_if_cancelled
 
 logger = logging.getLogger(__name__)
-_llm = LLM(model="anthropic/claude-sonnet-4-20250514")
+# stream=True so the progress websocket can forward restructured tasks as they arrive
+_llm = LLM(model="anthropic/claude-sonnet-4-20250514", stream=True)
 
 # Knowledge base: pass Path objects so CrewAI uses them as-is (strings get prefixed with "knowledge/")
 from pathlib import Path as _Path
@@ -126,6 +128,7 @@ def run_intervention(
         process=Process.sequential,
         memory=True,
         verbose=False,
+        step_callback=raise_if_cancelled,
     )
     result = crew.kickoff()
 
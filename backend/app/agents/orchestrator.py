@@ -4,6 +4,7 @@ from crewai import Agent, Task, Crew, Process, LLM
 from app.agents.planning_agent import planning_agent, create_planning_task
 from app.agents.tools.db_tools import get_cognitive_profile, get_user_history
 from app.models import PlanOutput
+from app.services.agent_policy import raise_if_cancelled
 
 logger = logging.getLogger(__name__)
 
@@ -72,6 +73,7 @@ def run_orchestrated_planning(
         manager_agent=manager_agent,
         memory=True,
         verbose=False,
+        step_callback=raise_if_cancelled,
     )
 
     result = crew.kickoff()
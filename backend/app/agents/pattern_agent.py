@@ -1,70 +1,145 @@
 import json
 from crewai import Agent, Task, Crew, Process, LLM
-from app.agents.tools.db_tools import get_user_history, save_hypothesis_card
 from app.models import PatternOutput
+from app.services.agent_policy import raise_if_cancelled
+from app.services.hypothesis_store import store_cards
+from app.services.pattern_analysis import Analysis, analyze_user, confidence_for
 
 _llm = LLM(model="anthropic/claude-sonnet-4-20250514")
 
 pattern_agent = Agent(
     role="Behavioral Pattern Analyst",
     goal=(
-        "Analyze longitudinal user data (checkins, plan completions, interventions) "
-        "to detect meaningful behavioral patterns and generate testable hypotheses. "
+        "Turn statistically tested findings from longitudinal user data (checkins, "
+        "plan completions, interventions) into meaningful, testable hypotheses. "
         "Focus on patterns that are actionable — things that can improve the user's "
         "daily planning and intervention strategy."
     ),
     backstory=(
         "You are a behavioral data scientist specializing in ADHD executive function "
-        "patterns. You look for correlations between brain states, task completion, "
-        "mood, intervention triggers, and time-of-day effects. Your hypotheses must "
-        "be specific, testable, and backed by evidence from the user's actual data.\n\n"
+        "patterns. You receive a table of candidate findings that were already computed "
+        "from the user's data: correlations, next-day (lagged) effects and group "
+        "differences, each with an effect size, permutation-test p-value, a q-value "
+        "adjusted for every test run on the user (false discovery rate), sample size "
+        "and the days that support it. You decide which findings matter and phrase them "
+        "as hypotheses the user can act on.\n\n"
         "HYPOTHESIS QUALITY RULES:\n"
-        "- Every hypothesis must cite specific days/data points as evidence\n"
-        "- Confidence levels: 'low' (2-3 supporting data points), 'medium' (4-6), 'high' (7+)\n"
+        "- Every hypothesis must be based on exactly one finding from the table\n"
+        "- Prefer small q-values and large effects; never contradict the sign of the effect\n"
         "- Predictions must be falsifiable ('If X happens, then Y will follow')\n"
         "- Focus on patterns the user can ACT on, not just observe\n"
-        "- Do NOT generate hypotheses if insufficient data (<7 days)\n"
         "- Maximum 3 hypotheses per analysis run"
     ),
-    tools=[get_user_history, save_hypothesis_card],
+    tools=[],
     llm=_llm,
     allow_delegation=False,
     max_rpm=20,
-    max_iter=10,
+    max_iter=3,
     verbose=False,
 )
 
 
+def build_pattern_prompt(analysis: Analysis) -> str:
+    """Task description for one user's findings table (shared with batch detection)."""
+    return (
+        f"Candidate findings from the user's last {analysis.days} days of data "
+        "(effect: r = correlation, d = Cohen's d; p from a permutation test; "
+        "q = p adjusted for all tests on this user, Benjamini-Hochberg):\n\n"
+        f"{analysis.table()}\n\n"
+        "Generate 1-3 hypothesis cards from the strongest, most actionable findings. "
+        "Each card must have:\n"
+        "  - findingId: the id of the finding it is based on (e.g. 'F1')\n"
+        "  - patternDetected: Specific pattern description in plain language\n"
+        "  - prediction: Testable prediction for future behavior\n"
+        "  - confidence: 'low' | 'medium' | 'high'\n"
+        "  - status: 'active'\n"
+        "Evidence days are attached automatically from the finding — do not list them.\n"
+        "IMPORTANT: Do NOT invent patterns that are not in the table. If no finding is "
+        "worth acting on, return an empty list."
+    )
+
+
+def parse_pattern_output(result) -> list[dict]:
+    """Cards from a crew/LLM result: structured output first, raw JSON as a fallback."""
+    if hasattr(result, "pydantic") and result.pydantic is not None:
+        return result.pydantic.model_dump()["cards"]
+
+    raw = str(result.raw) if hasattr(result, "raw") else str(result)
+    try:
+        start = raw.find("{")
+        end = raw.rfind("}") + 1
+        if start >= 0 and end > start:
+            return PatternOutput.model_validate_json(raw[start:end]).model_dump()["cards"]
+    except ValueError:
+        pass
+    try:
+        start_arr = raw.find("[")
+        end_arr = raw.rfind("]") + 1
+        if start_arr >= 0 and end_arr > start_arr:
+            return PatternOutput(cards=json.loads(raw[start_arr:end_arr])).model_dump()["cards"]
+    except ValueError:
+        pass
+    return []
+
+
+def card_rows(user_id: str, cards: list[dict], analysis: Analysis) -> list[dict]:
+    """hypothesis_cards rows with evidence and confidence taken from the cited findings.
+
+    Cards that cite no known finding are dropped, as are repeats of the same finding.
+    """
+    findings = analysis.by_id()
+    rows, used = [], set()
+    for card in cards[:3]:
+        finding = findings.get(card.get("findingId") or "")
+        if finding is None or finding.id in used:
+            continue
+        used.add(finding.id)
+        rows.append({
+            "user_id": user_id,
+            "pattern_detected": card["patternDetected"],
+            "prediction": card["prediction"],
+            "confidence": confidence_for(finding),
+            "supporting_evidence": finding.evidence,
+            "status": "active",
+            # Checked against later checkins by the hypothesis engine
+            "condition": finding.condition,
+            "evaluation": {"trials": 0, "hits": 0},
+            "evaluated_through": analysis.through,
+        })
+    return rows
+
+
+def save_pattern_cards(user_id: str, cards: list[dict], analysis: Analysis) -> list[dict]:
+    rows = card_rows(user_id, cards, analysis)
+    if not rows:
+        return []
+    raise_if_cancelled()  # a cancelled/superseded run must not write
+    saved = store_cards(rows)
+    return [
+        {
+            "id": row["id"],
+            "patternDetected": row["pattern_detected"],
+            "prediction": row["prediction"],
+            "confidence": row["confidence"],
+            "supportingEvidence": row["supporting_evidence"],
+            "status": row["status"],
+        }
+        for row in saved
+    ]
+
+
 def run_pattern_detection(user_id: str) -> dict:
     """Analyze user history and generate hypothesis cards."""
+    analysis = analyze_user(user_id)
+    if not analysis.findings:
+        # Too little data or nothing significant — no need to spend an LLM call
+        return {"cards": [], "findings": 0}
+
     task = Task(
-        description=(
-            f"Analyze the behavioral data for user {user_id}.\n\n"
-            f"Step 1: Use get_user_history tool with user_id={user_id} to fetch "
-            "recent checkins and past interventions.\n"
-            "Step 2: Look for these pattern types:\n"
-            "  - Energy patterns: Do low-energy days follow high-output days?\n"
-            "  - Time-of-day effects: When is the user most productive?\n"
-            "  - Task type preferences: Which categories have highest completion?\n"
-            "  - Intervention triggers: What conditions precede getting stuck?\n"
-            "  - Mood correlations: What predicts good vs bad mood days?\n"
-            "  - Brain state accuracy: Does self-reported brain state match outcomes?\n"
-            "Step 3: Generate 1-3 hypothesis cards. Each card must have:\n"
-            "  - patternDetected: Specific pattern description\n"
-            "  - prediction: Testable prediction for future behavior\n"
-            "  - confidence: 'low' | 'medium' | 'high' (based on evidence strength)\n"
-            "  - supportingEvidence: Array of {day: number, detail: string}\n"
-            "  - status: 'active' (always 'active' for new hypotheses)\n"
-            f"Step 4: Use save_hypothesis_card tool with user_id={user_id} to save "
-            "each hypothesis card.\n"
-            "Step 5: Return a JSON array of all generated cards.\n\n"
-            "IMPORTANT: Only generate hypotheses backed by real data patterns. "
-            "Do NOT make up patterns. If insufficient data (<7 days), return an "
-            "empty array: []"
-        ),
+        description=build_pattern_prompt(analysis),
         expected_output=(
-            "A JSON array of hypothesis cards, each with patternDetected, prediction, "
-            "confidence, supportingEvidence, and status fields. Empty array if insufficient data."
+            "A JSON object {\"cards\": [...]} with 0-3 hypothesis cards, each with findingId, "
+            "patternDetected, prediction, confidence and status fields."
         ),
         output_pydantic=PatternOutput,
         agent=pattern_agent,
@@ -76,31 +151,9 @@ def run_pattern_detection(user_id: str) -> dict:
         process=Process.sequential,
         memory=True,
         verbose=False,
+        step_callback=raise_if_cancelled,
     )
 
     result = crew.kickoff()
-
-    # Try structured output first (Pydantic model)
-    if hasattr(result, "pydantic") and result.pydantic is not None:
-        return result.pydantic.model_dump()
-
-    # Fallback to raw JSON parsing
-    raw = str(result.raw) if hasattr(result, "raw") else str(result)
-
-    try:
-        start_arr = raw.find("[")
-        end_arr = raw.rfind("]") + 1
-        if start_arr >= 0 and end_arr > start_arr:
-            return {"cards": json.loads(raw[start_arr:end_arr])}
-    except json.JSONDecodeError:
-        pass
-
-    try:
-        start = raw.find("{")
-        end = raw.rfind("}") + 1
-        if start >= 0 and end > start:
-            return json.loads(raw[start:end])
-    except json.JSONDecodeError:
-        pass
-
-    return {"cards": [], "error": "Failed to parse pattern result", "raw": raw}
+    cards = save_pattern_cards(user_id, parse_pattern_output(result), analysis)
+    return {"cards": cards, "findings": len(analysis.findings)}
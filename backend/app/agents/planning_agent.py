@@ -4,10 +4,12 @@ from crewai import Agent, Task, Crew, Process, LLM
 from crewai.knowledge.source.text_file_knowledge_source import TextFileKnowledgeSource
 from app.agents.tools.db_tools import get_cognitive_profile, save_daily_plan, get_user_history
 from app.models import PlanOutput
+from app.services.agent_policy import raise_if_cancelled
 
 logger = logging.getLogger(__name__)
 
-_llm = LLM(model="anthropic/claude-sonnet-4-20250514")
+# stream=True so the progress websocket can forward tasks as they are generated
+_llm = LLM(model="anthropic/claude-sonnet-4-20250514", stream=True)
 
 # Knowledge base: pass Path objects so CrewAI uses them as-is (strings get prefixed with "knowledge/")
 from pathlib import Path as _Path
@@ -147,6 +149,7 @@ def run_planning(user_id: str, brain_state: str, user_tasks: list[str] | None =
         process=Process.sequential,
         memory=True,
         verbose=False,
+        step_callback=raise_if_cancelled,
     )
     result = crew.kickoff()
 
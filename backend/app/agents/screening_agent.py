@@ -4,6 +4,7 @@ from crewai import Agent, Task, Crew, Process, LLM
 from app.agents.tools.scoring_tools import score_asrs
 from app.agents.tools.db_tools import save_profile_to_db
 from app.models import ScreeningOutput
+from app.services.agent_policy import raise_if_cancelled
 
 logger = logging.getLogger(__name__)
 _llm = LLM(model="anthropic/claude-sonnet-4-20250514")
@@ -86,6 +87,7 @@ def run_screening(user_id: str, answers: list[dict]) -> dict:
         process=Process.sequential,
         memory=True,
         verbose=False,
+        step_callback=raise_if_cancelled,
     )
     result = crew.kickoff()
 
@@ -1,6 +1,8 @@
 import json
 from crewai.tools import tool
 from app.database import get_supabase_admin
+from app.services.agent_policy import raise_if_cancelled, write_lock
+from app.services.hypothesis_store import store_cards
 
 
 @tool
@@ -9,6 +11,7 @@ def save_profile_to_db(user_id: str, profile_json: str) -> str:
     Input: user_id and profile_json containing dimensions, profileTags, summary,
     asrsTotalScore, isPositiveScreen.
     Returns: the saved profile id."""
+    raise_if_cancelled()  # a cancelled/superseded run must not write
     db = get_supabase_admin()
     profile = json.loads(profile_json)
     result = db.table("cognitive_profiles").insert({
@@ -54,14 +57,17 @@ def save_daily_plan(user_id: str, plan_json: str) -> str:
     Returns: the saved plan id."""
     db = get_supabase_admin()
     plan = json.loads(plan_json)
-    # Deactivate all prior plans for this user
-    db.table("daily_plans").update({"is_active": False}).eq("user_id", user_id).eq("is_active", True).execute()
-    result = db.table("daily_plans").insert({
-        "user_id": user_id,
-        "brain_state": plan["brainState"],
-        "tasks": plan["tasks"],
-        "overall_rationale": plan.get("overallRationale", ""),
-    }).execute()
+    # Under the lock: a hedged loser cannot deactivate the plan the route just activated
+    with write_lock(user_id):
+        raise_if_cancelled()  # a cancelled/superseded run must not write
+        # Deactivate all prior plans for this user
+        db.table("daily_plans").update({"is_active": False}).eq("user_id", user_id).eq("is_active", True).execute()
+        result = db.table("daily_plans").insert({
+            "user_id": user_id,
+            "brain_state": plan["brainState"],
+            "tasks": plan["tasks"],
+            "overall_rationale": plan.get("overallRationale", ""),
+        }).execute()
     return json.dumps({"planId": result.data[0]["id"]})
 
 
@@ -96,6 +102,7 @@ def save_intervention(user_id: str, intervention_json: str) -> str:
     Input: user_id and intervention_json with planId, triggerType, stuckTaskIndex,
     userMessage, emotionalAcknowledgment, originalTasks, restructuredTasks, agentReasoning.
     Returns: the saved intervention id."""
+    raise_if_cancelled()  # a cancelled/superseded run must not write
     db = get_supabase_admin()
     data = json.loads(intervention_json)
     result = db.table("interventions").insert({
@@ -119,17 +126,17 @@ def save_hypothesis_card(user_id: str, card_json: str) -> str:
     Input: user_id and card_json containing patternDetected, prediction,
     confidence (low|medium|high), supportingEvidence (array), status (active|confirmed|disproved|evolving).
     Returns: the saved card id."""
-    db = get_supabase_admin()
+    raise_if_cancelled()  # a cancelled/superseded run must not write
     card = json.loads(card_json)
-    result = db.table("hypothesis_cards").insert({
+    stored = store_cards([{
         "user_id": user_id,
         "pattern_detected": card["patternDetected"],
         "prediction": card["prediction"],
         "confidence": card.get("confidence", "medium"),
         "supporting_evidence": card.get("supportingEvidence", []),
         "status": card.get("status", "active"),
-    }).execute()
-    return json.dumps({"cardId": result.data[0]["id"]})
+    }])
+    return json.dumps({"cardId": stored[0]["id"] if stored else None})
 
 
 @tool
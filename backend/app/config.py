@@ -9,6 +9,94 @@ class Settings(BaseSettings):
     supabase_service_role_key: str
     frontend_url: str = "http://localhost:3000"
 
+    # Plan-result cache (repeat /plan/generate with identical inputs)
+    plan_cache_ttl_seconds: int = 6 * 60 * 60
+    plan_cache_max_entries: int = 512
+
+    # Hedged planning: start the direct planner if the orchestrator overruns this budget
+    plan_hedging_enabled: bool = True
+    plan_hedge_budget_seconds: float = 25.0
+
+    # Agent execution policy: per-endpoint deadlines and LLM circuit breaker
+    plan_deadline_seconds: float = 120.0
+    intervention_deadline_seconds: float = 60.0
+    screening_deadline_seconds: float = 90.0
+    pattern_deadline_seconds: float = 180.0
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+
+    # Dedicated agent executor: pool size, bounded queue and per-user limits
+    agent_pool_size: int = 8
+    agent_queue_max: int = 64
+    agent_per_user_concurrency: int = 2
+    agent_per_user_queue_max: int = 4
+
+    # Durable job queue (agent_jobs table) and its worker
+    job_worker_embedded: bool = True
+    job_worker_concurrency: int = 2
+    job_worker_poll_seconds: float = 2.0
+    job_visibility_timeout_seconds: int = 300
+    pattern_refresh_hours: int = 24
+
+    # Hypothesis cards: near-duplicate merge threshold and active cards kept per user
+    hypothesis_duplicate_threshold: float = 0.5
+    hypothesis_max_active_cards: int = 6
+
+    # Nightly batch pattern detection; when enabled, dashboard loads never start pattern work
+    pattern_batch_enabled: bool = True
+    pattern_batch_hour_utc: int = 3
+    pattern_batch_provider: str = "anthropic"  # "anthropic" (Message Batches API) or "local"
+    pattern_batch_model: str = "claude-sonnet-4-20250514"
+    pattern_batch_concurrency: int = 8
+    pattern_batch_poll_seconds: float = 60.0
+    pattern_batch_timeout_seconds: float = 24 * 60 * 60
+
+    # Nightly population/cohort momentum snapshot
+    cohort_momentum_enabled: bool = True
+    cohort_momentum_hour_utc: int = 2
+
+    # Bulk ASRS import: records scored and written per chunk; admins may call admin-only endpoints
+    screening_import_chunk_rows: int = 1000
+    admin_user_ids: str = ""  # comma-separated user ids
+
+    # Cognitive test trials are stored as packed binary; zlib-compress when it saves space
+    trial_compression: bool = True
+
+    # Agent run ledger (agent_runs table): rows are buffered and inserted in batches
+    agent_ledger_enabled: bool = True
+    agent_ledger_flush_seconds: float = 2.0
+    agent_ledger_batch_size: int = 200
+
+    # Supabase round trips per request: X-DB-* debug headers, N+1 threshold (same query shape
+    # repeated this often) and what a route over its declared query budget does: off, warn or raise
+    db_debug_headers: bool = False
+    db_n_plus_one_threshold: int = 5
+    db_query_budget_mode: str = "warn"
+
+    # On-demand sampling profiler (admin API, SIGUSR2): folded stacks go to profile_dir. Sampling
+    # backs off past profile_max_overhead of wall time and every session ends after profile_max_seconds
+    profile_dir: str = "profiles"
+    profile_interval_ms: float = 10.0
+    profile_max_seconds: float = 300.0
+    profile_max_overhead: float = 0.05
+    profile_signal_seconds: float = 30.0
+
+    # Request tracing (OpenTelemetry spans): "none", "console", "file" (JSON lines) or "otlp"
+    trace_exporter: str = "none"
+    trace_file: str = "traces.jsonl"
+    trace_otlp_endpoint: str = ""  # e.g. http://localhost:4318/v1/traces
+    trace_sample_ratio: float = 1.0
+    trace_sample_routes: str = ""  # per path prefix, e.g. "/api/plan=1,/api/dashboard=0.05"
+
+    # Agent progress fanout across API/worker processes: "local" (in-process), "postgres" or "redis"
+    progress_fanout: str = "local"
+    progress_fanout_url: str = ""  # Postgres: session-mode DSN (LISTEN needs it); Redis: redis://host:port
+    progress_fanout_flush_ms: int = 20
+    # Progress streams: replay buffer per user (kept this long after disconnect) and max frames/s per connection
+    progress_replay_size: int = 256
+    progress_replay_ttl_seconds: float = 300.0
+    progress_frame_rate: float = 10.0
+
     model_config = {"env_file": ".env", "extra": "ignore"}
 
 
@@ -1,22 +1,52 @@
 from functools import lru_cache
+from typing import Callable, Iterable
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
 from app.config import get_settings
+from app.services.db_metrics import timed_http_client
+
+IN_BATCH = 100      # values per .in_() filter: 100 UUIDs keep the URL near 4 KB, under gateway request-line limits
+PAGE_ROWS = 1000    # PostgREST max_rows; a larger result is silently truncated
+
+
+def _options() -> SyncClientOptions:
+    # Shared transport wrapper times every PostgREST query (supabase_query_seconds)
+    return SyncClientOptions(httpx_client=timed_http_client())
 
 
 @lru_cache()
 def get_supabase_anon() -> Client:
     """Client using anon key — respects RLS policies. Use in route handlers."""
     settings = get_settings()
-    return create_client(settings.supabase_url, settings.supabase_key)
+    return create_client(settings.supabase_url, settings.supabase_key, options=_options())
 
 
 @lru_cache()
 def get_supabase_admin() -> Client:
     """Client using service_role key — bypasses RLS. Use ONLY in agent tools and seed service."""
     settings = get_settings()
-    return create_client(settings.supabase_url, settings.supabase_service_role_key)
+    return create_client(settings.supabase_url, settings.supabase_service_role_key, options=_options())
 
 
 def get_supabase() -> Client:
     """Deprecated: use get_supabase_anon() or get_supabase_admin() instead."""
     return get_supabase_anon()
+
+
+def select_in(query: Callable, column: str, values: Iterable, batch: int = IN_BATCH) -> list[dict]:
+    """All rows of query() with column in values: IN_BATCH values per request, each paged with .range().
+
+    query builds a fresh select, ordered on a unique key so pages are stable, e.g.
+        select_in(lambda: db.table("users").select("id").order("id"), "id", user_ids)
+    """
+    values = list(dict.fromkeys(values))
+    rows = []
+    for i in range(0, len(values), batch):
+        start = 0
+        while True:
+            page = query().in_(column, values[i:i + batch]).range(start, start + PAGE_ROWS - 1).execute().data
+            rows.extend(page)
+            if len(page) < PAGE_ROWS:
+                break
+            start += PAGE_ROWS
+    return rows
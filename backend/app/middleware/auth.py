@@ -1,4 +1,5 @@
-from fastapi import HTTPException, Header
+from fastapi import Depends, HTTPException, Header
+from app.config import get_settings
 from app.database import get_supabase_anon
 from typing import Optional
 
@@ -39,3 +40,11 @@ async def get_current_user(
             status_code=401,
             detail=f"Authentication failed: {str(e)}",
         )
+
+
+async def require_admin(user_id: str = Depends(get_current_user)) -> str:
+    """FastAPI dependency: like get_current_user, but only for ids listed in ADMIN_USER_IDS."""
+    admins = {a.strip() for a in get_settings().admin_user_ids.split(",") if a.strip()}
+    if user_id not in admins:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user_id
@@ -0,0 +1,25 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.services.profiler import get_profiler
+
+
+class ProfileRequestsMiddleware:
+    """ASGI middleware: hand matching requests to an armed requests-mode profiling session.
+
+    With no session armed this is one attribute read per request and a direct
+    call into the app (no BaseHTTPMiddleware task or stream wrapping).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        profiler = get_profiler()
+        if scope["type"] != "http" or not profiler.armed:
+            return await self.app(scope, receive, send)
+        session = profiler.claim(scope["path"])
+        if session is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.release(session)
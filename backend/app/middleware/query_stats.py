@@ -0,0 +1,81 @@
+import logging
+from fastapi import Depends, Request
+from app.config import get_settings
+from app.middleware.tracing import route_template
+from app.services import db_metrics, metrics
+
+logger = logging.getLogger(__name__)
+
+_request_queries = metrics.histogram(
+    "request_db_queries", "Supabase round trips per HTTP request by route",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+_request_db_seconds = metrics.histogram("request_db_seconds", "Cumulative Supabase time per HTTP request by route")
+_request_db_bytes = metrics.histogram(
+    "request_db_bytes", "Supabase bytes sent + received per HTTP request by route",
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+)
+_n_plus_one = metrics.counter("db_n_plus_one_total", "Requests that repeated one query shape past the threshold")
+_over_budget = metrics.counter("db_query_budget_exceeded_total", "Requests over their route's declared query budget")
+
+
+class QueryBudgetExceeded(Exception):
+    """A route made more Supabase round trips than its declared budget (DB_QUERY_BUDGET_MODE=raise)."""
+
+
+def query_budget(max_queries: int):
+    """Route dependency declaring the most Supabase round trips one request may make.
+
+    Usage:
+        @router.get("/{user_id}", dependencies=[query_budget(10)])
+
+    Counts every Supabase call the request makes, including the auth lookup
+    in get_current_user and queries made by crews it runs.
+    """
+    async def declare():
+        stats = db_metrics.current_query_stats()
+        if stats is not None:
+            stats.budget = max_queries
+    return Depends(declare)
+
+
+async def track_queries(request: Request, call_next):
+    """HTTP middleware: count Supabase round trips, time and bytes per request.
+
+    Flags repeated same-shape queries (likely N+1) and routes over their declared
+    query_budget. With DB_DEBUG_HEADERS the counts are returned as X-DB-* headers.
+    """
+    settings = get_settings()
+    stats, token = db_metrics.start_query_stats()
+    try:
+        response = await call_next(request)
+    finally:
+        db_metrics.end_query_stats(token)
+    label = f"{request.method} {route_template(request) or 'unmatched'}"
+
+    _request_queries.observe(stats.queries, route=label)
+    if stats.queries:
+        _request_db_seconds.observe(stats.seconds, route=label)
+        _request_db_bytes.observe(stats.bytes, route=label)
+
+    repeated = stats.repeated(settings.db_n_plus_one_threshold)
+    for shape, count in repeated:
+        _n_plus_one.inc(route=label)
+        logger.warning(f"Likely N+1 in {label}: {count}x {shape}")
+
+    if stats.budget is not None and stats.queries > stats.budget and settings.db_query_budget_mode != "off":
+        _over_budget.inc(route=label)
+        message = f"{label} made {stats.queries} Supabase round trips, budget is {stats.budget}"
+        if settings.db_query_budget_mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    if settings.db_debug_headers:
+        response.headers["X-DB-Queries"] = str(stats.queries)
+        response.headers["X-DB-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+        response.headers["X-DB-Bytes"] = str(stats.bytes)
+        if stats.budget is not None:
+            response.headers["X-DB-Query-Budget"] = str(stats.budget)
+        if repeated:
+            response.headers["X-DB-N-Plus-One"] = "; ".join(f"{count}x {shape}" for shape, count in repeated)
+    return response
@@ -0,0 +1,49 @@
+from fastapi import Request
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from app.services import tracing
+
+UNTRACED_PATHS = {"/", "/metrics", "/api/metrics"}
+
+
+def route_template(request: Request) -> str | None:
+    """Full template of the matched route ("/api/dashboard/{user_id}"), or None before routing.
+
+    Routes of an included router carry only their router-relative path in
+    scope["route"], so the include prefix is recovered from the request path:
+    it is what precedes the shortest suffix the route's pattern matches.
+    """
+    route = request.scope.get("route")
+    if route is None:
+        return None
+    path = request.scope["path"]
+    regex = getattr(route, "path_regex", None)
+    if regex is not None:
+        for i, char in enumerate(path):
+            if char == "/" and regex.match(path[i:]):
+                return path[:i] + route.path
+    return route.path
+
+
+async def trace_requests(request: Request, call_next):
+    """HTTP middleware: one server span per request, the root of its trace.
+
+    The span is renamed to the matched route template ("POST /api/plan/generate",
+    "GET /api/dashboard/{user_id}") once routing has happened. Health checks and
+    metric scrapes are not traced.
+    """
+    path = request.url.path
+    if not tracing.enabled() or path in UNTRACED_PATHS:
+        return await call_next(request)
+    with tracing.span(
+        f"{request.method} {path}", kind=SpanKind.SERVER,
+        **{"http.request.method": request.method, tracing.PATH_ATTRIBUTE: path},
+    ) as span:
+        response = await call_next(request)
+        template = route_template(request)
+        if template is not None:
+            span.update_name(f"{request.method} {template}")
+            span.set_attribute("http.route", template)
+        span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_status(Status(StatusCode.ERROR, f"HTTP {response.status_code}"))
+        return response
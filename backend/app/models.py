@@ -57,6 +57,20 @@ class ScreeningResponse(BaseModel):
     isPositiveScreen: bool
 
 
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ScreeningImportResponse(BaseModel):
+    importId: str
+    rows: int
+    imported: int
+    rejected: int
+    errors: list[ImportRowError]  # first 50 only
+    jobIds: list[str]  # screening_narratives jobs, one per chunk
+
+
 # ── Cognitive Profile ──
 class ProfileResponse(BaseModel):
     dimensions: list[RadarDimension]
@@ -81,6 +95,7 @@ class PlanRequest(BaseModel):
     brainState: Literal["foggy", "focused", "wired"]
     tasks: Optional[list[str]] = None
     timeWindowMinutes: Optional[int] = Field(None, ge=15, le=480)  # 15 min to 8 hrs
+    regenerate: bool = False  # Skip the plan cache and force a fresh agent run
 
 
 class PlanResponse(BaseModel):
@@ -104,6 +119,22 @@ class InterventionResponse(BaseModel):
     followupHint: Optional[str] = None
 
 
+# ── Checkins ──
+class CheckinRequest(BaseModel):
+    moodScore: int = Field(..., ge=1, le=10)
+    energyLevel: Literal["low", "medium", "high"]
+    tasksCompleted: int = Field(..., ge=0)
+    tasksTotal: int = Field(..., ge=0)
+    notes: Optional[str] = None
+    planId: Optional[str] = None
+    checkinDate: Optional[str] = None  # YYYY-MM-DD, defaults to today
+
+
+class CheckinResponse(BaseModel):
+    checkinId: str
+    hypothesesUpdated: int = 0
+
+
 # ── Dashboard ──
 class TrendDataPoint(BaseModel):
     date: str
@@ -113,6 +144,7 @@ class TrendDataPoint(BaseModel):
     brainState: str
     tasksCompleted: int
     tasksTotal: int
+    momentumScore: Optional[int] = None  # momentum as of this checkin (history)
 
 
 class HypothesisCard(BaseModel):
@@ -145,6 +177,38 @@ class DashboardResponse(BaseModel):
     hypothesisCards: list[HypothesisCard]
     agentAnnotations: list[AgentAnnotation]
     feedbackHistory: list[FeedbackItem] = []
+    patternJobId: Optional[str] = None  # set while a pattern refresh is queued or running
+
+
+class TrendBucket(BaseModel):
+    date: str  # first day of the bucket
+    checkins: int
+    moodScore: float
+    completionRate: float
+    tasksCompleted: int
+    tasksTotal: int
+    brainStateMix: dict[str, float]  # share of checkins per brain state
+    momentumScore: Optional[float] = None
+
+
+class TrendResponse(BaseModel):
+    start: str
+    end: str
+    granularity: Literal["day", "week", "month"]
+    totalBuckets: int  # before downsampling
+    points: list[TrendBucket]
+
+
+class JobStatusResponse(BaseModel):
+    jobId: str
+    jobType: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int
+    maxAttempts: int
+    lastError: Optional[str] = None
+    result: Optional[dict] = None
+    createdAt: str
+    finishedAt: Optional[str] = None
 
 
 # ── CrewAI Structured Output Models ──
@@ -184,10 +248,11 @@ class PatternEvidence(BaseModel):
 
 
 class PatternCard(BaseModel):
+    findingId: Optional[str] = None  # id of the pre-analysis finding the card is based on
     patternDetected: str
     prediction: str
     confidence: Literal["low", "medium", "high"]
-    supportingEvidence: list[PatternEvidence]
+    supportingEvidence: list[PatternEvidence] = []
     status: Literal["active", "confirmed", "disproved", "evolving"] = "active"
 
 
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from typing import Optional
-from app.middleware.auth import get_current_user
+from app.middleware.auth import get_current_user, require_admin
 from app.database import get_supabase_admin
 
 router = APIRouter()
@@ -29,6 +30,55 @@ async def track_event(
     return {"status": "tracked"}
 
 
+@router.get("/cohorts")
+async def get_cohort_momentum(current_user: str = Depends(get_current_user)):
+    """Latest nightly momentum snapshot: population distribution and cohort trends (aggregates only)."""
+    db = get_supabase_admin()
+    rows = (
+        db.table("cohort_momentum_snapshots")
+        .select("snapshot_date, stats")
+        .order("snapshot_date", desc=True)
+        .limit(1)
+        .execute()
+    ).data
+    if not rows:
+        raise HTTPException(status_code=404, detail="No cohort snapshot yet")
+    return {"snapshotDate": rows[0]["snapshot_date"], **rows[0]["stats"]}
+
+
+@router.get("/agent-runs")
+async def get_agent_run_latency(
+    days: int = Query(7, ge=1, le=90),
+    group_by: str = Query("route", description="route | agent | segment"),
+    admin_id: str = Depends(require_admin),
+):
+    """p50/p95 latency, error/degraded rates, retries and tokens from the agent_runs ledger (admin only)."""
+    if group_by not in ("route", "agent", "segment"):
+        raise HTTPException(status_code=422, detail="group_by must be route, agent or segment")
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    rows = get_supabase_admin().rpc("agent_run_latency", {
+        "p_since": since.isoformat(),
+        "p_group": group_by,
+    }).execute().data
+    return {
+        "since": since.isoformat(),
+        "groupBy": group_by,
+        "groups": [
+            {
+                "key": r["group_key"],
+                "runs": r["runs"],
+                "p50Ms": r["p50_ms"],
+                "p95Ms": r["p95_ms"],
+                "errorRate": r["error_rate"],
+                "degradedRate": r["degraded_rate"],
+                "avgRetries": r["avg_retries"],
+                "avgTokens": r["avg_tokens"],
+            }
+            for r in rows
+        ],
+    }
+
+
 @router.get("/summary/{user_id}")
 async def get_analytics_summary(
     user_id: str,
@@ -40,18 +90,33 @@ async def get_analytics_summary(
 
     db = get_supabase_admin()
     events = db.table("analytics_events").select("*").eq("user_id", user_id).execute().data
+    # Server-side record of the agent runs behind those events (agent_runs ledger)
+    runs = {r["route"]: r for r in db.rpc("agent_run_user_summary", {"p_user_id": user_id}).execute().data}
 
     def _avg(values: list) -> float:
         filtered = [v for v in values if v is not None]
         return round(sum(filtered) / len(filtered)) if filtered else 0
 
+    plan_runs = runs.get("plan")
     return {
         "totalScreenings": len([e for e in events if e["event_type"] == "screening_completed"]),
         "totalPlans": len([e for e in events if e["event_type"] == "plan_generated"]),
         "totalInterventions": len([e for e in events if e["event_type"] == "intervention_triggered"]),
-        "avgPlanGenerationMs": _avg([
+        # Measured by the server when the ledger has plan runs; client-reported durationMs otherwise
+        "avgPlanGenerationMs": round(plan_runs["avg_ms"]) if plan_runs and plan_runs["avg_ms"] is not None else _avg([
             e["duration_ms"] for e in events
             if e["event_type"] == "plan_generated" and e.get("duration_ms")
         ]),
+        "agentRuns": {
+            route: {
+                "runs": r["runs"],
+                "succeeded": r["succeeded"],
+                "degraded": r["degraded"],
+                "p50Ms": r["p50_ms"],
+                "p95Ms": r["p95_ms"],
+                "totalTokens": r["total_tokens"],
+            }
+            for route, r in runs.items()
+        },
         "events": events[-50:],
     }
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, Header
 from typing import Optional
 from app.models import GuestLoginResponse, SignupRequest, LoginRequest, AuthResponse
 from app.database import get_supabase_anon, get_supabase_admin
+from app.middleware.query_stats import query_budget
 
 router = APIRouter()
 
@@ -24,7 +25,7 @@ def _extract_user_id_from_token(authorization: Optional[str]) -> Optional[str]:
     return None
 
 
-@router.post("/guest", response_model=GuestLoginResponse)
+@router.post("/guest", response_model=GuestLoginResponse, dependencies=[query_budget(25)])
 async def guest_login(authorization: Optional[str] = Header(None)):
     """Create or retrieve the guest Alex demo account with pre-seeded data.
 
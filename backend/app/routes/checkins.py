@@ -0,0 +1,44 @@
+import logging
+from fastapi import APIRouter, Depends
+from app.models import CheckinRequest, CheckinResponse
+from app.database import get_supabase_admin
+from app.middleware.auth import get_current_user
+from app.services.hypothesis_engine import evaluate_user
+from app.services.momentum_service import record_checkin
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.post("", response_model=CheckinResponse)
+async def create_checkin(
+    request: CheckinRequest,
+    user_id: str = Depends(get_current_user),
+):
+    """Record a daily checkin, fold it into the user's momentum and re-check open hypotheses against it."""
+    db = get_supabase_admin()
+    row = {
+        "user_id": user_id,
+        "mood_score": request.moodScore,
+        "energy_level": request.energyLevel,
+        "tasks_completed": request.tasksCompleted,
+        "tasks_total": request.tasksTotal,
+        "notes": request.notes,
+        "plan_id": request.planId,
+    }
+    if request.checkinDate:
+        row["checkin_date"] = request.checkinDate
+    result = db.table("checkins").insert(row).execute()
+    checkin = result.data[0]
+
+    try:
+        record_checkin(checkin)
+    except Exception as e:
+        logger.warning(f"Momentum update failed for {user_id}: {e}")  # Non-blocking; rebuilt on next read
+
+    updated = 0
+    try:
+        updated = evaluate_user(user_id)
+    except Exception as e:
+        logger.warning(f"Hypothesis evaluation failed for {user_id}: {e}")  # Non-blocking
+    return CheckinResponse(checkinId=checkin["id"], hypothesesUpdated=updated)
@@ -1,20 +1,28 @@
+import logging
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, Optional
 from app.database import get_supabase_admin
 from app.middleware.auth import get_current_user
+from app.config import get_settings
+from app.services import cognitive_metrics, trial_storage
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Everything but raw_data: summary reads never fetch trial payloads
+_SUMMARY_COLUMNS = "id, user_id, test_type, score, metrics, label, interpretation, completed_at"
+
 
 class SaveTestRequest(BaseModel):
     userId: str
     testType: str   # 'asrs' | 'time_perception' | 'reaction_time'
-    score: int
     rawData: dict[str, Any]
-    metrics: dict[str, Any]
-    label: str
-    interpretation: str
+    # Client-computed values; only used for 'asrs'. Trial-based tests are scored from rawData.
+    score: Optional[int] = None
+    metrics: dict[str, Any] = {}
+    label: Optional[str] = None
+    interpretation: Optional[str] = None
 
 
 @router.post("/save")
@@ -22,41 +30,76 @@ async def save_test_result(
     request: SaveTestRequest,
     user_id: str = Depends(get_current_user),
 ):
-    """Save a cognitive test result (ASRS, time perception, or reaction time)."""
+    """Save a cognitive test result (ASRS, time perception, or reaction time).
+
+    Time perception and reaction time are scored here from rawData.trials, and
+    their metrics carry population percentiles.
+    """
     # Ensure users can only save their own results
     if request.userId != user_id:
         raise HTTPException(status_code=403, detail="Can only save your own test results")
 
+    if request.testType in cognitive_metrics.TRIAL_TESTS:
+        try:
+            evaluated = cognitive_metrics.evaluate(request.testType, request.rawData)
+        except cognitive_metrics.TrialDataError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        score, metrics = evaluated["score"], evaluated["metrics"]
+        # Placed against the population before this result is added to it
+        percentiles = cognitive_metrics.get_population_norms().percentiles(request.testType, score, metrics)
+        evaluated["metrics"] = {**metrics, "percentiles": percentiles}
+    else:
+        if request.score is None or request.label is None or request.interpretation is None:
+            raise HTTPException(status_code=422, detail="score, label and interpretation are required")
+        evaluated = {
+            "score": request.score,
+            "metrics": request.metrics,
+            "label": request.label,
+            "interpretation": request.interpretation,
+        }
+
+    # Saved with trials as JSON first; they move to cognitive_test_trials only once the blob is written
     db = get_supabase_admin()
     result = db.table("cognitive_tests").insert({
         "user_id": user_id,
         "test_type": request.testType,
-        "score": request.score,
         "raw_data": request.rawData,
-        "metrics": request.metrics,
-        "label": request.label,
-        "interpretation": request.interpretation,
+        **evaluated,
     }).execute()
 
     if not result.data:
         raise HTTPException(status_code=500, detail="Failed to save test result")
+    test_id = result.data[0]["id"]
+    blob = trial_storage.encode_trials(
+        request.testType, request.rawData.get("trials") or [], get_settings().trial_compression
+    )
+    if blob is not None:
+        trial_storage.pack_saved_trials(test_id, user_id, request.testType, blob)
+
+    if request.testType in cognitive_metrics.TRIAL_TESTS:
+        try:
+            cognitive_metrics.record_norms(request.testType, score, metrics)
+        except Exception as e:
+            logger.warning(f"Recording {request.testType} norms failed: {e}")
 
-    return {"testId": result.data[0]["id"], "status": "saved"}
+    return {"testId": test_id, "status": "saved", **evaluated}
 
 
 @router.get("/{user_id}")
 async def get_test_results(
     user_id: str,
+    include_trials: bool = False,
     current_user: str = Depends(get_current_user),
 ):
-    """Get the most recent result for each test type for a user."""
+    """Get the most recent result for each test type for a user (raw trials only with include_trials)."""
     if user_id != current_user:
         raise HTTPException(status_code=403, detail="Can only view your own test results")
 
     db = get_supabase_admin()
+    columns = _SUMMARY_COLUMNS + (", raw_data" if include_trials else "")
     results = (
         db.table("cognitive_tests")
-        .select("*")
+        .select(columns)
         .eq("user_id", user_id)
         .order("completed_at", desc=True)
         .execute()
@@ -69,4 +112,33 @@ async def get_test_results(
         if t not in seen:
             seen[t] = row
 
-    return {"tests": list(seen.values())}
+    tests = list(seen.values())
+    if include_trials:
+        trials = trial_storage.load_trials(tests)
+        for test in tests:
+            test["raw_data"] = {**test["raw_data"], "trials": trials.get(test["id"], [])}
+    return {"tests": tests}
+
+
+@router.get("/{user_id}/{test_id}/trials")
+async def get_test_trials(
+    user_id: str,
+    test_id: str,
+    current_user: str = Depends(get_current_user),
+):
+    """Raw trials of one test, decoded on request."""
+    if user_id != current_user:
+        raise HTTPException(status_code=403, detail="Can only view your own test results")
+
+    db = get_supabase_admin()
+    rows = (
+        db.table("cognitive_tests")
+        .select("id, test_type, raw_data")
+        .eq("id", test_id)
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+    ).data
+    if not rows:
+        raise HTTPException(status_code=404, detail="Test not found")
+    return {"testId": test_id, "trials": trial_storage.load_trials(rows).get(test_id, [])}
@@ -1,30 +1,39 @@
-import asyncio
+import logging
 from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, HTTPException, Depends
-from app.models import DashboardResponse, TrendDataPoint, HypothesisCard, AgentAnnotation, FeedbackItem
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from app.models import (
+    DashboardResponse, TrendDataPoint, HypothesisCard, AgentAnnotation, FeedbackItem, TrendBucket, TrendResponse,
+)
 from app.database import get_supabase_admin
-from app.services.momentum_service import calculate_momentum
+from app.services.momentum_service import get_momentum
 from app.middleware.auth import get_current_user
+from app.middleware.query_stats import query_budget
+from app.services import job_queue
+from app.services.hypothesis_engine import evaluate_user
+from app.services import trend_service
+from app.config import get_settings
 
 # Map energy_level values from checkins to brain state values expected by frontend
 _ENERGY_TO_BRAIN = {"low": "foggy", "medium": "focused", "high": "wired"}
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
-def _should_refresh_hypotheses(cards: list[dict]) -> bool:
-    """Check if hypothesis cards need refreshing (none exist or oldest is >24h)."""
+def _should_refresh_hypotheses(cards: list[dict], refresh_hours: int) -> bool:
+    """Check if hypothesis cards need refreshing (none exist or newest detection is older than the window)."""
     if not cards:
         return True
     try:
-        latest = max(c["created_at"] for c in cards)
+        latest = max(c.get("last_detected_at") or c["created_at"] for c in cards)
         created = datetime.fromisoformat(str(latest).replace("Z", "+00:00"))
-        return datetime.now(timezone.utc) - created > timedelta(hours=24)
+        return datetime.now(timezone.utc) - created > timedelta(hours=refresh_hours)
     except (ValueError, KeyError):
         return True
 
 
-@router.get("/{user_id}", response_model=DashboardResponse)
+@router.get("/{user_id}", response_model=DashboardResponse, dependencies=[query_budget(25)])
 async def get_dashboard(
     user_id: str,
     current_user: str = Depends(get_current_user),
@@ -62,17 +71,26 @@ async def get_dashboard(
             brainState=_ENERGY_TO_BRAIN.get(c.get("energy_level", "medium"), "focused"),
             tasksCompleted=c["tasks_completed"],
             tasksTotal=c["tasks_total"],
+            momentumScore=c.get("momentum_score"),
         ))
 
-    # Calculate momentum
-    momentum = calculate_momentum(checkins.data)
+    # Momentum is maintained per checkin; only read it here
+    momentum = get_momentum(user_id, checkins.data)
 
-    # Fetch hypothesis cards
+    # Catch open hypotheses up on checkins recorded since their last evaluation
+    try:
+        evaluate_user(user_id, latest_checkin_date=checkins.data[-1]["checkin_date"])
+    except Exception as e:
+        logger.warning(f"Hypothesis evaluation failed: {e}")  # Non-blocking
+
+    # Fetch the user's active (capped, non-archived) hypothesis cards
     hypothesis_rows = (
         db.table("hypothesis_cards")
         .select("*")
         .eq("user_id", user_id)
+        .is_("archived_at", "null")
         .order("created_at", desc=False)
+        .limit(get_settings().hypothesis_max_active_cards)
         .execute()
     )
     hypothesis_cards = [
@@ -88,13 +106,29 @@ async def get_dashboard(
         for h in hypothesis_rows.data
     ]
 
-    # Trigger pattern detection in background if cards need refreshing
-    if _should_refresh_hypotheses(hypothesis_rows.data) and len(checkins.data) >= 7:
+    # Queue pattern detection if cards need refreshing. The dedupe key makes this
+    # single-flight: loads get the live job back, or the last one that succeeded
+    # within the refresh window; a failed job is retried on the next load.
+    # With nightly batch detection enabled, dashboard loads never start pattern work.
+    pattern_job_id = None
+    settings = get_settings()
+    refresh_hours = settings.pattern_refresh_hours
+    if (
+        not settings.pattern_batch_enabled
+        and _should_refresh_hypotheses(hypothesis_rows.data, refresh_hours)
+        and len(checkins.data) >= 7
+    ):
         try:
-            from app.agents.pattern_agent import run_pattern_detection
-            asyncio.create_task(asyncio.to_thread(run_pattern_detection, user_id))
-        except Exception:
-            pass  # Non-blocking — new cards appear on next dashboard load
+            job = job_queue.enqueue(
+                job_queue.PATTERN_DETECTION,
+                user_id,
+                dedupe_key=job_queue.pattern_dedupe_key(user_id),
+                succeeded_ttl=refresh_hours * 3600,
+            )
+            if job["status"] in ("queued", "running"):
+                pattern_job_id = job["id"]
+        except Exception as e:
+            logger.warning(f"Could not queue pattern detection: {e}")  # Non-blocking
 
     # Build agent annotations from hypothesis cards and interventions
     annotations = []
@@ -118,19 +152,26 @@ async def get_dashboard(
     for i, c in enumerate(checkins.data):
         checkin_date_to_day[c["checkin_date"]] = i + 1
 
+    # Fallback for interventions not dated on a checkin day: plan_id -> plan_date, in one query
+    fallback_plan_ids = list({
+        intv["plan_id"] for intv in interventions.data
+        if str(intv["created_at"])[:10] not in checkin_date_to_day and intv.get("plan_id")
+    })
+    plan_dates = {}
+    if fallback_plan_ids:
+        try:
+            plan_rows = db.table("daily_plans").select("id, plan_date").in_("id", fallback_plan_ids).execute()
+            plan_dates = {p["id"]: str(p["plan_date"]) for p in plan_rows.data}
+        except Exception:
+            pass
+
     for intv in interventions.data:
         # Match intervention date to checkin day number
         intv_date = str(intv["created_at"])[:10]  # Extract YYYY-MM-DD
         day_num = checkin_date_to_day.get(intv_date)
 
-        if day_num is None:
-            # Fallback: match via plan_id -> plan_date
-            try:
-                plan_row = db.table("daily_plans").select("plan_date").eq("id", intv["plan_id"]).limit(1).execute()
-                if plan_row.data:
-                    day_num = checkin_date_to_day.get(str(plan_row.data[0]["plan_date"]))
-            except Exception:
-                pass
+        if day_num is None and intv.get("plan_id") in plan_dates:
+            day_num = checkin_date_to_day.get(plan_dates[intv["plan_id"]])
 
         if day_num is not None:
             reasoning = intv.get("agent_reasoning", "") or ""
@@ -159,4 +200,48 @@ async def get_dashboard(
         hypothesisCards=hypothesis_cards,
         agentAnnotations=annotations,
         feedbackHistory=feedback_history,
+        patternJobId=pattern_job_id,
+    )
+
+
+@router.get("/{user_id}/trend", response_model=TrendResponse)
+async def get_trend(
+    user_id: str,
+    days: int = Query(90, ge=1, le=trend_service.MAX_WINDOW_DAYS),
+    end: Optional[str] = Query(None, description="Last day of the window (YYYY-MM-DD), default today"),
+    granularity: Optional[str] = Query(None, description="day | week | month (default: by window length)"),
+    points: int = Query(trend_service.DEFAULT_POINTS, ge=3, le=trend_service.MAX_POINTS),
+    current_user: str = Depends(get_current_user),
+):
+    """Mood, completion, brain-state mix and momentum over any window, rolled up and downsampled to `points`."""
+    if current_user != user_id:
+        raise HTTPException(status_code=403, detail="Can only access own dashboard")
+    if granularity is not None and granularity not in trend_service.GRANULARITIES:
+        raise HTTPException(status_code=422, detail=f"granularity must be one of {trend_service.GRANULARITIES}")
+    try:
+        end_date = datetime.strptime(end, "%Y-%m-%d").date() if end else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="end must be YYYY-MM-DD")
+
+    result = trend_service.trend(user_id, days, end_date, granularity, points)
+    return TrendResponse(
+        start=result["start"],
+        end=result["end"],
+        granularity=result["granularity"],
+        totalBuckets=result["total"],
+        points=[
+            TrendBucket(
+                date=str(b["bucket"])[:10],
+                checkins=b["checkins"],
+                moodScore=round(float(b["mood_avg"]), 2),
+                completionRate=round(float(b["completion_avg"]), 1),
+                tasksCompleted=b["tasks_completed"],
+                tasksTotal=b["tasks_total"],
+                brainStateMix={
+                    state: round(b[state] / b["checkins"], 3) for state in ("foggy", "focused", "wired")
+                },
+                momentumScore=None if b["momentum_avg"] is None else round(float(b["momentum_avg"]), 1),
+            )
+            for b in result["buckets"]
+        ],
     )
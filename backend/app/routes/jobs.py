@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Depends
+from app.models import JobStatusResponse
+from app.middleware.auth import get_current_user
+from app.services import job_queue
+
+router = APIRouter()
+
+
+def _to_response(job: dict) -> JobStatusResponse:
+    return JobStatusResponse(
+        jobId=job["id"],
+        jobType=job["job_type"],
+        status=job["status"],
+        attempts=job["attempts"],
+        maxAttempts=job["max_attempts"],
+        lastError=job.get("last_error"),
+        result=job.get("result"),
+        createdAt=str(job["created_at"]),
+        finishedAt=str(job["finished_at"]) if job.get("finished_at") else None,
+    )
+
+
+@router.get("", response_model=list[JobStatusResponse])
+async def list_jobs(
+    job_type: str | None = None,
+    user_id: str = Depends(get_current_user),
+):
+    """Recent background jobs for the authenticated user."""
+    return [_to_response(j) for j in job_queue.list_jobs(user_id, job_type)]
+
+
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(
+    job_id: str,
+    user_id: str = Depends(get_current_user),
+):
+    """Status of a single background job (queued / running / succeeded / failed)."""
+    job = job_queue.get_job(job_id)
+    if not job or job.get("user_id") != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _to_response(job)
@@ -1,75 +1,152 @@
 import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, Depends
-from app.models import PlanRequest, PlanResponse, InterventionRequest, InterventionResponse
+import time
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import ValidationError
+from app.models import PlanRequest, PlanResponse, PlanOutput, InterventionRequest, InterventionResponse
 from app.middleware.auth import get_current_user
+from app.config import get_settings
+from app.database import get_supabase_admin
+from app.services import metrics
+from app.services.agent_policy import get_policy, run_agent, http_error_for, write_lock
+from app.services.degraded import degraded_plan, degraded_intervention
+from app.services.hedging import run_hedged, HedgeFailed
+from app.services.plan_cache import get_plan_cache, planning_fingerprint, make_plan_cache_key
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-MAX_RETRIES = 3
+_plan_latency = metrics.histogram(
+    "plan_generation_seconds", "Agent time for /plan/generate by execution mode and winning path"
+)
 
 
-async def _run_with_retry(fn, *args):
-    """Run agent function with exponential backoff retry."""
-    for attempt in range(MAX_RETRIES):
-        try:
-            return await asyncio.to_thread(fn, *args)
-        except Exception as e:
-            if attempt == MAX_RETRIES - 1:
-                raise
-            wait = 2 ** attempt  # 1s, 2s, 4s
-            logger.warning(f"Agent call failed (attempt {attempt + 1}), retrying in {wait}s: {e}")
-            await asyncio.sleep(wait)
+def _is_valid_plan(result: dict) -> bool:
+    try:
+        PlanOutput.model_validate(result)
+        return True
+    except ValidationError:
+        return False
+
+
+def _activate_plan(user_id: str, plan_id: str) -> bool:
+    """Make the given plan the user's only active plan. Returns False if it no longer exists."""
+    db = get_supabase_admin()
+    db.table("daily_plans").update({"is_active": False}).eq("user_id", user_id).eq("is_active", True).neq("id", plan_id).execute()
+    result = db.table("daily_plans").update({"is_active": True}).eq("id", plan_id).eq("user_id", user_id).execute()
+    return bool(result.data)
 
 
 @router.post("/generate", response_model=PlanResponse)
 async def generate_plan(
     request: PlanRequest,
+    http_request: Request,
     user_id: str = Depends(get_current_user),
 ):
     """Generate a daily plan using the CrewAI orchestrator (hierarchical) with direct fallback."""
     from app.agents.orchestrator import run_orchestrated_planning
     from app.agents.planning_agent import run_planning
 
-    # Try orchestrated flow first, fall back to direct planning agent
+    cache = get_plan_cache()
+    cache_key = None
     try:
-        result = await _run_with_retry(
-            run_orchestrated_planning, user_id, request.brainState, request.tasks, request.timeWindowMinutes
-        )
-    except Exception:
-        logger.warning("Orchestrated planning failed, falling back to direct agent")
-        result = await _run_with_retry(
-            run_planning, user_id, request.brainState, request.tasks, request.timeWindowMinutes
+        fingerprint = planning_fingerprint(user_id)
+        cache_key = make_plan_cache_key(
+            user_id, fingerprint, request.brainState, request.tasks, request.timeWindowMinutes
         )
+    except Exception as e:
+        logger.warning(f"Plan cache key unavailable, running planner uncached: {e}")
+
+    if cache_key and request.regenerate:
+        cache.record_bypass()
+    elif cache_key:
+        cached = cache.get(cache_key)
+        if cached and (not cached.get("planId") or _activate_plan(user_id, cached["planId"])):
+            return PlanResponse(**cached)
+
+    settings = get_settings()
+    policy = get_policy("plan")
+    plan_args = (user_id, request.brainState, request.tasks, request.timeWindowMinutes)
+    # Both paths share one endpoint deadline; only the direct path may degrade
+    deadline_at = asyncio.get_running_loop().time() + policy.deadline_seconds
+    run_orchestrated = lambda: run_agent(
+        policy, run_orchestrated_planning, *plan_args,
+        user_id=user_id, request=http_request, deadline_at=deadline_at, validate=_is_valid_plan,
+    )
+    run_direct = lambda: run_agent(
+        policy, run_planning, *plan_args,
+        user_id=user_id, degraded=degraded_plan, request=http_request, deadline_at=deadline_at,
+        validate=_is_valid_plan,
+    )
+    started = time.monotonic()
+
+    if settings.plan_hedging_enabled:
+        # Orchestrated flow first; if it overruns the latency budget the direct agent races it
+        try:
+            result, path = await run_hedged(
+                "plan_generate",
+                ("orchestrated", run_orchestrated),
+                ("direct", run_direct),
+                settings.plan_hedge_budget_seconds,
+                _is_valid_plan,
+            )
+        except HedgeFailed as e:
+            raise http_error_for(e.__cause__, str(e))
+        # The losing crew may already have saved (and activated) its own plan row; it is cancelled
+        # by now, and save_daily_plan checks that under the same lock, so it cannot save after this
+        if result.get("planId"):
+            with write_lock(user_id):
+                _activate_plan(user_id, result["planId"])
+        _plan_latency.observe(time.monotonic() - started, mode="hedged", path=path)
+    else:
+        # Try orchestrated flow first, fall back to direct planning agent
+        path = "orchestrated"
+        try:
+            result = await run_orchestrated()
+        except Exception as e:
+            logger.warning(f"Orchestrated planning failed, falling back to direct agent: {e}")
+            path = "direct"
+            try:
+                result = await run_direct()
+            except Exception as e:
+                raise http_error_for(e, "Planning failed")
+        _plan_latency.observe(time.monotonic() - started, mode="sequential", path=path)
 
     if "error" in result:
         raise HTTPException(status_code=500, detail=result.get("raw", "Planning failed"))
-    return PlanResponse(
+    response = PlanResponse(
         planId=result.get("planId", ""),
         tasks=result.get("tasks", []),
         overallRationale=result.get("overallRationale", ""),
     )
+    if cache_key and not result.get("degraded"):
+        cache.put(cache_key, response.model_dump())
+    return response
 
 
 @router.post("/intervene", response_model=InterventionResponse)
 async def intervene(
     request: InterventionRequest,
+    http_request: Request,
     user_id: str = Depends(get_current_user),
 ):
     """Handle an 'I'm stuck' intervention using the CrewAI intervention agent."""
     from app.agents.intervention_agent import run_intervention
 
     try:
-        result = await _run_with_retry(
+        result = await run_agent(
+            get_policy("intervention"),
             run_intervention,
             user_id,
             request.planId,
             request.stuckTaskIndex,
             request.userMessage,
+            user_id=user_id,
+            degraded=degraded_intervention,
+            request=http_request,
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Intervention failed after retries: {str(e)}")
+        raise http_error_for(e, "Intervention failed")
 
     if "error" in result:
         raise HTTPException(status_code=500, detail=result.get("raw", "Intervention failed"))
@@ -0,0 +1,49 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import Optional
+from app.middleware.auth import require_admin
+from app.services.profiler import MODES, ProfilerBusy, get_profiler
+
+router = APIRouter()
+
+
+class ProfileRequest(BaseModel):
+    mode: str = "requests"
+    routePattern: Optional[str] = None  # glob on the request path, e.g. "/api/plan/*"
+    requests: int = 10
+    seconds: Optional[float] = None
+
+
+@router.post("/sessions", status_code=201)
+async def start_profile(body: ProfileRequest, admin_id: str = Depends(require_admin)):
+    """Arm the sampling profiler in this process for the next N matching requests or for a duration (admin only)."""
+    if body.mode not in MODES:
+        raise HTTPException(status_code=422, detail="mode must be requests or duration")
+    if body.mode == "requests" and (not body.routePattern or not 1 <= body.requests <= 1000):
+        raise HTTPException(status_code=422, detail="requests mode needs a routePattern and 1-1000 requests")
+    if body.mode == "duration" and (body.seconds is None or body.seconds <= 0):
+        raise HTTPException(status_code=422, detail="duration mode needs seconds > 0")
+    try:
+        session = get_profiler().start(body.mode, body.routePattern, body.requests, body.seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return session.to_dict()
+
+
+@router.get("/sessions/current")
+async def get_profile(admin_id: str = Depends(require_admin)):
+    """The running session, or the last finished one with its output files (admin only)."""
+    session = get_profiler().current()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session in this process")
+    return session.to_dict()
+
+
+@router.delete("/sessions/current")
+async def stop_profile(admin_id: str = Depends(require_admin)):
+    """Stop the running session now and write its flamegraph files (admin only)."""
+    session = await asyncio.to_thread(get_profiler().stop)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session running")
+    return session.to_dict()
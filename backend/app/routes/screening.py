@@ -1,32 +1,20 @@
-import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, Depends
-from app.models import ScreeningRequest, ScreeningResponse
+from fastapi import APIRouter, HTTPException, Depends, Request
+from app.models import ScreeningRequest, ScreeningResponse, ScreeningImportResponse
 from app.database import get_supabase_admin
-from app.middleware.auth import get_current_user
+from app.middleware.auth import get_current_user, require_admin
+from app.services.agent_policy import get_policy, run_agent, http_error_for
+from app.services.degraded import degraded_screening
+from app.services.screening_import import import_stream
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-MAX_RETRIES = 3
-
-
-async def _run_with_retry(fn, *args):
-    """Run agent function with exponential backoff retry."""
-    for attempt in range(MAX_RETRIES):
-        try:
-            return await asyncio.to_thread(fn, *args)
-        except Exception as e:
-            if attempt == MAX_RETRIES - 1:
-                raise
-            wait = 2 ** attempt
-            logger.warning(f"Agent call failed (attempt {attempt + 1}), retrying in {wait}s: {e}")
-            await asyncio.sleep(wait)
-
 
 @router.post("/evaluate", response_model=ScreeningResponse)
 async def evaluate_screening(
     request: ScreeningRequest,
+    http_request: Request,
     user_id: str = Depends(get_current_user),
 ):
     """Run ASRS screening through the CrewAI screening agent."""
@@ -42,14 +30,22 @@ async def evaluate_screening(
             "score": answer.score,
         }).execute()
 
-    # Run the screening crew with retry
+    # Run the screening crew under the shared agent policy (deadline, retry, breaker)
     from app.agents.screening_agent import run_screening
     answers_data = [{"questionIndex": a.questionIndex, "questionText": a.questionText, "score": a.score} for a in request.answers]
 
     try:
-        result = await _run_with_retry(run_screening, user_id, answers_data)
+        result = await run_agent(
+            get_policy("screening"),
+            run_screening,
+            user_id,
+            answers_data,
+            user_id=user_id,
+            degraded=degraded_screening,
+            request=http_request,
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Screening failed after retries: {str(e)}")
+        raise http_error_for(e, "Screening failed")
 
     if "error" in result:
         raise HTTPException(status_code=500, detail=result.get("raw", "Screening failed"))
@@ -63,3 +59,26 @@ async def evaluate_screening(
         asrsTotalScore=result.get("asrsTotalScore", total),
         isPositiveScreen=result.get("isPositiveScreen", total >= 14),
     )
+
+
+_IMPORT_FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+
+@router.post("/import", response_model=ScreeningImportResponse)
+async def import_screenings(
+    http_request: Request,
+    admin_id: str = Depends(require_admin),
+):
+    """Bulk-import existing ASRS-6 responses (CSV or NDJSON body, streamed).
+
+    Each record needs user_id (an existing user) and q1..q6 (0-4 or the answer
+    label), optionally answered_at. Profiles are scored deterministically right
+    away; their narratives are written by queued screening_narratives jobs.
+    """
+    content_type = http_request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = _IMPORT_FORMATS.get(content_type)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be one of {sorted(_IMPORT_FORMATS)}")
+    summary = await import_stream(http_request.stream(), fmt)
+    logger.info(f"Admin {admin_id} imported {summary['imported']} screenings ({summary['importId']})")
+    return ScreeningImportResponse(**summary)
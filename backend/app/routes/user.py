@@ -1,12 +1,13 @@
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException
 from app.middleware.auth import get_current_user
+from app.middleware.query_stats import query_budget
 from app.database import get_supabase_admin
 
 router = APIRouter()
 
 
-@router.delete("/{user_id}")
+@router.delete("/{user_id}", dependencies=[query_budget(12)])
 async def delete_user_data(
     user_id: str,
     current_user: str = Depends(get_current_user),
@@ -19,6 +20,7 @@ async def delete_user_data(
 
     # Delete in dependency order (children first)
     tables_with_user_id = [
+        "agent_runs",
         "analytics_events",
         "interventions",
         "hypothesis_cards",
@@ -43,7 +45,7 @@ async def delete_user_data(
     return {"status": "deleted", "userId": user_id}
 
 
-@router.get("/{user_id}/export")
+@router.get("/{user_id}/export", dependencies=[query_budget(10)])
 async def export_user_data(
     user_id: str,
     current_user: str = Depends(get_current_user),
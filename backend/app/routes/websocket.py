@@ -1,23 +1,29 @@
 import asyncio
+import json
 import logging
-from collections import defaultdict
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import threading
+from typing import AsyncIterator
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.database import get_supabase_anon
 from crewai.events.event_bus import crewai_event_bus
 from crewai.events.event_types import (
     AgentExecutionStartedEvent,
     AgentExecutionCompletedEvent,
+    AgentExecutionErrorEvent,
     TaskStartedEvent,
     TaskCompletedEvent,
+    TaskFailedEvent,
     ToolUsageStartedEvent,
+    LLMStreamChunkEvent,
 )
+from app.services.agent_executor import Priority, get_agent_executor
+from app.services.progress import RunContext, Subscription, current_run, get_progress_hub
+from app.services.stream_parser import IncrementalTaskParser
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Global registry of active WebSocket queues per user
-_active_connections: dict[str, set[asyncio.Queue]] = defaultdict(set)
-
 # Progress message mapping by agent role
 PROGRESS_MESSAGES = {
     "Executive Function Planning Strategist": {
@@ -47,17 +53,77 @@ PROGRESS_MESSAGES = {
     },
 }
 
+# Agents whose streamed final answer carries a task list worth forwarding
+STREAMED_TASK_AGENTS = {
+    "Executive Function Planning Strategist": "plan",
+    "ADHD Crisis Response & Plan Restructuring Specialist": "intervention",
+}
+
+# One incremental parser per running crew task, keyed by CrewAI task id
+_stream_parsers: dict[str, IncrementalTaskParser] = {}
+_stream_parsers_lock = threading.Lock()
+
+# Crew task id -> originating run, for events emitted outside the run's context
+_runs_by_task: dict[str, RunContext] = {}
+_runs_lock = threading.Lock()
+
 _handlers_registered = False
 
+HEARTBEAT_SECONDS = 120
+# Proxies tend to close idle HTTP responses sooner than websockets
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000
+
+
+def _task_id(event) -> str | None:
+    task_id = getattr(event, "task_id", None)
+    if not task_id:
+        task = getattr(event, "task", None) or getattr(event, "from_task", None)
+        task_id = getattr(task, "id", None)
+    return str(task_id) if task_id else None
+
+
+def _stream_key(event) -> str | None:
+    """Identify the crew task an LLM/agent event belongs to."""
+    return _task_id(event) or getattr(event, "agent_role", None)
+
+
+def _drop_parser(event):
+    """Forget a crew task's parser (and its buffered LLM text) once the agent is done or failed."""
+    with _stream_parsers_lock:
+        _stream_parsers.pop(_stream_key(event), None)
+
+
+def _run_for(event) -> RunContext | None:
+    """The run an event belongs to: from the handler's context, else via its crew task id."""
+    key = _task_id(event)  # task ids are unique per run; agent roles are not
+    run = current_run()
+    with _runs_lock:
+        if run is not None:
+            if key:
+                _runs_by_task[key] = run
+        else:
+            run = _runs_by_task.get(key)
+    return run
 
-def _broadcast(message: dict):
-    """Broadcast a message to all active WebSocket connections."""
-    for queues in _active_connections.values():
-        for q in queues:
-            try:
-                q.put_nowait(message)
-            except asyncio.QueueFull:
-                pass
+
+def _send(event, message: dict):
+    """Route a progress message to the user whose run emitted the event (any thread)."""
+    run = _run_for(event)
+    if run is None:
+        return  # Unattributed events are dropped rather than shown to other users
+    get_progress_hub().publish(run.user_id, {**message, "runId": run.run_id})
+
+
+def _publish_queue_position(user_id: str, position: int, priority: Priority):
+    """Agent executor listener (runs on the event loop): tell a user where their run is queued."""
+    if priority == Priority.BACKGROUND:
+        return  # Background jobs are invisible to the user
+    if position == 0:
+        message = "Your agents are starting..."
+    else:
+        message = f"Agents are busy — you're #{position} in line..."
+    get_progress_hub().publish(user_id, {"type": "queue_position", "position": position, "message": message})
 
 
 def _register_global_handlers():
@@ -67,19 +133,49 @@ def _register_global_handlers():
         return
     _handlers_registered = True
 
+    get_agent_executor().add_position_listener(_publish_queue_position)
+
     @crewai_event_bus.on(AgentExecutionStartedEvent)
     def on_agent_started(source, event):
         role = getattr(event, "agent_role", None) or "Agent"
         messages = PROGRESS_MESSAGES.get(role, {})
         msg = messages.get("start", f"{role} is working...")
-        _broadcast({"type": "agent_started", "agent": role, "message": msg})
+        _send(event, {"type": "agent_started", "agent": role, "message": msg})
 
     @crewai_event_bus.on(AgentExecutionCompletedEvent)
     def on_agent_completed(source, event):
         role = getattr(event, "agent_role", None) or "Agent"
         messages = PROGRESS_MESSAGES.get(role, {})
         msg = messages.get("complete", "Processing complete")
-        _broadcast({"type": "agent_completed", "agent": role, "message": msg})
+        _send(event, {"type": "agent_completed", "agent": role, "message": msg})
+        _drop_parser(event)
+
+    @crewai_event_bus.on(AgentExecutionErrorEvent)
+    def on_agent_error(source, event):
+        _drop_parser(event)
+
+    @crewai_event_bus.on(LLMStreamChunkEvent)
+    def on_llm_stream_chunk(source, event):
+        role = getattr(event, "agent_role", None)
+        kind = STREAMED_TASK_AGENTS.get(role)
+        if kind is None:
+            return
+        key = _stream_key(event)
+        with _stream_parsers_lock:
+            parser = _stream_parsers.setdefault(key, IncrementalTaskParser())
+            # Reset on a new call here, not in an LLMCallStarted handler: those run on CrewAI's
+            # pool and can arrive after this call's first chunks were already parsed
+            if event.call_id != parser.message_id:
+                parser.start_message(event.call_id)
+            tasks = parser.feed(getattr(event, "chunk", "") or "")
+        for task in tasks:
+            _send(event, {
+                "type": "task_streamed",
+                "kind": kind,
+                "agent": role,
+                "task": task,
+                "message": f"Scheduled: {task['title']}",
+            })
 
     @crewai_event_bus.on(ToolUsageStartedEvent)
     def on_tool_started(source, event):
@@ -94,31 +190,81 @@ def _register_global_handlers():
             "save_profile_to_db": "Saving your profile...",
         }
         msg = tool_messages.get(tool_name, f"Using {tool_name}...")
-        _broadcast({"type": "tool_started", "tool": tool_name, "message": msg})
+        _send(event, {"type": "tool_started", "tool": tool_name, "message": msg})
 
     @crewai_event_bus.on(TaskCompletedEvent)
     def on_task_completed(source, event):
-        _broadcast({"type": "task_completed", "message": "Processing complete"})
+        _send(event, {"type": "task_completed", "message": "Processing complete"})
+        with _runs_lock:
+            _runs_by_task.pop(_task_id(event), None)
 
+    @crewai_event_bus.on(TaskFailedEvent)
+    def on_task_failed(source, event):
+        _drop_parser(event)
+        with _runs_lock:
+            _runs_by_task.pop(_task_id(event), None)
+
+
+def _last_seq(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
 
-@router.websocket("/ws/agent-progress/{user_id}")
-async def agent_progress(websocket: WebSocket, user_id: str):
-    """WebSocket endpoint for real-time agent progress updates.
-    Requires ?token=<JWT> query parameter for authentication."""
-    # Validate JWT from query parameter before accepting
-    token = websocket.query_params.get("token")
-    if not token:
-        await websocket.close(code=4001, reason="Missing token query parameter")
-        return
 
+def frame_payload(messages: list[dict]) -> dict:
+    """One websocket frame: a lone message as-is, several as a batch."""
+    return messages[0] if len(messages) == 1 else {"type": "batch", "events": messages}
+
+
+def _authenticate(token: str | None, user_id: str) -> tuple[int, str] | None:
+    """None if the JWT belongs to user_id, else (close code, reason)."""
+    if not token:
+        return 4001, "Missing token query parameter"
     try:
         supabase = get_supabase_anon()
         response = supabase.auth.get_user(token)
         if response.user is None or str(response.user.id) != user_id:
-            await websocket.close(code=4003, reason="Invalid token or user mismatch")
-            return
+            return 4003, "Invalid token or user mismatch"
     except Exception:
-        await websocket.close(code=4003, reason="Authentication failed")
+        return 4003, "Authentication failed"
+    return None
+
+
+async def pump_websocket(websocket: WebSocket, subscription: Subscription):
+    """Send the subscription's frames (and heartbeats) until the socket closes."""
+    while True:
+        try:
+            messages = await subscription.next_frame(timeout=HEARTBEAT_SECONDS)
+            if messages:
+                await websocket.send_json(frame_payload(messages))
+        except asyncio.TimeoutError:
+            # Send heartbeat to keep connection alive
+            await websocket.send_json({"type": "heartbeat"})
+
+
+async def sse_events(subscription: Subscription) -> AsyncIterator[str]:
+    """The subscription's frames as Server-Sent Events; the event id is the frame's last seq."""
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    while True:
+        try:
+            messages = await subscription.next_frame(timeout=SSE_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield 'data: {"type":"heartbeat"}\n\n'
+            continue
+        if messages:
+            data = json.dumps(frame_payload(messages), separators=(",", ":"), default=str)
+            yield f"id: {messages[-1]['seq']}\ndata: {data}\n\n"
+
+
+@router.websocket("/ws/agent-progress/{user_id}")
+async def agent_progress(websocket: WebSocket, user_id: str):
+    """WebSocket endpoint for real-time agent progress updates.
+    Requires ?token=<JWT> query parameter for authentication; ?lastSeq=<id> resumes after a reconnect."""
+    # Validate JWT from query parameter before accepting
+    error = _authenticate(websocket.query_params.get("token"), user_id)
+    if error is not None:
+        await websocket.close(code=error[0], reason=error[1])
         return
 
     await websocket.accept()
@@ -126,22 +272,43 @@ async def agent_progress(websocket: WebSocket, user_id: str):
     # Ensure global handlers are registered
     _register_global_handlers()
 
-    queue: asyncio.Queue = asyncio.Queue(maxsize=50)
-    _active_connections[user_id].add(queue)
+    hub = get_progress_hub()
+    subscription = hub.subscribe(user_id, _last_seq(websocket.query_params.get("lastSeq")))
 
     try:
-        while True:
-            try:
-                message = await asyncio.wait_for(queue.get(), timeout=120)
-                await websocket.send_json(message)
-            except asyncio.TimeoutError:
-                # Send heartbeat to keep connection alive
-                await websocket.send_json({"type": "heartbeat"})
+        await pump_websocket(websocket, subscription)
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for user {user_id}")
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
     finally:
-        _active_connections[user_id].discard(queue)
-        if not _active_connections[user_id]:
-            del _active_connections[user_id]
+        hub.unsubscribe(subscription)
+
+
+@router.get("/sse/agent-progress/{user_id}")
+async def agent_progress_sse(request: Request, user_id: str):
+    """Server-Sent Events alternative to the progress websocket (same messages and heartbeats).
+    Requires ?token=<JWT>; resumes from the Last-Event-ID header (or ?lastSeq=<id>)."""
+    error = _authenticate(request.query_params.get("token"), user_id)
+    if error is not None:
+        return JSONResponse({"detail": error[1]}, status_code=401 if error[0] == 4001 else 403)
+
+    _register_global_handlers()
+
+    hub = get_progress_hub()
+    last_seq = _last_seq(request.headers.get("last-event-id") or request.query_params.get("lastSeq"))
+
+    async def stream():
+        # Subscribe inside the body so a client gone before the first byte never leaves a subscription behind
+        subscription = hub.subscribe(user_id, last_seq)
+        try:
+            async for event in sse_events(subscription):
+                yield event
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
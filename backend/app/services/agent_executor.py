@@ -0,0 +1,223 @@
+"""Dedicated, bounded thread pool for crew runs.
+
+Crew runs are blocking and slow, so they get their own worker threads instead of
+the default asyncio executor. Jobs wait in a bounded priority queue
+(intervention > planning > screening > background) and each user may only run a
+limited number of crews at once. When the queue is full, submit() raises
+AgentQueueFull so the route can answer 429 instead of piling up work.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+from enum import IntEnum
+from typing import Callable
+from app.config import get_settings
+from app.services import metrics, progress, run_ledger, tracing
+
+logger = logging.getLogger(__name__)
+
+_jobs = metrics.counter("agent_executor_jobs_total", "Agent executor jobs by priority and outcome")
+_queue_wait = metrics.histogram("agent_executor_queue_wait_seconds", "Time jobs spent queued before a worker picked them up")
+
+
+class Priority(IntEnum):
+    INTERVENTION = 0
+    PLANNING = 1
+    SCREENING = 2
+    BACKGROUND = 3
+
+
+class AgentQueueFull(Exception):
+    """Admission control rejected the job; callers should answer 429."""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = (
+        "priority", "seq", "user_id", "fn", "args", "ctx", "future", "loop", "enqueued_at", "cancelled", "position",
+    )
+
+    def __init__(self, priority, seq, user_id, fn, args, ctx, future, loop, enqueued_at):
+        self.priority = priority
+        self.seq = seq
+        self.user_id = user_id
+        self.fn = fn
+        self.args = args
+        self.ctx = ctx
+        self.future = future
+        self.loop = loop
+        self.enqueued_at = enqueued_at
+        self.cancelled = False
+        self.position = None  # last queue position reported to listeners
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# Called on the event loop with (user_id, position, priority); position 0 means "starting now"
+PositionListener = Callable[[str, int, Priority], None]
+
+
+class AgentExecutor:
+    def __init__(self, pool_size: int, max_queue: int, per_user_concurrency: int, per_user_queue: int):
+        self.pool_size = pool_size
+        self.max_queue = max_queue
+        self.per_user_concurrency = per_user_concurrency
+        self.per_user_queue = per_user_queue
+        self._heap: list[_Job] = []
+        self._running: dict[str, int] = {}
+        self._queued: dict[str, int] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._listeners: list[PositionListener] = []
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"agent-worker-{i}", daemon=True)
+            for i in range(pool_size)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def add_position_listener(self, listener: PositionListener):
+        self._listeners.append(listener)
+
+    def submit(self, fn: Callable, *args, user_id: str, priority: Priority, route: str = "") -> asyncio.Future:
+        """Queue fn(*args) and return an awaitable for its result. Must be called on the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                _jobs.inc(priority=priority.name.lower(), outcome="rejected")
+                raise AgentQueueFull("Agent queue is full, please retry shortly")
+            if self._queued.get(user_id, 0) >= self.per_user_queue:
+                _jobs.inc(priority=priority.name.lower(), outcome="rejected")
+                raise AgentQueueFull("Too many agent requests in flight for this user")
+            ctx = contextvars.copy_context()
+            # The crew (and the CrewAI event handlers it triggers) see which user this run belongs to
+            ctx.run(progress.enter_run, user_id, route)
+            job = _Job(priority, next(self._seq), user_id, fn, args, ctx, future, loop, loop.time())
+            heapq.heappush(self._heap, job)
+            self._queued[user_id] = self._queued.get(user_id, 0) + 1
+            _jobs.inc(priority=priority.name.lower(), outcome="queued")
+            self._cond.notify()
+            positions = self._positions_locked()
+
+        future.add_done_callback(lambda f: self._on_future_done(job, f))
+        self._publish_positions(positions)
+        return future
+
+    def _on_future_done(self, job: _Job, future: asyncio.Future):
+        # The awaiting coroutine was cancelled while the job was still queued: drop it
+        if future.cancelled():
+            job.cancelled = True
+
+    def _next_runnable_locked(self) -> _Job | None:
+        """Pop the highest-priority job whose user is below the concurrency limit."""
+        skipped = []
+        job = None
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            if candidate.cancelled:
+                self._queued[candidate.user_id] -= 1
+                continue
+            if self._running.get(candidate.user_id, 0) < self.per_user_concurrency:
+                job = candidate
+                break
+            skipped.append(candidate)
+        for s in skipped:
+            heapq.heappush(self._heap, s)
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_runnable_locked()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_runnable_locked()
+                self._queued[job.user_id] -= 1
+                self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+                positions = self._positions_locked()
+                positions.append((job.user_id, 0, job.priority))
+
+            job.loop.call_soon_threadsafe(self._publish_positions, positions)
+            wait = job.loop.time() - job.enqueued_at
+            _queue_wait.observe(wait, priority=job.priority.name.lower())
+            job.ctx.run(run_ledger.note_queue_wait, wait)
+            try:
+                result = job.ctx.run(
+                    tracing.run_in_span, "agent.execute", job.fn, *job.args,
+                    **{"attune.priority": job.priority.name.lower(), "attune.queue_wait_s": wait},
+                )
+                job.loop.call_soon_threadsafe(self._resolve, job.future, result, None)
+            except BaseException as e:
+                job.loop.call_soon_threadsafe(self._resolve, job.future, None, e)
+            finally:
+                with self._cond:
+                    self._running[job.user_id] -= 1
+                    if not self._running[job.user_id]:
+                        del self._running[job.user_id]
+                    if not self._queued.get(job.user_id):
+                        self._queued.pop(job.user_id, None)
+                    # A per-user slot freed up; a skipped job may now be runnable
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result, error: BaseException | None):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _positions_locked(self) -> list[tuple[str, int, Priority]]:
+        """Queued jobs whose 1-based position (in dispatch order) changed since last reported."""
+        ordered = sorted(j for j in self._heap if not j.cancelled)
+        changed = []
+        for i, job in enumerate(ordered, start=1):
+            if job.position != i:
+                job.position = i
+                changed.append((job.user_id, i, job.priority))
+        return changed
+
+    def _publish_positions(self, positions: list[tuple[str, int, Priority]]):
+        for listener in self._listeners:
+            for user_id, position, priority in positions:
+                try:
+                    listener(user_id, position, priority)
+                except Exception as e:
+                    logger.debug(f"Queue position listener failed: {e}")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "poolSize": self.pool_size,
+                "queued": len(self._heap),
+                "running": sum(self._running.values()),
+                "maxQueue": self.max_queue,
+            }
+
+
+_executor: AgentExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_agent_executor() -> AgentExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                settings = get_settings()
+                _executor = AgentExecutor(
+                    pool_size=settings.agent_pool_size,
+                    max_queue=settings.agent_queue_max,
+                    per_user_concurrency=settings.agent_per_user_concurrency,
+                    per_user_queue=settings.agent_per_user_queue_max,
+                )
+    return _executor
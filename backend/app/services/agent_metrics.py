@@ -0,0 +1,187 @@
+"""CrewAI event listeners that feed the metrics registry.
+
+Crew kickoffs, agent executions, LLM calls and tool invocations become
+latency histograms, token counters and tool/error counts, all labeled by agent role
+and route (the execution policy the run was started under: plan,
+intervention, screening, pattern). Durations come from the events' own
+timestamps, because CrewAI runs sync handlers on its own thread pool,
+slightly after the event was emitted.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from crewai.events.event_bus import crewai_event_bus
+from crewai.events.event_types import (
+    AgentExecutionCompletedEvent,
+    AgentExecutionErrorEvent,
+    AgentExecutionStartedEvent,
+    CrewKickoffCompletedEvent,
+    CrewKickoffFailedEvent,
+    CrewKickoffStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+    LLMCallStartedEvent,
+    ToolUsageErrorEvent,
+    ToolUsageFinishedEvent,
+)
+from app.services import metrics
+from app.services.progress import current_run
+
+logger = logging.getLogger(__name__)
+
+_crew_seconds = metrics.histogram("crew_kickoff_seconds", "Crew kickoff to result by route and outcome")
+_agent_seconds = metrics.histogram("agent_step_seconds", "Agent execution time by agent role, route and outcome")
+_llm_seconds = metrics.histogram("llm_call_seconds", "LLM call latency by agent role, route, model and outcome")
+_llm_tokens = metrics.counter("llm_tokens_total", "LLM tokens by agent role, route, model and kind")
+_tool_seconds = metrics.histogram(
+    "tool_call_seconds", "Tool run time by tool, agent role and route",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+_tool_calls = metrics.counter("tool_calls_total", "Tool invocations by tool, agent role, route and outcome")
+_errors = metrics.counter("agent_errors_total", "Crew, agent, LLM and tool errors by kind, agent role and route")
+
+MAX_OPEN_TIMERS = 10_000  # start events whose end never arrives are evicted oldest-first
+TASK_LABEL_CHARS = 120  # unnamed tasks are labeled by their (long) description
+
+_started: OrderedDict[tuple, float] = OrderedDict()
+_started_lock = threading.Lock()
+_registered = False
+
+
+def _start(key: tuple, event):
+    with _started_lock:
+        _started[key] = event.timestamp.timestamp()
+        if len(_started) > MAX_OPEN_TIMERS:
+            _started.popitem(last=False)
+
+
+def _elapsed(key: tuple, event) -> float | None:
+    with _started_lock:
+        started = _started.pop(key, None)
+    return None if started is None else max(0.0, event.timestamp.timestamp() - started)
+
+
+def _route() -> str:
+    run = current_run()
+    return (run.route or "unknown") if run is not None else "unattributed"
+
+
+def agent_role(event) -> str | None:
+    """Role of the agent behind an event; agent execution events only carry the agent object."""
+    agent = getattr(event, "agent", None)
+    return getattr(agent, "role", None) or getattr(event, "agent_role", None)
+
+
+def task_label(event) -> str | None:
+    """Name (or the start of the description) of the task behind an agent execution event."""
+    task = getattr(event, "task", None)
+    if task is None:
+        return getattr(event, "task_name", None)
+    label = getattr(task, "name", None) or getattr(task, "description", None)
+    return label[:TASK_LABEL_CHARS] if label else None
+
+
+def _agent(event) -> str:
+    return agent_role(event) or "unknown"
+
+
+def _model(event) -> str:
+    return str(getattr(event, "model", None) or "unknown")
+
+
+def token_usage(usage) -> dict[str, int]:
+    """Prompt/completion token counts from an OpenAI- or Anthropic-style usage object."""
+    if usage is None:
+        return {}
+    if not isinstance(usage, dict):
+        usage = getattr(usage, "model_dump", lambda: vars(usage))()
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion = usage.get("completion_tokens", usage.get("output_tokens"))
+    return {k: int(v) for k, v in (("prompt", prompt), ("completion", completion)) if v}
+
+
+def _crew_key(event) -> tuple:
+    run = current_run()
+    return ("crew", run.run_id if run else None, getattr(event, "crew_name", None))
+
+
+def _agent_key(event) -> tuple:
+    """Start events key on their own id; end events on the start they close."""
+    return ("agent", event.started_event_id or event.event_id)
+
+
+def register_agent_metrics():
+    """Subscribe the metric listeners to the CrewAI event bus (once per process)."""
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    @crewai_event_bus.on(CrewKickoffStartedEvent)
+    def on_crew_started(source, event):
+        _start(_crew_key(event), event)
+
+    @crewai_event_bus.on(CrewKickoffCompletedEvent)
+    def on_crew_completed(source, event):
+        elapsed = _elapsed(_crew_key(event), event)
+        if elapsed is not None:
+            _crew_seconds.observe(elapsed, route=_route(), outcome="ok")
+
+    @crewai_event_bus.on(CrewKickoffFailedEvent)
+    def on_crew_failed(source, event):
+        elapsed = _elapsed(_crew_key(event), event)
+        if elapsed is not None:
+            _crew_seconds.observe(elapsed, route=_route(), outcome="error")
+        _errors.inc(kind="crew", agent="crew", route=_route())
+
+    @crewai_event_bus.on(AgentExecutionStartedEvent)
+    def on_agent_started(source, event):
+        _start(_agent_key(event), event)
+
+    @crewai_event_bus.on(AgentExecutionCompletedEvent)
+    def on_agent_completed(source, event):
+        elapsed = _elapsed(_agent_key(event), event)
+        if elapsed is not None:
+            _agent_seconds.observe(elapsed, agent=_agent(event), route=_route(), outcome="ok")
+
+    @crewai_event_bus.on(AgentExecutionErrorEvent)
+    def on_agent_error(source, event):
+        elapsed = _elapsed(_agent_key(event), event)
+        if elapsed is not None:
+            _agent_seconds.observe(elapsed, agent=_agent(event), route=_route(), outcome="error")
+        _errors.inc(kind="agent", agent=_agent(event), route=_route())
+
+    @crewai_event_bus.on(LLMCallStartedEvent)
+    def on_llm_started(source, event):
+        _start(("llm", event.call_id), event)
+
+    @crewai_event_bus.on(LLMCallCompletedEvent)
+    def on_llm_completed(source, event):
+        agent, route, model = _agent(event), _route(), _model(event)
+        elapsed = _elapsed(("llm", event.call_id), event)
+        if elapsed is not None:
+            _llm_seconds.observe(elapsed, agent=agent, route=route, model=model, outcome="ok")
+        for kind, tokens in token_usage(event.usage).items():
+            _llm_tokens.inc(tokens, agent=agent, route=route, model=model, kind=kind)
+
+    @crewai_event_bus.on(LLMCallFailedEvent)
+    def on_llm_failed(source, event):
+        agent, route, model = _agent(event), _route(), _model(event)
+        elapsed = _elapsed(("llm", event.call_id), event)
+        if elapsed is not None:
+            _llm_seconds.observe(elapsed, agent=agent, route=route, model=model, outcome="error")
+        _errors.inc(kind="llm", agent=agent, route=route)
+
+    @crewai_event_bus.on(ToolUsageFinishedEvent)
+    def on_tool_finished(source, event):
+        labels = {"tool": event.tool_name, "agent": _agent(event), "route": _route()}
+        outcome = "cached" if event.from_cache else "error" if event.failure else "ok"
+        _tool_calls.inc(outcome=outcome, **labels)
+        if not event.from_cache:
+            _tool_seconds.observe(max(0.0, (event.finished_at - event.started_at).total_seconds()), **labels)
+
+    @crewai_event_bus.on(ToolUsageErrorEvent)
+    def on_tool_error(source, event):
+        labels = {"tool": event.tool_name, "agent": _agent(event), "route": _route()}
+        _tool_calls.inc(outcome="error", **labels)
+        _errors.inc(kind="tool", agent=labels["agent"], route=labels["route"])
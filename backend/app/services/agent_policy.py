@@ -0,0 +1,355 @@
+"""Shared execution policy for CrewAI agent runs.
+
+Every route that kicks off a crew goes through run_agent(), which provides:
+  - a per-endpoint overall deadline (retries never run past it)
+  - retry with jittered exponential backoff, only for retryable (provider/transport) errors
+  - cooperative cancellation: when the caller is cancelled, times out or the client
+    disconnects, the crew thread stops at its next agent step and refuses further DB writes
+  - a process-wide circuit breaker that short-circuits to a degraded fast path
+    while the LLM provider is failing
+  - one agent_runs ledger row per call (outcome, attempts, fallback, validity, timings)
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Callable
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+from app.config import get_settings
+from app.services import metrics, run_ledger, tracing
+from app.services.agent_executor import AgentQueueFull, Priority, get_agent_executor
+
+logger = logging.getLogger(__name__)
+
+_attempts = metrics.counter("agent_attempts_total", "Agent run attempts by policy and outcome")
+_degraded = metrics.counter("agent_degraded_total", "Requests served by a degraded fast path")
+_breaker_transitions = metrics.counter("agent_breaker_transitions_total", "Circuit breaker state changes")
+
+
+class AgentRunCancelled(Exception):
+    """Raised inside the crew thread once its run has been cancelled."""
+
+
+class AgentDeadlineExceeded(Exception):
+    """The endpoint's overall deadline elapsed before an attempt succeeded."""
+
+
+class CircuitOpenError(Exception):
+    """The LLM provider circuit is open and no degraded path was given."""
+
+
+class _AttemptDeadline(Exception):
+    """An attempt ran out of the policy's remaining time (not a TimeoutError raised by the crew)."""
+
+
+class ExecutionPolicy(BaseModel):
+    name: str
+    deadline_seconds: float
+    priority: Priority
+    max_attempts: int = 3
+    base_backoff_seconds: float = 1.0
+    max_backoff_seconds: float = 8.0
+
+
+def get_policy(name: str) -> ExecutionPolicy:
+    settings = get_settings()
+    policies = {
+        "plan": (settings.plan_deadline_seconds, Priority.PLANNING),
+        "intervention": (settings.intervention_deadline_seconds, Priority.INTERVENTION),
+        "screening": (settings.screening_deadline_seconds, Priority.SCREENING),
+        "pattern": (settings.pattern_deadline_seconds, Priority.BACKGROUND),
+    }
+    deadline, priority = policies[name]
+    return ExecutionPolicy(name=name, deadline_seconds=deadline, priority=priority)
+
+
+def http_error_for(error: BaseException | None, detail: str) -> HTTPException:
+    """Map agent policy failures onto HTTP errors (429 backpressure, 503 breaker, 504 deadline)."""
+    if isinstance(error, AgentQueueFull):
+        return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(error))
+    if isinstance(error, AgentDeadlineExceeded):
+        return HTTPException(status_code=504, detail=str(error))
+    return HTTPException(status_code=500, detail=f"{detail}: {error}" if error else detail)
+
+
+# ── Cancellation ──
+# The agent executor copies the submitting context, so the crew thread sees the
+# token set by run_agent for its own attempt.
+_cancel_token: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar(
+    "agent_cancel_token", default=None
+)
+
+
+def raise_if_cancelled(*_args, **_kwargs):
+    """Crew step_callback / tool guard: abort the current run if it was cancelled."""
+    token = _cancel_token.get()
+    if token is not None and token.is_set():
+        raise AgentRunCancelled("Agent run cancelled")
+
+
+# Striped per-user locks: a guarded write checks the token while holding its user's
+# lock, so once a caller has cancelled a run and taken the lock, that run cannot write
+_WRITE_LOCKS = tuple(threading.Lock() for _ in range(64))
+
+
+def write_lock(user_id: str) -> threading.Lock:
+    return _WRITE_LOCKS[hash(user_id) % len(_WRITE_LOCKS)]
+
+
+# ── Error classification ──
+_RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+    "OverloadedError",
+    "Timeout",
+}
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Provider/transport failures are retryable; bad input, auth and parse errors are not."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (TimeoutError, ConnectionError)):
+            return True
+        if any(cls.__name__ in _RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__):
+            return True
+        if getattr(exc, "status_code", None) in _RETRYABLE_STATUS:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+# ── Circuit breaker ──
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed → open (after threshold) → half-open (one probe)."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"LLM circuit breaker {self.state} -> {state}")
+            _breaker_transitions.inc(to=state)
+            self.state = state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._transition("half_open")
+                self._probe_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a half-open probe slot without judging the provider (cancelled/non-provider error)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._transition("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition("open")
+
+
+_breaker: CircuitBreaker | None = None
+
+
+def get_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        settings = get_settings()
+        _breaker = CircuitBreaker(settings.llm_breaker_failure_threshold, settings.llm_breaker_reset_seconds)
+    return _breaker
+
+
+# ── Runner ──
+async def _watch_disconnect(request: Request, task: asyncio.Task):
+    while not task.done():
+        if await request.is_disconnected():
+            logger.info("Client disconnected, cancelling agent run")
+            task.cancel()
+            return
+        await asyncio.sleep(1)
+
+
+# Ledger status for exceptions that end a run
+_FAILURE_STATUS = {
+    AgentQueueFull: "rejected",
+    CircuitOpenError: "circuit_open",
+    AgentDeadlineExceeded: "deadline",
+}
+
+
+async def _attempt(policy: ExecutionPolicy, fn: Callable, args: tuple, user_id: str, token: threading.Event, timeout: float):
+    reset = _cancel_token.set(token)
+    try:
+        future = get_agent_executor().submit(
+            fn, *args, user_id=user_id, priority=policy.priority, route=policy.name
+        )
+    finally:
+        _cancel_token.reset(reset)
+    # Timeout/cancellation cancels the future: a still-queued job is dropped, a running one sees the token
+    try:
+        return await asyncio.wait_for(future, timeout=timeout)
+    except asyncio.TimeoutError:
+        # asyncio.TimeoutError is the builtin TimeoutError: only a future wait_for cancelled is our deadline;
+        # a provider timeout raised inside the crew completes it with that error and stays retryable
+        if future.cancelled():
+            raise _AttemptDeadline() from None
+        raise
+
+
+async def _serve_degraded(policy: ExecutionPolicy, degraded: Callable, args: tuple, reason: str) -> dict:
+    logger.warning(f"Serving degraded {policy.name} result ({reason})")
+    _degraded.inc(policy=policy.name, reason=reason)
+    record = run_ledger.current_record()
+    if record is not None:
+        record.fallback = reason
+    with tracing.span(f"agent.degraded {policy.name}", **{"attune.degraded_reason": reason}):
+        result = await asyncio.to_thread(degraded, *args)
+    result["degraded"] = True
+    return result
+
+
+async def run_agent(
+    policy: ExecutionPolicy,
+    fn: Callable[..., dict],
+    *args,
+    user_id: str,
+    degraded: Callable[..., dict] | None = None,
+    request: Request | None = None,
+    deadline_at: float | None = None,
+    validate: Callable[[dict], bool] | None = None,
+) -> dict:
+    """Run a blocking crew function on the agent executor under the given policy.
+
+    `degraded` (same signature as fn) is used when the breaker is open or the
+    provider keeps failing. `request` enables cancellation on client disconnect.
+    `deadline_at` (event loop time) lets several calls share one endpoint deadline.
+    `validate` judges the result for the run ledger (default: no "error" key).
+    Raises AgentQueueFull when admission control rejects the run.
+    """
+    if request is not None:
+        current = asyncio.current_task()
+        watcher = asyncio.create_task(_watch_disconnect(request, current))
+        try:
+            return await run_agent(
+                policy, fn, *args, user_id=user_id, degraded=degraded, deadline_at=deadline_at, validate=validate
+            )
+        finally:
+            watcher.cancel()
+
+    record, token = run_ledger.start_record(policy.name, fn.__name__, user_id, args)
+    try:
+        result = await _run_with_retry(policy, fn, args, user_id, degraded, deadline_at)
+        valid = validate(result) if validate is not None else "error" not in result
+        record.finish("degraded" if result.get("degraded") else "ok", output_valid=valid)
+        return result
+    except asyncio.CancelledError:
+        record.finish("cancelled")
+        raise
+    except BaseException as e:
+        record.finish(_FAILURE_STATUS.get(type(e), "error"), error=e)
+        raise
+    finally:
+        run_ledger.end_record(token)
+
+
+async def _run_with_retry(
+    policy: ExecutionPolicy,
+    fn: Callable[..., dict],
+    args: tuple,
+    user_id: str,
+    degraded: Callable[..., dict] | None,
+    deadline_at: float | None,
+) -> dict:
+    breaker = get_breaker()
+    if not breaker.allow():
+        if degraded is not None:
+            return await _serve_degraded(policy, degraded, args, "circuit_open")
+        raise CircuitOpenError(f"LLM circuit open, {policy.name} unavailable")
+
+    loop = asyncio.get_running_loop()
+    deadline = deadline_at if deadline_at is not None else loop.time() + policy.deadline_seconds
+    token = threading.Event()
+    last_error: BaseException | None = None
+
+    for attempt in range(policy.max_attempts):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        run_ledger.current_record().attempts += 1
+        try:
+            with tracing.span(f"agent.attempt {policy.name}", **{"attune.attempt": attempt + 1}):
+                result = await _attempt(policy, fn, args, user_id, token, remaining)
+            breaker.record_success()
+            _attempts.inc(policy=policy.name, outcome="ok")
+            return result
+        except asyncio.CancelledError:
+            token.set()
+            breaker.release()
+            _attempts.inc(policy=policy.name, outcome="cancelled")
+            raise
+        except _AttemptDeadline as e:
+            token.set()
+            breaker.record_failure()
+            _attempts.inc(policy=policy.name, outcome="deadline")
+            last_error = e
+            break
+        except AgentQueueFull:
+            breaker.release()
+            raise
+        except Exception as e:
+            last_error = e
+            if not is_retryable(e):
+                breaker.release()
+                _attempts.inc(policy=policy.name, outcome="error")
+                raise
+            breaker.record_failure()
+            _attempts.inc(policy=policy.name, outcome="retryable_error")
+            if attempt == policy.max_attempts - 1 or not breaker.allow():
+                break
+            backoff = min(policy.max_backoff_seconds, policy.base_backoff_seconds * 2 ** attempt)
+            backoff *= random.uniform(0.5, 1.0)
+            if loop.time() + backoff >= deadline:
+                break
+            logger.warning(
+                f"{policy.name} agent call failed (attempt {attempt + 1}), retrying in {backoff:.1f}s: {e}"
+            )
+            await asyncio.sleep(backoff)
+
+    if degraded is not None:
+        reason = "deadline" if isinstance(last_error, _AttemptDeadline) else "provider_error"
+        return await _serve_degraded(policy, degraded, args, reason)
+    if isinstance(last_error, _AttemptDeadline) or last_error is None:
+        raise AgentDeadlineExceeded(f"{policy.name} exceeded its {policy.deadline_seconds:g}s deadline")
+    raise last_error
@@ -0,0 +1,162 @@
+"""CrewAI event listeners that turn crew runs into trace spans.
+
+CrewAI pairs every end event with its start (started_event_id) and nests
+events under the enclosing one (parent_event_id), so crew kickoff -> agent
+step -> LLM call / tool use map directly onto parent/child spans. Spans are
+opened and closed with the events' own timestamps because handlers run on
+CrewAI's thread pool after emission. A crew kickoff with no traced parent
+event attaches to the span that was current where it was emitted (the
+agent executor job, and through it the HTTP route).
+"""
+import logging
+import threading
+from collections import OrderedDict
+from crewai.events.event_bus import crewai_event_bus
+from crewai.events.event_types import (
+    AgentExecutionCompletedEvent,
+    AgentExecutionErrorEvent,
+    AgentExecutionStartedEvent,
+    CrewKickoffCompletedEvent,
+    CrewKickoffFailedEvent,
+    CrewKickoffStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+    LLMCallStartedEvent,
+    ToolUsageErrorEvent,
+    ToolUsageFinishedEvent,
+    ToolUsageStartedEvent,
+)
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+from app.services import tracing
+from app.services.agent_metrics import agent_role, task_label, token_usage
+from app.services.progress import current_run
+
+logger = logging.getLogger(__name__)
+
+MAX_OPEN_SPANS = 10_000  # spans whose end event never arrives are closed oldest-first
+
+_open: OrderedDict[str, trace.Span] = OrderedDict()
+# End events handled before their start event (handlers race on the thread pool)
+_early_ends: OrderedDict[str, tuple[int, str | None, dict]] = OrderedDict()
+_lock = threading.Lock()
+_registered = False
+
+
+def _ns(ts) -> int:
+    return int(ts.timestamp() * 1e9)
+
+
+def _attributes(**values) -> dict:
+    return {k: v for k, v in values.items() if v is not None}
+
+
+def _run_attributes() -> dict:
+    run = current_run()
+    return {} if run is None else {"attune.run_id": run.run_id, "attune.route": run.route or "unknown"}
+
+
+def _start(event, name: str, **attributes):
+    with _lock:
+        parent = _open.get(event.parent_event_id) if event.parent_event_id else None
+    context = trace.set_span_in_context(parent) if parent is not None else None
+    span = tracing.get_tracer().start_span(
+        name, context=context, start_time=_ns(event.timestamp),
+        attributes=_attributes(**_run_attributes(), **attributes),
+    )
+    with _lock:
+        early = _early_ends.pop(event.event_id, None)
+        if early is None:
+            _open[event.event_id] = span
+            evicted = _open.popitem(last=False)[1] if len(_open) > MAX_OPEN_SPANS else None
+    if early is not None:
+        _finish(span, *early)
+    elif evicted is not None:
+        evicted.set_attribute("attune.span_evicted", True)
+        evicted.end()
+
+
+def _end(event, error: str | None = None, end_ns: int | None = None, **attributes):
+    end_ns = end_ns or _ns(event.timestamp)
+    attributes = _attributes(**attributes)
+    with _lock:
+        span = _open.pop(event.started_event_id, None) if event.started_event_id else None
+        if span is None and event.started_event_id:
+            _early_ends[event.started_event_id] = (end_ns, error, attributes)
+            if len(_early_ends) > MAX_OPEN_SPANS:
+                _early_ends.popitem(last=False)
+    if span is not None:
+        _finish(span, end_ns, error, attributes)
+
+
+def _finish(span: trace.Span, end_ns: int, error: str | None, attributes: dict):
+    span.set_attributes(attributes)
+    if error is not None:
+        span.set_status(Status(StatusCode.ERROR, error))
+    span.end(end_time=end_ns)
+
+
+def register_agent_tracing():
+    """Subscribe the span listeners to the CrewAI event bus (once per process, only when tracing is on)."""
+    global _registered
+    if _registered or not tracing.enabled():
+        return
+    _registered = True
+
+    @crewai_event_bus.on(CrewKickoffStartedEvent)
+    def on_crew_started(source, event):
+        _start(event, f"crew.kickoff {event.crew_name or 'crew'}", **{"crewai.crew": event.crew_name})
+
+    @crewai_event_bus.on(CrewKickoffCompletedEvent)
+    def on_crew_completed(source, event):
+        _end(event)
+
+    @crewai_event_bus.on(CrewKickoffFailedEvent)
+    def on_crew_failed(source, event):
+        _end(event, error=str(event.error))
+
+    @crewai_event_bus.on(AgentExecutionStartedEvent)
+    def on_agent_started(source, event):
+        role = agent_role(event)
+        _start(event, f"agent.step {role or 'agent'}", **{"crewai.agent": role, "crewai.task": task_label(event)})
+
+    @crewai_event_bus.on(AgentExecutionCompletedEvent)
+    def on_agent_completed(source, event):
+        _end(event)
+
+    @crewai_event_bus.on(AgentExecutionErrorEvent)
+    def on_agent_error(source, event):
+        _end(event, error=str(event.error))
+
+    @crewai_event_bus.on(LLMCallStartedEvent)
+    def on_llm_started(source, event):
+        _start(event, f"llm.call {event.model or 'llm'}", **{
+            "gen_ai.request.model": event.model, "crewai.agent": event.agent_role,
+        })
+
+    @crewai_event_bus.on(LLMCallCompletedEvent)
+    def on_llm_completed(source, event):
+        usage = token_usage(event.usage)
+        _end(event, **{
+            "gen_ai.usage.input_tokens": usage.get("prompt"),
+            "gen_ai.usage.output_tokens": usage.get("completion"),
+        })
+
+    @crewai_event_bus.on(LLMCallFailedEvent)
+    def on_llm_failed(source, event):
+        _end(event, error=str(event.error))
+
+    @crewai_event_bus.on(ToolUsageStartedEvent)
+    def on_tool_started(source, event):
+        _start(event, f"tool {event.tool_name}", **{
+            "crewai.tool": event.tool_name, "crewai.agent": event.agent_role,
+            "crewai.tool.attempt": event.run_attempts,
+        })
+
+    @crewai_event_bus.on(ToolUsageFinishedEvent)
+    def on_tool_finished(source, event):
+        _end(event, end_ns=_ns(event.finished_at), **{"crewai.tool.from_cache": event.from_cache})
+
+    @crewai_event_bus.on(ToolUsageErrorEvent)
+    def on_tool_error(source, event):
+        _end(event, error=str(event.error))
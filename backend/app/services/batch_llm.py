@@ -0,0 +1,116 @@
+"""Batch LLM interface for bulk, latency-insensitive prompts (nightly jobs).
+
+AnthropicBatchProvider uses the Message Batches API (half price, results
+within 24h). LocalBatchProvider answers each request with a Python callable
+on a thread pool; it stands in for the API in development and tests.
+"""
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Protocol
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    system: str
+    prompt: str
+    max_tokens: int = 2048
+
+
+@dataclass
+class BatchResult:
+    custom_id: str
+    text: str | None
+    error: str | None = None
+
+
+class BatchProvider(Protocol):
+    def submit(self, requests: list[BatchRequest]) -> str: ...
+
+    def is_done(self, batch_id: str) -> bool: ...
+
+    def results(self, batch_id: str) -> list[BatchResult]: ...
+
+
+class AnthropicBatchProvider:
+    def __init__(self, model: str):
+        import anthropic
+        self.model = model
+        self._client = anthropic.Anthropic(api_key=get_settings().anthropic_api_key)
+
+    def submit(self, requests: list[BatchRequest]) -> str:
+        batch = self._client.messages.batches.create(requests=[
+            {
+                "custom_id": r.custom_id,
+                "params": {
+                    "model": self.model,
+                    "max_tokens": r.max_tokens,
+                    "system": r.system,
+                    "messages": [{"role": "user", "content": r.prompt}],
+                },
+            }
+            for r in requests
+        ])
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        return self._client.messages.batches.retrieve(batch_id).processing_status == "ended"
+
+    def results(self, batch_id: str) -> list[BatchResult]:
+        out = []
+        for entry in self._client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                text = "".join(b.text for b in entry.result.message.content if b.type == "text")
+                out.append(BatchResult(entry.custom_id, text))
+            else:
+                out.append(BatchResult(entry.custom_id, None, error=entry.result.type))
+        return out
+
+
+class LocalBatchProvider:
+    """Runs `responder` over every request concurrently; results are available immediately."""
+
+    def __init__(self, responder: Callable[[BatchRequest], str], concurrency: int = 8):
+        self.responder = responder
+        self.concurrency = concurrency
+        self._batches: dict[str, list[BatchResult]] = {}
+
+    def _answer(self, request: BatchRequest) -> BatchResult:
+        try:
+            return BatchResult(request.custom_id, self.responder(request))
+        except Exception as e:
+            return BatchResult(request.custom_id, None, error=str(e))
+
+    def submit(self, requests: list[BatchRequest]) -> str:
+        batch_id = f"local_{uuid.uuid4().hex}"
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            self._batches[batch_id] = list(pool.map(self._answer, requests))
+        return batch_id
+
+    def is_done(self, batch_id: str) -> bool:
+        return True
+
+    def results(self, batch_id: str) -> list[BatchResult]:
+        return self._batches.pop(batch_id)
+
+
+def run_batch(
+    provider: BatchProvider, requests: list[BatchRequest], poll_seconds: float, timeout_seconds: float
+) -> list[BatchResult]:
+    """Submit, wait for completion and return all results. Blocking."""
+    if not requests:
+        return []
+    batch_id = provider.submit(requests)
+    logger.info(f"Submitted LLM batch {batch_id} with {len(requests)} requests")
+    deadline = time.monotonic() + timeout_seconds
+    while not provider.is_done(batch_id):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"LLM batch {batch_id} did not finish within {timeout_seconds:g}s")
+        time.sleep(poll_seconds)
+    return provider.results(batch_id)
@@ -0,0 +1,297 @@
+"""Server-side metrics for the reaction-time and time-perception tests.
+
+Scores, metrics and interpretations are computed from the raw trial arrays
+with the same formulas the frontend tests use for display. Lapses and drift
+are added on top. The client's own numbers are not trusted.
+
+Each result is also placed against population norms. These are fixed-edge
+histograms per (test type, metric) in cognitive_test_norms, and every saved
+test increments them with one RPC. Lookups go to an in-process copy of the
+tables (cumulative counts, refreshed every NORMS_REFRESH_SECONDS), so a
+percentile is one bisect over the bin edges.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import numpy as np
+from app.database import get_supabase_admin
+from app.services.trial_storage import load_trials
+
+logger = logging.getLogger(__name__)
+
+REACTION_TIME = "reaction_time"
+TIME_PERCEPTION = "time_perception"
+TRIAL_TESTS = (REACTION_TIME, TIME_PERCEPTION)
+
+RT_PRACTICE_TRIALS = 3       # first trials of the reaction-time test are practice
+RT_LAPSE_MS = 500            # PVT convention: a response this slow is a lapse
+TP_LAPSE_ERROR_PCT = 50.0    # time-perception trial off by half the target or more
+TP_BIAS_MS = 500             # mean signed error beyond this is an over/underestimator
+NORMS_REFRESH_SECONDS = 300
+
+_LABELS = {REACTION_TIME: "Reaction Time Test", TIME_PERCEPTION: "Time Awareness Test"}
+
+
+class TrialDataError(ValueError):
+    pass
+
+
+def _round(x) -> int:
+    """Math.round semantics (halves round up), so scores match what the client showed."""
+    return int(np.floor(float(x) + 0.5))
+
+
+def _drift(values: np.ndarray) -> float:
+    """Least-squares slope per trial: positive means values rose over the test."""
+    if len(values) < 2:
+        return 0.0
+    return float(np.polyfit(np.arange(len(values)), values, 1)[0])
+
+
+def _column(trials: list[dict], key: str) -> np.ndarray:
+    try:
+        return np.array([float(t[key]) for t in trials])
+    except (KeyError, TypeError, ValueError):
+        raise TrialDataError(f"every trial needs a numeric {key}")
+
+
+# ── Metrics ──
+def reaction_time_metrics(trials: list[dict]) -> tuple[int, dict]:
+    """(score, metrics) from ReactionTrialResult dicts (trialIndex, reactionTimeMs, isFalseStart)."""
+    index = _column(trials, "trialIndex")
+    rt = _column(trials, "reactionTimeMs")
+    false_start = np.array([bool(t.get("isFalseStart")) for t in trials], dtype=bool)
+    scored = rt[(index >= RT_PRACTICE_TRIALS) & ~false_start]
+    false_starts = int(false_start.sum())
+    if not len(scored):
+        metrics = {"meanRtMs": 999, "medianRtMs": 999, "stdDevMs": 0, "consistency": 0,
+                   "falseStarts": false_starts, "lapses": 0, "driftMsPerTrial": 0.0}
+    else:
+        mean = _round(scored.mean())
+        std = _round(scored.std())
+        cv = std / mean if mean > 0 else 1
+        metrics = {
+            "meanRtMs": mean,
+            "medianRtMs": _round(np.median(scored)),
+            "stdDevMs": std,
+            "consistency": max(0, min(100, _round(100 - cv * 200))),
+            "falseStarts": false_starts,
+            "lapses": int((scored >= RT_LAPSE_MS).sum()),
+            "driftMsPerTrial": round(_drift(scored), 1),
+        }
+    speed = max(0, min(100, _round(100 - (metrics["meanRtMs"] - 150) / 6)))
+    return _round(speed * 0.5 + metrics["consistency"] * 0.5), metrics
+
+
+def time_perception_metrics(trials: list[dict]) -> tuple[int, dict]:
+    """(score, metrics) from TimeTrialResult dicts; errors are recomputed from targetMs/actualMs."""
+    target = _column(trials, "targetMs")
+    actual = _column(trials, "actualMs")
+    if not len(trials) or (target <= 0).any():
+        raise TrialDataError("time perception needs trials with positive targetMs")
+    signed = actual - target
+    error = np.abs(signed)
+    error_pct = error / target * 100
+    mean_signed = signed.mean()
+    metrics = {
+        "meanErrorMs": round(float(error.mean()), 1),
+        "medianErrorMs": round(float(np.median(error)), 1),
+        "meanErrorPct": round(float(error_pct.mean()), 2),
+        "stdDevMs": round(float(error.std()), 1),
+        "bias": "overestimator" if mean_signed > TP_BIAS_MS else "underestimator" if mean_signed < -TP_BIAS_MS else "accurate",
+        "lapses": int((error_pct >= TP_LAPSE_ERROR_PCT).sum()),
+        # Signed error as % of target, per trial: positive means estimates drifted long
+        "driftPctPerTrial": round(_drift(signed / target * 100), 2),
+    }
+    return max(0, min(100, _round(100 - float(error_pct.mean()) * 2))), metrics
+
+
+def _interpret_time_perception(score: int, bias: str) -> str:
+    if score >= 80:
+        note = {"overestimator": " You tend to overestimate durations.",
+                "underestimator": " You tend to underestimate durations — tasks may feel shorter than they are."}
+        return f"Excellent time awareness. Your internal clock is well-calibrated.{note.get(bias, '')}"
+    if score >= 60:
+        note = {"overestimator": " Slight tendency to overestimate.", "underestimator": " Slight tendency to underestimate."}
+        return f"Good time awareness with minor drift.{note.get(bias, '')} Using timers for longer tasks helps."
+    if score >= 40:
+        note = {"overestimator": " Tasks may feel longer than they are.",
+                "underestimator": " Tasks may feel shorter than they are."}
+        return f"Moderate time perception variability.{note.get(bias, '')} External timers are especially useful."
+    note = {"overestimator": " Tasks tend to feel longer than they are.",
+            "underestimator": " Tasks tend to feel shorter than they are."}
+    return (
+        "High time perception variability — a common trait in people with attention differences."
+        f"{note.get(bias, '')} External timers can be a powerful tool."
+    )
+
+
+def _interpret_reaction_time(score: int, mean_rt: int) -> str:
+    if score >= 80:
+        return f"Fast and consistent reactions (avg {mean_rt}ms). Your attention system responds reliably to stimuli."
+    if score >= 60:
+        return f"Good reaction speed (avg {mean_rt}ms) with some variability — typical of a focused attention state."
+    if score >= 40:
+        return (f"Moderate reaction variability (avg {mean_rt}ms). "
+                "Attention fluctuations are common and manageable with structure.")
+    return (f"Higher reaction time variability (avg {mean_rt}ms) — often linked to attention differences. "
+            "This is very manageable with the right strategies.")
+
+
+def evaluate(test_type: str, raw_data: dict) -> dict:
+    """Score, metrics, label and interpretation for a trial-based test from its raw data."""
+    trials = raw_data.get("trials")
+    if not isinstance(trials, list) or not trials or not all(isinstance(t, dict) for t in trials):
+        raise TrialDataError("rawData.trials must be a non-empty list of trials")
+    if test_type == REACTION_TIME:
+        score, metrics = reaction_time_metrics(trials)
+        interpretation = _interpret_reaction_time(score, metrics["meanRtMs"])
+    else:
+        score, metrics = time_perception_metrics(trials)
+        interpretation = _interpret_time_perception(score, metrics["bias"])
+    return {"score": score, "metrics": metrics, "label": _LABELS[test_type], "interpretation": interpretation}
+
+
+# ── Population norms ──
+# Histogram edges per normed metric; values outside the range fall in the first/last bin
+NORM_EDGES: dict[str, dict[str, np.ndarray]] = {
+    REACTION_TIME: {
+        "score": np.arange(0, 101, 1.0),
+        "meanRtMs": np.arange(100, 2510, 10.0),
+        "stdDevMs": np.arange(0, 1005, 5.0),
+        "lapses": np.arange(0, 11, 1.0),
+    },
+    TIME_PERCEPTION: {
+        "score": np.arange(0, 101, 1.0),
+        "meanErrorPct": np.arange(0, 200.5, 0.5),
+        "stdDevMs": np.arange(0, 10050, 50.0),
+    },
+}
+
+
+@dataclass
+class _NormTable:
+    edges: list[float]
+    counts: list[int]
+    below: list[int]   # below[i] = tests in bins before i
+    total: int
+
+
+def norm_bin(edges, value: float) -> int:
+    return min(max(bisect_right(edges, value) - 1, 0), len(edges) - 2)
+
+
+class PopulationNorms:
+    """Cached histogram tables; percentile() is a bisect plus constant work."""
+
+    def __init__(self, refresh_seconds: float = NORMS_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._tables: dict[tuple[str, str], _NormTable] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        rows = get_supabase_admin().table("cognitive_test_norms").select("test_type, metric, counts").execute().data
+        tables = {}
+        for row in rows:
+            edges = NORM_EDGES.get(row["test_type"], {}).get(row["metric"])
+            if edges is None or len(row["counts"]) != len(edges) - 1:
+                continue  # edges changed since the table was written; rebuild_norms() resets it
+            counts = [int(c) for c in row["counts"]]
+            below = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(int).tolist()
+            tables[(row["test_type"], row["metric"])] = _NormTable(edges.tolist(), counts, below, sum(counts))
+        self._tables = tables
+        self._loaded_at = time.monotonic()
+
+    def _table(self, test_type: str, metric: str) -> _NormTable | None:
+        if time.monotonic() - self._loaded_at > self.refresh_seconds:
+            with self._lock:
+                if time.monotonic() - self._loaded_at > self.refresh_seconds:
+                    try:
+                        self._refresh()
+                    except Exception as e:
+                        logger.warning(f"Cognitive test norms refresh failed: {e}")
+                        self._loaded_at = time.monotonic()  # keep serving the old tables until the next window
+        return self._tables.get((test_type, metric))
+
+    def percentile(self, test_type: str, metric: str, value: float) -> float | None:
+        """Share of the population (0-100) below `value`, counting its own bin as half. None without data."""
+        table = self._table(test_type, metric)
+        if table is None or not table.total:
+            return None
+        b = norm_bin(table.edges, value)
+        return round((table.below[b] + table.counts[b] / 2) / table.total * 100, 1)
+
+    def percentiles(self, test_type: str, score: int, metrics: dict) -> dict[str, float]:
+        values = {"score": score, **metrics}
+        out = {}
+        for metric in NORM_EDGES.get(test_type, {}):
+            p = self.percentile(test_type, metric, values[metric])
+            if p is not None:
+                out[metric] = p
+        return out
+
+
+def norm_bins(test_type: str, score: int, metrics: dict) -> dict[str, dict]:
+    values = {"score": score, **metrics}
+    return {
+        metric: {"bin": norm_bin(edges, values[metric]), "size": len(edges) - 1}
+        for metric, edges in NORM_EDGES.get(test_type, {}).items()
+    }
+
+
+def record_norms(test_type: str, score: int, metrics: dict):
+    """Add one result to the population histograms (one RPC, atomic increments)."""
+    get_supabase_admin().rpc("record_test_norms", {
+        "p_test_type": test_type,
+        "p_bins": norm_bins(test_type, score, metrics),
+    }).execute()
+
+
+def rebuild_norms(page_size: int = 1000) -> dict:
+    """Recompute every histogram from the stored raw trials. Blocking; returns counts for the job result."""
+    db = get_supabase_admin()
+    counts = {
+        (t, m): np.zeros(len(edges) - 1, dtype=np.int64)
+        for t, metrics in NORM_EDGES.items() for m, edges in metrics.items()
+    }
+    summary = {"tests": 0, "skipped": 0}
+    for test_type in TRIAL_TESTS:
+        start = 0
+        while True:
+            rows = (
+                db.table("cognitive_tests").select("id, test_type, raw_data").eq("test_type", test_type)
+                .order("id").range(start, start + page_size - 1).execute()
+            ).data
+            trials = load_trials(rows)
+            for row in rows:
+                try:
+                    result = evaluate(test_type, {"trials": trials.get(row["id"])})
+                except TrialDataError:
+                    summary["skipped"] += 1
+                    continue
+                for metric, b in norm_bins(test_type, result["score"], result["metrics"]).items():
+                    counts[(test_type, metric)][b["bin"]] += 1
+                summary["tests"] += 1
+            if len(rows) < page_size:
+                break
+            start += page_size
+    now = datetime.now(timezone.utc).isoformat()
+    db.table("cognitive_test_norms").upsert([
+        {"test_type": t, "metric": m, "counts": c.tolist(), "updated_at": now} for (t, m), c in counts.items()
+    ], on_conflict="test_type,metric").execute()
+    logger.info(f"Cognitive test norms rebuilt: {summary}")
+    return summary
+
+
+_norms: PopulationNorms | None = None
+
+
+def get_population_norms() -> PopulationNorms:
+    global _norms
+    if _norms is None:
+        _norms = PopulationNorms()
+    return _norms
@@ -0,0 +1,255 @@
+"""Population-level momentum: distributions, percentiles and cohort trends.
+
+Runs nightly over every user. Checkins are loaded in columnar form, a page of
+users at a time (one RPC per page returns per-user arrays), and momentum is
+computed for every checkin of the page in one vectorized pass: rows are sorted
+by (user, date), so each checkin's 14-checkin window and 3-checkin recent
+window are contiguous slices whose sums come from one prefix-sum array.
+Pages only feed running aggregates, so memory stays flat with the user count.
+
+Cohorts are the brain state of a checkin (from its energy level) and the
+profile tags of the user's latest cognitive profile. Cohorts with fewer than
+MIN_COHORT_USERS users are left out of the snapshot.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+import numpy as np
+from app.database import get_supabase_admin
+from app.services import metrics
+from app.services.momentum_service import RECENT, WINDOW
+
+logger = logging.getLogger(__name__)
+
+_duration = metrics.histogram("cohort_momentum_seconds", "Nightly cohort momentum run time")
+
+BRAIN_STATES = ("foggy", "focused", "wired")
+_ENERGY_TO_BRAIN = {"low": 0, "medium": 1, "high": 2}
+HISTORY_DAYS = 365
+TREND_BUCKET_DAYS = 7
+MIN_COHORT_USERS = 20
+PAGE_SIZE = 1000
+PERCENTILES = (10, 25, 50, 75, 90)
+_HISTOGRAM_EDGES = np.linspace(0, 100, 11)
+
+
+@dataclass
+class CheckinColumns:
+    """Checkins of a page of users, sorted by (user, date)."""
+    user_ids: list[str]
+    tags: list[list[str]]   # per user: latest profile tags
+    user: np.ndarray        # int32 index into user_ids
+    day: np.ndarray         # int32 days since 1970-01-01
+    mood: np.ndarray
+    completed: np.ndarray
+    total: np.ndarray
+    brain: np.ndarray       # int8 index into BRAIN_STATES, -1 when unknown
+
+    def __len__(self) -> int:
+        return len(self.user)
+
+
+def composites(cols: CheckinColumns) -> np.ndarray:
+    """Vectorized momentum_service.composite: 60% mood (x10) + 40% completion."""
+    total = np.where(cols.total > 0, cols.total, 1)
+    return cols.mood * 6.0 + (cols.completed / total) * 40.0
+
+
+def rolling_momentum(user: np.ndarray, composite: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(score, delta, rolling composite mean) after each checkin, matching calculate_momentum."""
+    n_rows = len(user)
+    if not n_rows:
+        empty = np.zeros(0)
+        return empty, empty, empty
+    idx = np.arange(n_rows)
+    starts = np.flatnonzero(np.r_[True, user[1:] != user[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, n_rows]))
+    prefix = np.concatenate(([0.0], np.cumsum(composite)))
+
+    window_start = np.maximum(group_start, idx - (WINDOW - 1))
+    n = idx - window_start + 1
+    window_sum = prefix[idx + 1] - prefix[window_start]
+    recent_start = np.maximum(group_start, idx - (RECENT - 1))
+    recent = idx - recent_start + 1
+    recent_sum = prefix[idx + 1] - prefix[recent_start]
+    early_sum = prefix[np.minimum(window_start + RECENT, n_rows)] - prefix[window_start]
+
+    # Last 3 checkins count double; delta = last 3 avg - first 3 avg once there are 6
+    score = (window_sum + recent_sum) / (n + recent)
+    delta = np.where(n >= 2 * RECENT, (recent_sum - early_sum) / RECENT, 0.0)
+    return score, delta, window_sum / n
+
+
+class CohortAggregator:
+    """Accumulates per-page momentum into population and cohort statistics."""
+
+    def __init__(self, first_day: int, days: int = HISTORY_DAYS, bucket_days: int = TREND_BUCKET_DAYS):
+        self.first_day = first_day
+        self.bucket_days = bucket_days
+        self.n_buckets = -(-days // bucket_days)
+        self.users = 0
+        self.checkins = 0
+        self._latest: list[np.ndarray] = []          # latest score per user
+        self._latest_delta: list[np.ndarray] = []
+        self._brain_latest: dict[int, list[np.ndarray]] = {b: [] for b in range(len(BRAIN_STATES))}
+        self._brain_sum = np.zeros((len(BRAIN_STATES), self.n_buckets))
+        self._brain_count = np.zeros((len(BRAIN_STATES), self.n_buckets))
+        self._tag_index: dict[str, int] = {}
+        self._tag_latest: list[list[np.ndarray]] = []
+        self._tag_sum = np.zeros((0, self.n_buckets))
+        self._tag_count = np.zeros((0, self.n_buckets))
+
+    def _tag(self, tag: str) -> int:
+        if tag not in self._tag_index:
+            self._tag_index[tag] = len(self._tag_index)
+            self._tag_latest.append([])
+            self._tag_sum = np.vstack([self._tag_sum, np.zeros(self.n_buckets)])
+            self._tag_count = np.vstack([self._tag_count, np.zeros(self.n_buckets)])
+        return self._tag_index[tag]
+
+    def add(self, cols: CheckinColumns):
+        if not len(cols):
+            return
+        score, delta, _ = rolling_momentum(cols.user, composites(cols))
+        ends = np.r_[np.flatnonzero(cols.user[1:] != cols.user[:-1]), len(cols) - 1]
+        latest, latest_user = score[ends], cols.user[ends]
+        self.users += len(ends)
+        self.checkins += len(cols)
+        self._latest.append(latest)
+        self._latest_delta.append(delta[ends])
+
+        bucket = (cols.day - self.first_day) // self.bucket_days
+        in_range = (bucket >= 0) & (bucket < self.n_buckets)
+
+        # Brain-state cohorts: trend over checkins in that state, distribution over users' latest state
+        known = in_range & (cols.brain >= 0)
+        key = cols.brain[known].astype(np.int64) * self.n_buckets + bucket[known]
+        size = len(BRAIN_STATES) * self.n_buckets
+        self._brain_sum += np.bincount(key, weights=score[known], minlength=size).reshape(self._brain_sum.shape)
+        self._brain_count += np.bincount(key, minlength=size).reshape(self._brain_count.shape)
+        latest_brain = cols.brain[ends]
+        for b in range(len(BRAIN_STATES)):
+            self._brain_latest[b].append(latest[latest_brain == b])
+
+        # Profile-tag cohorts: a user belongs to every tag of their latest profile
+        has_tag = np.zeros((len(cols.user_ids), 0), dtype=bool)
+        for u, tags in enumerate(cols.tags):
+            for tag in tags or ():
+                t = self._tag(tag)
+                if t >= has_tag.shape[1]:
+                    has_tag = np.hstack([has_tag, np.zeros((len(cols.user_ids), t + 1 - has_tag.shape[1]), bool)])
+                has_tag[u, t] = True
+        for t in range(has_tag.shape[1]):
+            rows = in_range & has_tag[cols.user, t]
+            self._tag_sum[t] += np.bincount(bucket[rows], weights=score[rows], minlength=self.n_buckets)
+            self._tag_count[t] += np.bincount(bucket[rows], minlength=self.n_buckets)
+            self._tag_latest[t].append(latest[has_tag[latest_user, t]])
+
+    # ── Output ──
+    def _trend(self, sums: np.ndarray, counts: np.ndarray) -> list[dict]:
+        return [
+            {
+                "weekStart": (date(1970, 1, 1) + timedelta(days=self.first_day + b * self.bucket_days)).isoformat(),
+                "momentum": round(float(sums[b] / counts[b]), 1),
+                "checkins": int(counts[b]),
+            }
+            for b in np.flatnonzero(counts).tolist()
+        ]
+
+    @staticmethod
+    def _distribution(scores: np.ndarray) -> dict:
+        rounded = np.rint(scores)
+        return {
+            "users": int(len(scores)),
+            "mean": round(float(rounded.mean()), 1),
+            "percentiles": {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(rounded, PERCENTILES))},
+            "histogram": np.histogram(rounded, bins=_HISTOGRAM_EDGES)[0].tolist(),
+        }
+
+    def snapshot(self) -> dict:
+        latest = np.concatenate(self._latest) if self._latest else np.zeros(0)
+        deltas = np.concatenate(self._latest_delta) if self._latest_delta else np.zeros(0)
+        cohorts: dict[str, dict] = {"brainState": {}, "profileTag": {}}
+        for b, name in enumerate(BRAIN_STATES):
+            scores = np.concatenate(self._brain_latest[b])
+            if len(scores) >= MIN_COHORT_USERS:
+                cohorts["brainState"][name] = {
+                    **self._distribution(scores),
+                    "trend": self._trend(self._brain_sum[b], self._brain_count[b]),
+                }
+        for tag, t in self._tag_index.items():
+            scores = np.concatenate(self._tag_latest[t])
+            if len(scores) >= MIN_COHORT_USERS:
+                cohorts["profileTag"][tag] = {
+                    **self._distribution(scores),
+                    "trend": self._trend(self._tag_sum[t], self._tag_count[t]),
+                }
+        population = self._distribution(latest) if len(latest) else {"users": 0}
+        if len(deltas):
+            population["rising"] = int((np.rint(deltas) > 0).sum())
+            population["falling"] = int((np.rint(deltas) < 0).sum())
+        return {
+            "checkins": self.checkins,
+            "histogramEdges": _HISTOGRAM_EDGES.tolist(),
+            "population": population,
+            "cohorts": cohorts,
+        }
+
+
+# ── Loading ──
+def columns_from_rows(rows: list[dict]) -> CheckinColumns:
+    """Columnar page from cohort_checkin_columns rows (one row per user, arrays ordered by date)."""
+    lengths = np.array([len(r["dates"]) for r in rows], dtype=np.int64)
+    total_rows = int(lengths.sum())
+
+    def flat(key: str, dtype) -> np.ndarray:
+        return np.fromiter((v for r in rows for v in r[key]), dtype=dtype, count=total_rows)
+
+    dates = np.array([d for r in rows for d in r["dates"]], dtype="datetime64[D]")
+    brain = np.fromiter(
+        (_ENERGY_TO_BRAIN.get(e, -1) for r in rows for e in r["energy_levels"]), dtype=np.int8, count=total_rows
+    )
+    return CheckinColumns(
+        user_ids=[r["user_id"] for r in rows],
+        tags=[r.get("profile_tags") or [] for r in rows],
+        user=np.repeat(np.arange(len(rows), dtype=np.int32), lengths),
+        day=dates.astype(np.int32),
+        mood=flat("moods", np.int16),
+        completed=flat("completed", np.int16),
+        total=flat("totals", np.int16),
+        brain=brain,
+    )
+
+
+def _page(since: date, after: str | None, limit: int) -> list[dict]:
+    return get_supabase_admin().rpc("cohort_checkin_columns", {
+        "p_since": since.isoformat(),
+        "p_after": after,
+        "p_limit": limit,
+    }).execute().data
+
+
+def run_cohort_momentum(days: int = HISTORY_DAYS) -> dict:
+    """Compute and store today's cohort snapshot. Blocking; returns counts for the job result."""
+    started = datetime.now(timezone.utc)
+    today = started.date()
+    since = today - timedelta(days=days - 1)
+    # Momentum on day one of the range needs the 13 checkins before it
+    load_since = since - timedelta(days=WINDOW * 2)
+    aggregator = CohortAggregator(first_day=(since - date(1970, 1, 1)).days, days=days)
+
+    after = None
+    while rows := _page(load_since, after, PAGE_SIZE):
+        aggregator.add(columns_from_rows(rows))
+        after = rows[-1]["user_id"]
+    snapshot = aggregator.snapshot()
+    get_supabase_admin().table("cohort_momentum_snapshots").upsert({
+        "snapshot_date": today.isoformat(),
+        "stats": snapshot,
+        "created_at": started.isoformat(),
+    }, on_conflict="snapshot_date").execute()
+
+    elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+    _duration.observe(elapsed)
+    logger.info(f"Cohort momentum: {aggregator.users} users, {aggregator.checkins} checkins in {elapsed:.1f}s")
+    return {"users": aggregator.users, "checkins": aggregator.checkins}
@@ -0,0 +1,137 @@
+"""Supabase query timing at the HTTP transport.
+
+Every PostgREST call (table query or RPC) is one HTTP request, so wrapping the
+httpx transport the Supabase clients share times them all without touching
+call sites. The response body is read inside the timer so the histogram
+covers the full round trip, not just the headers. Inside a sampled trace each
+request is also a client span.
+
+Calls are also added to the current QueryStats, if any: the query-stats
+middleware opens one per HTTP request, and it follows the request into
+asyncio.to_thread and agent executor jobs through contextvars. A query's
+shape is its method, target, selected columns and filter operators without
+their values. The same shape repeated within one request is a likely N+1.
+"""
+import contextvars
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+import httpx
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from app.services import metrics, tracing
+
+_query_seconds = metrics.histogram(
+    "supabase_query_seconds", "Supabase round trip by method and target (table or rpc:<function>)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+_query_total = metrics.counter("supabase_queries_total", "Supabase requests by method, target and status class")
+
+_REST_PREFIX = "/rest/v1/"
+
+
+def query_target(path: str) -> str:
+    """Table or rpc:<function> for a PostgREST path; the service name for auth/storage/functions."""
+    if path.startswith(_REST_PREFIX):
+        name = path[len(_REST_PREFIX):].split("/")
+        return f"rpc:{name[1]}" if name[0] == "rpc" and len(name) > 1 else name[0]
+    return path.strip("/").split("/")[0] or "root"
+
+
+def query_shape(request: httpx.Request, target: str) -> str:
+    """e.g. "GET checkins select=* user_id=eq order=checkin_date.desc limit" (values dropped)."""
+    parts = []
+    for key, value in sorted(request.url.params.multi_items()):
+        if key in ("select", "order", "on_conflict", "columns"):
+            parts.append(f"{key}={value}")
+        elif key in ("limit", "offset"):
+            parts.append(key)
+        else:
+            parts.append(f"{key}={value.split('.', 1)[0]}")  # filter operator only (eq, in, is, gte...)
+    return " ".join([request.method, target, *parts])
+
+
+@dataclass
+class QueryStats:
+    """Supabase round trips made while serving one request (any thread)."""
+    queries: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    budget: int | None = None
+    shapes: Counter = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, shape: str, seconds: float, nbytes: int):
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+            self.bytes += nbytes
+            self.shapes[shape] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Shapes issued at least `threshold` times, most frequent first."""
+        with self._lock:
+            return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+_query_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> QueryStats | None:
+    return _query_stats.get()
+
+
+def start_query_stats() -> tuple[QueryStats, contextvars.Token]:
+    stats = QueryStats()
+    return stats, _query_stats.set(stats)
+
+
+def end_query_stats(token: contextvars.Token):
+    _query_stats.reset(token)
+
+
+class TimedTransport(httpx.BaseTransport):
+    def __init__(self, inner: httpx.BaseTransport):
+        self._inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        labels = {"method": request.method, "target": query_target(request.url.path)}
+        with tracing.child_span(
+            f"supabase {labels['method']} {labels['target']}", kind=SpanKind.CLIENT,
+            **{"db.system": "postgresql", "db.operation": labels["method"], "db.sql.table": labels["target"]},
+        ) as span:
+            start = time.perf_counter()
+            try:
+                response = self._inner.handle_request(request)
+                response.read()
+            except httpx.HTTPError:
+                self._record(request, labels, time.perf_counter() - start, "error", len(request.content))
+                raise
+            self._record(
+                request, labels, time.perf_counter() - start, f"{response.status_code // 100}xx",
+                len(request.content) + len(response.content),
+            )
+            span.set_attribute("http.response.status_code", response.status_code)
+            if response.status_code >= 400:
+                span.set_status(Status(StatusCode.ERROR, f"HTTP {response.status_code}"))
+            return response
+
+    @staticmethod
+    def _record(request: httpx.Request, labels: dict, seconds: float, status: str, nbytes: int):
+        _query_seconds.observe(seconds, **labels)
+        _query_total.inc(status=status, **labels)
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.record(query_shape(request, labels["target"]), seconds, nbytes)
+
+    def close(self):
+        self._inner.close()
+
+
+def timed_http_client(timeout: float = 120) -> httpx.Client:
+    """httpx client for SyncClientOptions(httpx_client=...), with query timing."""
+    return httpx.Client(
+        transport=TimedTransport(httpx.HTTPTransport(http2=True)),
+        timeout=timeout,
+        follow_redirects=True,
+    )
@@ -0,0 +1,198 @@
+"""Deterministic fast paths used when the LLM provider is unavailable.
+
+Each function mirrors the signature and output shape of its agent counterpart
+(run_planning, run_intervention, run_screening) so routes can swap them in
+without special-casing the response.
+"""
+from datetime import datetime, timedelta
+from app.database import get_supabase_admin
+from app.agents.tools.scoring_tools import DIMENSION_MAP
+
+# Per brain state: (max tasks, minutes per block, minutes of break between blocks)
+_BRAIN_STATE_SHAPE = {
+    "foggy": (4, 20, 15),
+    "focused": (6, 45, 10),
+    "wired": (7, 15, 5),
+}
+
+_DIMENSION_LABELS = {
+    "attention_regulation": "Attention Regulation",
+    "time_perception": "Time Perception",
+    "emotional_intensity": "Emotional Intensity",
+    "working_memory": "Working Memory",
+    "task_initiation": "Task Initiation",
+    "hyperfocus_capacity": "Hyperfocus Capacity",
+}
+
+_DIMENSION_TAGS = {
+    "attention_regulation": "Pattern-Thinker",
+    "time_perception": "Time-Bender",
+    "emotional_intensity": "Intensity-Engine",
+    "working_memory": "Rapid-Connector",
+    "task_initiation": "Momentum-Builder",
+    "hyperfocus_capacity": "Deep-Diver",
+}
+
+
+def _format_slot(t: datetime) -> str:
+    return t.strftime("%I:%M %p").lstrip("0")
+
+
+def _save_plan(user_id: str, brain_state: str, tasks: list[dict], rationale: str) -> str:
+    db = get_supabase_admin()
+    db.table("daily_plans").update({"is_active": False}).eq("user_id", user_id).eq("is_active", True).execute()
+    result = db.table("daily_plans").insert({
+        "user_id": user_id,
+        "brain_state": brain_state,
+        "tasks": tasks,
+        "overall_rationale": rationale,
+    }).execute()
+    return result.data[0]["id"]
+
+
+def degraded_plan(
+    user_id: str, brain_state: str, user_tasks: list[str] | None = None, time_window_minutes: int | None = None
+) -> dict:
+    """Rule-based plan following the same brain-state strategy the planning agent uses."""
+    max_tasks, block, gap = _BRAIN_STATE_SHAPE.get(brain_state, _BRAIN_STATE_SHAPE["focused"])
+    titles = [t for t in (user_tasks or []) if t.strip()] or ["Pick one small task to start"]
+    budget = int(time_window_minutes * 0.8) if time_window_minutes else None  # keep 20% ADHD slack
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    slot = now + timedelta(minutes=(15 - now.minute % 15) % 15)
+    tasks, used = [], 0
+    for i, title in enumerate(titles[:max_tasks]):
+        duration = block
+        if budget is not None:
+            duration = min(block, budget - used)
+            if duration < 5:
+                break
+            used += duration + gap
+        tasks.append({
+            "index": i,
+            "title": title,
+            "description": title,
+            "duration_minutes": duration,
+            "time_slot": _format_slot(slot),
+            "category": "deep_work" if brain_state == "focused" and i == 1 else "admin",
+            "rationale": f"{brain_state.capitalize()} days work best in {block}-minute blocks with "
+                         f"{gap}-minute breaks between them.",
+            "priority": "high" if i == 0 else "medium",
+            "status": "pending",
+        })
+        slot += timedelta(minutes=duration + gap)
+
+    rationale = (
+        f"A simple {brain_state} day plan built from your task list while our AI planner is "
+        "temporarily unavailable. Tasks use short, fixed blocks with breaks in between."
+    )
+    plan_id = _save_plan(user_id, brain_state, tasks, rationale)
+    return {"planId": plan_id, "tasks": tasks, "overallRationale": rationale}
+
+
+def degraded_intervention(
+    user_id: str, plan_id: str, stuck_task_index: int, user_message: str | None = None
+) -> dict:
+    """Split the stuck task into a 5-minute starter plus a shorter block, trim the rest."""
+    db = get_supabase_admin()
+    plan = db.table("daily_plans").select("tasks").eq("id", plan_id).eq("user_id", user_id).limit(1).execute()
+    original = plan.data[0]["tasks"] if plan.data else []
+    remaining = original[stuck_task_index:]
+
+    restructured = []
+    if remaining:
+        stuck = remaining[0]
+        restructured.append({
+            **stuck,
+            "title": f"Just open it: {stuck['title']}",
+            "description": "Spend five minutes only getting set up. Stopping after that is fine.",
+            "duration_minutes": 5,
+            "priority": "high",
+            "rationale": "A tiny first step lowers the task-initiation barrier.",
+            "status": "pending",
+        })
+        restructured.append({
+            **stuck,
+            "duration_minutes": max(10, int(stuck.get("duration_minutes", 20)) // 2),
+            "rationale": "Shortened block so the task feels finishable.",
+            "status": "pending",
+        })
+        # Keep at most three of the remaining tasks, dropping low priority ones first
+        rest = sorted(remaining[1:], key=lambda t: t.get("priority") == "low")[:3]
+        restructured.extend({**t, "status": "pending"} for t in rest)
+    for i, task in enumerate(restructured):
+        task["index"] = stuck_task_index + i
+
+    acknowledgment = (
+        "Getting stuck here makes sense — that's your brain hitting a start-up wall, not a lack of effort."
+    )
+    reasoning = "Broke the stuck task into a 5-minute starter and a shorter block, and trimmed what's left."
+    result = db.table("interventions").insert({
+        "user_id": user_id,
+        "plan_id": plan_id,
+        "trigger_type": "stuck_button",
+        "stuck_task_index": stuck_task_index,
+        "user_message": user_message,
+        "emotional_acknowledgment": acknowledgment,
+        "original_tasks": original,
+        "restructured_tasks": restructured,
+        "agent_reasoning": reasoning,
+    }).execute()
+    return {
+        "interventionId": result.data[0]["id"],
+        "acknowledgment": acknowledgment,
+        "restructuredTasks": restructured,
+        "agentReasoning": reasoning,
+        "followupHint": None,
+    }
+
+
+def deterministic_profile(values: dict[str, int], note: str) -> dict:
+    """Dimensions, tags and summary from dimension values alone; `note` ends the templated summary."""
+    dimensions = [
+        {
+            "key": key,
+            "label": _DIMENSION_LABELS[key],
+            "value": value,
+            "insight": f"{_DIMENSION_LABELS[key]} shows up {'strongly' if value >= 50 else 'lightly'} in how you work.",
+        }
+        for key, value in values.items()
+    ]
+    top = sorted(values, key=values.get, reverse=True)[:3]
+    return {
+        "dimensions": dimensions,
+        "profileTags": [_DIMENSION_TAGS[k] for k in top],
+        "summary": f"Your strongest signals are {', '.join(_DIMENSION_LABELS[k] for k in top)}. {note}",
+    }
+
+
+def degraded_screening(user_id: str, answers: list[dict]) -> dict:
+    """Deterministic profile from the ASRS scoring rules; narrative insights are templated."""
+    score_by_index = {a["questionIndex"]: a["score"] for a in answers}
+    total = sum(a["score"] for a in answers)
+    values = {
+        key: round(sum(score_by_index.get(qi, 0) for qi in q_indices) / 8 * 100)
+        for key, q_indices in DIMENSION_MAP.items()
+    }
+    profile = deterministic_profile(
+        values, "A fuller narrative portrait will be added once our AI analyst is available again."
+    )
+    dimensions, tags, summary = profile["dimensions"], profile["profileTags"], profile["summary"]
+
+    db = get_supabase_admin()
+    result = db.table("cognitive_profiles").insert({
+        "user_id": user_id,
+        "dimensions": dimensions,
+        "profile_tags": tags,
+        "summary": summary,
+        "asrs_total_score": total,
+        "is_positive_screen": total >= 14,
+    }).execute()
+    return {
+        "profileId": result.data[0]["id"],
+        "dimensions": dimensions,
+        "profileTags": tags,
+        "summary": summary,
+        "asrsTotalScore": total,
+        "isPositiveScreen": total >= 14,
+    }
@@ -0,0 +1,82 @@
+"""Hedged execution: start a backup path when the primary is slow, first valid result wins."""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+_hedges_started = metrics.counter("hedge_started_total", "Hedged calls where the backup path was launched")
+_wins = metrics.counter("hedge_wins_total", "Hedged calls by winning path")
+_latency = metrics.histogram("hedge_latency_seconds", "End-to-end latency of hedged calls by winning path")
+_abandoned = metrics.histogram(
+    "hedge_primary_abandoned_seconds",
+    "How long the primary had been running when a faster backup result replaced it",
+)
+
+
+class HedgeFailed(Exception):
+    """Neither path produced a valid result."""
+
+
+async def run_hedged(
+    name: str,
+    primary: tuple[str, Callable[[], Awaitable[dict]]],
+    backup: tuple[str, Callable[[], Awaitable[dict]]],
+    budget_seconds: float,
+    is_valid: Callable[[dict], bool],
+) -> tuple[dict, str]:
+    """Run primary; if it hasn't produced a valid result within budget_seconds, start backup too.
+
+    Returns (result, winning path label). The losing path's task is cancelled and awaited.
+    """
+    start = time.monotonic()
+    primary_label, primary_fn = primary
+    backup_label, backup_fn = backup
+    tasks: dict[asyncio.Task, str] = {asyncio.create_task(primary_fn()): primary_label}
+    backup_started = False
+    last_error: BaseException | None = None
+
+    def _start_backup():
+        nonlocal backup_started
+        backup_started = True
+        _hedges_started.inc(call=name)
+        tasks[asyncio.create_task(backup_fn())] = backup_label
+
+    try:
+        while tasks:
+            timeout = None if backup_started else max(0.0, budget_seconds - (time.monotonic() - start))
+            done, _ = await asyncio.wait(tasks.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.info(f"{name}: {primary_label} exceeded {budget_seconds}s budget, starting {backup_label}")
+                _start_backup()
+                continue
+
+            for task in done:
+                label = tasks.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.warning(f"{name}: {label} path failed: {e}")
+                    last_error = e
+                    continue
+                if is_valid(result):
+                    elapsed = time.monotonic() - start
+                    _wins.inc(call=name, path=label, hedged=str(backup_started).lower())
+                    _latency.observe(elapsed, call=name, path=label)
+                    if label == backup_label and tasks:
+                        _abandoned.observe(elapsed, call=name)
+                    return result, label
+                logger.warning(f"{name}: {label} path returned an invalid result")
+
+            if not backup_started:
+                # Primary finished without a usable result — no point waiting out the budget
+                _start_backup()
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let the loser unwind, so its crew has seen the cancellation by the time the caller acts on the result
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    raise HedgeFailed(f"{name}: no valid result from {primary_label} or {backup_label}") from last_error
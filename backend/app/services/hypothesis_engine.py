@@ -0,0 +1,251 @@
+"""Rule engine that keeps hypothesis cards honest without another LLM run.
+
+Each card carries a compiled `condition` (from the pre-analysis finding it was
+based on, or compiled from the prediction text for older cards). Every new
+checkin is one trial: the condition either does not apply that day, holds, or
+is violated. Cards keep running counts in `evaluation` and a date cursor in
+`evaluated_through`, so each evaluation only reads checkins after the cursor.
+
+Condition types:
+  co_move    x and y land on the same (direction=1) or opposite (-1) side of
+             their thresholds; x may be lagged by one checkin
+  group      on days matching `when`, y lands above (1) or below (-1) its threshold
+  task_rate  tasks matching column == eq finish more (1) or less (-1) often than
+             the other tasks of the same day
+"""
+import logging
+import math
+import re
+from datetime import datetime, timezone
+from app.database import get_supabase_admin
+from app.services.pattern_analysis import day_features
+
+logger = logging.getLogger(__name__)
+
+MIN_TRIALS = 3
+DECISIVE_TRIALS = 5
+CONFIRM_RATE = 0.7
+DISPROVE_RATE = 0.3
+EVALUATED_STATUSES = ("active", "evolving", "confirmed")
+
+# Legacy cards: fixed midpoints stand in for the user's medians
+_DEFAULT_THRESHOLDS = {"mood": 5.5, "energy": 1.0, "completion": 0.5, "stuck": 0.5}
+_SERIES_PATTERNS = {
+    "stuck": re.compile(r"stuck|intervention", re.IGNORECASE),
+    "energy": re.compile(r"energy", re.IGNORECASE),
+    "mood": re.compile(r"mood", re.IGNORECASE),
+    "completion": re.compile(r"complet|output|tasks? done|productiv", re.IGNORECASE),
+}
+_DOWN = re.compile(r"\b(low|lower|fewer|less|drop|drops|worse|decreas\w*|dip\w*)\b|-\d", re.IGNORECASE)
+_UP = re.compile(r"\b(high|higher|more|better|improv\w*|increas\w*|boost\w*)\b|\+\d", re.IGNORECASE)
+_NEXT_DAY = re.compile(r"next day|following day|tomorrow|the day after", re.IGNORECASE)
+_SPLIT = re.compile(r",? (?:then|the next day|leads? to|predicts?|correlates? with|is likely|will)\b", re.IGNORECASE)
+
+
+# ── Compilation ──
+def _series_in(text: str) -> str | None:
+    return next((name for name, pattern in _SERIES_PATTERNS.items() if pattern.search(text)), None)
+
+
+def _level(text: str) -> int:
+    up, down = len(_UP.findall(text)), len(_DOWN.findall(text))
+    return 1 if up > down else -1 if down > up else 0
+
+
+def compile_prediction(prediction: str) -> dict | None:
+    """Best-effort compile of an "if X then Y" prediction into a co_move condition."""
+    parts = _SPLIT.split(prediction, maxsplit=1)
+    if len(parts) != 2:
+        return None
+    antecedent, consequent = parts
+    x, y = _series_in(antecedent), _series_in(consequent)
+    if x is None or y is None:
+        return None
+    direction = (_level(antecedent) or 1) * (_level(consequent) or 1)
+    lag = 1 if _NEXT_DAY.search(prediction) else 0
+    return {
+        "type": "co_move",
+        "x": {"series": x, "lag": lag, "threshold": _DEFAULT_THRESHOLDS[x]},
+        "y": {"series": y, "lag": 0, "threshold": _DEFAULT_THRESHOLDS[y]},
+        "direction": direction,
+    }
+
+
+# ── Evaluation ──
+def _value(side: dict, today: dict, prev: dict | None):
+    day = prev if side.get("lag") else today
+    return None if day is None else day[side["series"]]
+
+
+def _sign(value: float) -> int:
+    return (value > 0) - (value < 0)
+
+
+def evaluate_day(condition: dict, today: dict, prev: dict | None) -> bool | None:
+    """True/False when the condition applied today and held/failed; None when it did not apply."""
+    kind, direction = condition["type"], condition["direction"]
+    if kind == "co_move":
+        x, y = _value(condition["x"], today, prev), _value(condition["y"], today, prev)
+        if x is None or y is None:
+            return None
+        dx, dy = _sign(x - condition["x"]["threshold"]), _sign(y - condition["y"]["threshold"])
+        if dx == 0 or dy == 0:
+            return None
+        return dx * dy == direction
+    if kind == "group":
+        when = condition["when"]
+        actual = today[when["series"]]
+        matches = actual > when["gt"] if "gt" in when else actual == when["eq"]
+        y = _value(condition["y"], today, prev)
+        if not matches or y is None:
+            return None
+        dy = _sign(y - condition["y"]["threshold"])
+        return None if dy == 0 else dy == direction
+    if kind == "task_rate":
+        column, value = condition["column"], condition["eq"]
+        inside = [t["done"] for t in today["tasks"] if t[column] == value]
+        outside = [t["done"] for t in today["tasks"] if t[column] != value]
+        if not inside or not outside:
+            return None
+        diff = _sign(sum(inside) / len(inside) - sum(outside) / len(outside))
+        return None if diff == 0 else diff == direction
+    return None
+
+
+def _wilson_lower(hits: int, trials: int, z: float = 1.64) -> float:
+    if not trials:
+        return 0.0
+    rate = hits / trials
+    centre = rate + z * z / (2 * trials)
+    margin = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials))
+    return (centre - margin) / (1 + z * z / trials)
+
+
+def judge(hits: int, trials: int, status: str, confidence: str) -> tuple[str, str]:
+    """(status, confidence) after `trials` out-of-sample checks, `hits` of which held."""
+    if trials < MIN_TRIALS:
+        return status, confidence
+    rate = hits / trials
+    if trials >= DECISIVE_TRIALS and rate >= CONFIRM_RATE:
+        status = "confirmed"
+    elif trials >= DECISIVE_TRIALS and rate <= DISPROVE_RATE:
+        status = "disproved"
+    elif DISPROVE_RATE < rate < CONFIRM_RATE:
+        status = "evolving"
+    lower = _wilson_lower(hits, trials)
+    confidence = "high" if lower >= 0.6 else "medium" if lower >= 0.4 else "low"
+    return status, confidence
+
+
+def advance(card: dict, days: list[tuple[str, dict]]) -> dict | None:
+    """Feed the card every day after its cursor. Returns the column update, or None if nothing changed."""
+    cursor = card.get("evaluated_through") or str(card["created_at"])[:10]
+    state = dict(card.get("evaluation") or {})
+    trials, hits = state.get("trials", 0), state.get("hits", 0)
+    prev, last = None, None
+    for day, features in days:
+        if day <= cursor:
+            prev = features  # the cursor day only serves as "yesterday" for lagged conditions
+            continue
+        outcome = evaluate_day(card["condition"], features, prev)
+        if outcome is not None:
+            trials += 1
+            hits += outcome
+        prev, last = features, day
+    if last is None:
+        return None
+    status, confidence = judge(hits, trials, card["status"], card["confidence"])
+    return {
+        "evaluation": {**state, "trials": trials, "hits": hits},
+        "evaluated_through": last,
+        "status": status,
+        "confidence": confidence,
+    }
+
+
+def _load_days(user_id: str, since: str) -> list[tuple[str, dict]]:
+    """(checkin_date, features) for checkins on or after `since`, oldest first."""
+    db = get_supabase_admin()
+    checkins = (
+        db.table("checkins")
+        .select("checkin_date, plan_id, mood_score, energy_level, tasks_completed, tasks_total")
+        .eq("user_id", user_id)
+        .gte("checkin_date", since)
+        .order("checkin_date", desc=False)
+        .execute()
+    ).data
+    if not checkins:
+        return []
+    plans = (
+        db.table("daily_plans")
+        .select("id, plan_date, brain_state, tasks")
+        .eq("user_id", user_id)
+        .gte("plan_date", since)
+        .order("created_at", desc=False)
+        .execute()
+    ).data
+    interventions = (
+        db.table("interventions")
+        .select("plan_id, created_at")
+        .eq("user_id", user_id)
+        .gte("created_at", since)
+        .execute()
+    ).data
+    plan_by_id = {p["id"]: p for p in plans}
+    plan_by_date = {str(p["plan_date"]): p for p in plans}
+    stuck: dict[str, int] = {}
+    for intv in interventions:
+        plan = plan_by_id.get(intv.get("plan_id"))
+        day = str(plan["plan_date"]) if plan else str(intv["created_at"])[:10]
+        stuck[day] = stuck.get(day, 0) + 1
+    return [
+        (
+            str(c["checkin_date"]),
+            day_features(c, plan_by_id.get(c.get("plan_id")) or plan_by_date.get(str(c["checkin_date"])),
+                         stuck.get(str(c["checkin_date"]), 0)),
+        )
+        for c in checkins
+    ]
+
+
+def evaluate_user(user_id: str, latest_checkin_date: str | None = None) -> int:
+    """Re-check the user's open cards against checkins after their cursors. Returns cards updated."""
+    db = get_supabase_admin()
+    cards = (
+        db.table("hypothesis_cards")
+        .select("id, prediction, condition, evaluation, evaluated_through, status, confidence, created_at")
+        .eq("user_id", user_id)
+        .in_("status", list(EVALUATED_STATUSES))
+        .is_("archived_at", "null")
+        .execute()
+    ).data
+
+    now = datetime.now(timezone.utc).isoformat()
+    for card in cards:
+        if card.get("condition") is None and (card.get("evaluation") or {}).get("compiled") is None:
+            # Card predates compiled conditions: compile once and remember the outcome
+            card["condition"] = compile_prediction(card["prediction"])
+            card["evaluation"] = {**(card.get("evaluation") or {}), "compiled": card["condition"] is not None}
+            db.table("hypothesis_cards").update({
+                "condition": card["condition"], "evaluation": card["evaluation"], "updated_at": now,
+            }).eq("id", card["id"]).execute()
+    cards = [c for c in cards if c.get("condition")]
+    if not cards:
+        return 0
+
+    cursors = [c.get("evaluated_through") or str(c["created_at"])[:10] for c in cards]
+    since = min(cursors)
+    if latest_checkin_date is not None and since >= str(latest_checkin_date):
+        return 0  # nothing new since the last evaluation
+    days = _load_days(user_id, since)
+
+    updated = 0
+    for card in cards:
+        update = advance(card, days)
+        if update is None:
+            continue
+        if update["status"] != card["status"]:
+            logger.info(f"Hypothesis {card['id']} {card['status']} -> {update['status']}")
+        db.table("hypothesis_cards").update({**update, "updated_at": now}).eq("id", card["id"]).execute()
+        updated += 1
+    return updated
@@ -0,0 +1,190 @@
+"""Single write path for hypothesis cards: near-duplicate merging and a capped active set.
+
+A new card that restates an active one (same compiled condition, or lexically
+similar text) is merged into it: evidence is refreshed and the card's
+detection count and last_detected_at are bumped instead of inserting a row.
+Disproved cards are never merge targets, so a new significant finding that
+resembles one is inserted as a card of its own.
+After every write each user keeps at most `hypothesis_max_active_cards`
+active cards, ranked by status, confidence, out-of-sample hit rate and
+recency; the rest are archived (archived_at set) and drop out of the
+dashboard and evaluation queries.
+"""
+import re
+from datetime import datetime, timezone
+from app.config import get_settings
+from app.database import IN_BATCH, get_supabase_admin, select_in
+from app.services import metrics
+
+_written = metrics.counter("hypothesis_cards_written_total", "New hypothesis cards by outcome (inserted/merged)")
+_archived = metrics.counter("hypothesis_cards_archived_total", "Hypothesis cards archived by the active-set cap")
+
+MAX_MERGED_EVIDENCE = 10
+USERS_PER_CHUNK = 200
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by day days for from has have if in is it its of on or that the their then "
+    "there these this to tend tends when which while will with you your user users".split()
+)
+_STATUS_RANK = {"confirmed": 3, "evolving": 2, "active": 1, "disproved": 0}
+_CONFIDENCE_RANK = {"high": 2, "medium": 1, "low": 0}
+_MERGE_COLUMNS = (
+    "id", "user_id", "pattern_detected", "prediction", "confidence", "status", "supporting_evidence",
+    "condition", "evaluation", "last_detected_at", "updated_at",
+)
+_ACTIVE_COLUMNS = (
+    "id, user_id, pattern_detected, prediction, confidence, status, supporting_evidence, "
+    "condition, evaluation, created_at, last_detected_at"
+)
+
+
+# ── Similarity ──
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def _tokens(card: dict) -> frozenset[str]:
+    text = f"{card.get('pattern_detected', '')} {card.get('prediction', '')}".lower()
+    return frozenset(_stem(w) for w in re.findall(r"[a-z]+", text) if w not in _STOPWORDS)
+
+
+def _condition_key(condition: dict | None) -> tuple | None:
+    """Structure of a condition without the user-specific thresholds."""
+    if not condition:
+        return None
+    kind = condition["type"]
+    if kind == "co_move":
+        x, y = condition["x"], condition["y"]
+        return kind, x["series"], x["lag"], y["series"], y["lag"], condition["direction"]
+    if kind == "group":
+        y = condition["y"]
+        return kind, tuple(sorted(condition["when"].items())), y["series"], y["lag"], condition["direction"]
+    return kind, condition.get("column"), condition.get("eq"), condition["direction"]
+
+
+def similarity(a: dict, b: dict) -> float:
+    """1.0 for the same compiled condition, otherwise Jaccard similarity of stemmed content words."""
+    key_a, key_b = _condition_key(a.get("condition")), _condition_key(b.get("condition"))
+    if key_a is not None and key_a == key_b:
+        return 1.0
+    ta, tb = _tokens(a), _tokens(b)
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+
+def find_duplicate(card: dict, candidates: list[dict], threshold: float) -> dict | None:
+    best, best_score = None, threshold
+    for candidate in candidates:
+        score = similarity(card, candidate)
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best
+
+
+# ── Ranking ──
+def _rank_key(card: dict) -> tuple:
+    evaluation = card.get("evaluation") or {}
+    trials = evaluation.get("trials", 0)
+    hit_rate = evaluation.get("hits", 0) / trials if trials else 0.5
+    return (
+        _STATUS_RANK.get(card["status"], 0),
+        _CONFIDENCE_RANK.get(card["confidence"], 0),
+        hit_rate,
+        str(card.get("last_detected_at") or card.get("created_at") or ""),
+    )
+
+
+def over_cap(cards: list[dict], cap: int) -> list[dict]:
+    """Cards that fall outside the top `cap` by rank."""
+    return sorted(cards, key=_rank_key, reverse=True)[cap:]
+
+
+# ── Writes ──
+def _merge(existing: dict, new: dict, now: str) -> dict:
+    new_evidence = new.get("supporting_evidence") or []
+    seen = {e.get("detail") for e in new_evidence}
+    evidence = new_evidence + [e for e in existing.get("supporting_evidence") or [] if e.get("detail") not in seen]
+    evaluation = existing.get("evaluation") or {}
+    confidence = max(existing["confidence"], new["confidence"], key=lambda c: _CONFIDENCE_RANK.get(c, 0))
+    return {
+        "supporting_evidence": evidence[:MAX_MERGED_EVIDENCE],
+        "confidence": confidence,
+        "condition": existing.get("condition") or new.get("condition"),
+        "evaluation": {**evaluation, "detections": evaluation.get("detections", 1) + 1},
+        "last_detected_at": now,
+        "updated_at": now,
+    }
+
+
+def store_cards(rows: list[dict]) -> list[dict]:
+    """Insert or merge new hypothesis_cards rows (any number of users) and enforce the active cap.
+
+    Returns the stored rows: freshly inserted ones and the merged versions of existing ones.
+    """
+    by_user: dict[str, list[dict]] = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(row)
+    user_ids = list(by_user)
+    stored = []
+    for start in range(0, len(user_ids), USERS_PER_CHUNK):
+        chunk = user_ids[start:start + USERS_PER_CHUNK]
+        stored.extend(_store_chunk({uid: by_user[uid] for uid in chunk}))
+    return stored
+
+
+def _store_chunk(rows_by_user: dict[str, list[dict]]) -> list[dict]:
+    settings = get_settings()
+    db = get_supabase_admin()
+    now = datetime.now(timezone.utc).isoformat()
+    active_rows = select_in(
+        lambda: db.table("hypothesis_cards")
+        .select(_ACTIVE_COLUMNS)
+        .is_("archived_at", "null")
+        .order("user_id").order("id"),
+        "user_id", list(rows_by_user),
+    )
+    active: dict[str, list[dict]] = {uid: [] for uid in rows_by_user}
+    for card in active_rows:
+        active[card["user_id"]].append(card)
+
+    inserts, merged = [], {}
+    for user_id, rows in rows_by_user.items():
+        candidates = [c for c in active[user_id] if c["status"] != "disproved"]
+        pending: list[dict] = []
+        for row in rows:
+            row = {**row, "last_detected_at": now}
+            match = find_duplicate(row, candidates + pending, settings.hypothesis_duplicate_threshold)
+            if match is None:
+                pending.append(row)
+            elif "id" in match:
+                match.update(_merge(match, row, now))
+                merged[match["id"]] = match
+            else:
+                match.update({k: v for k, v in _merge(match, row, now).items() if k != "updated_at"})
+        inserts.extend(pending)
+
+    if merged:
+        # One upsert for all merged cards; NOT NULL columns ride along unchanged
+        db.table("hypothesis_cards").upsert(
+            [{k: card[k] for k in _MERGE_COLUMNS} for card in merged.values()], on_conflict="id",
+        ).execute()
+    inserted = db.table("hypothesis_cards").insert(inserts).execute().data if inserts else []
+    _written.inc(len(inserted), outcome="inserted")
+    _written.inc(len(merged), outcome="merged")
+
+    for card in inserted:
+        active[card["user_id"]].append(card)
+    archive_ids = [
+        card["id"]
+        for cards in active.values()
+        for card in over_cap(cards, settings.hypothesis_max_active_cards)
+    ]
+    for start in range(0, len(archive_ids), IN_BATCH):
+        db.table("hypothesis_cards").update({"archived_at": now}).in_(
+            "id", archive_ids[start:start + IN_BATCH]
+        ).execute()
+    _archived.inc(len(archive_ids))
+    archived = set(archive_ids)
+    return [c for c in inserted + list(merged.values()) if c["id"] not in archived]
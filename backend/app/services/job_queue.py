@@ -0,0 +1,123 @@
+"""Durable background job queue backed by the agent_jobs table.
+
+Jobs survive process restarts, are deduplicated by key, retried with backoff,
+and re-claimed when a worker dies mid-job (visibility timeout). A dedupe key
+is held while its job is queued or running. After that, only a success
+counts, for `succeeded_ttl` seconds or forever; a failed job never blocks a
+retry. See supabase/schema.sql (PHASE 6, PHASE 16) for the table and the
+enqueue/claim functions.
+"""
+from datetime import datetime, timedelta, timezone
+from app.database import get_supabase_admin
+
+PATTERN_DETECTION = "pattern_detection"
+PATTERN_BATCH = "pattern_batch"
+MOMENTUM_BACKFILL = "momentum_backfill"
+COHORT_MOMENTUM = "cohort_momentum"
+SCREENING_NARRATIVES = "screening_narratives"
+
+
+def pattern_dedupe_key(user_id: str) -> str:
+    """One live pattern-detection job per user (enqueue with succeeded_ttl = the refresh window)."""
+    return f"{PATTERN_DETECTION}:{user_id}"
+
+
+def nightly_dedupe_key(job_type: str, day: str) -> str:
+    """One fleet-wide job per UTC day, however many workers try to schedule it."""
+    return f"{job_type}:{day}"
+
+
+def enqueue(
+    job_type: str,
+    user_id: str | None,
+    payload: dict | None = None,
+    dedupe_key: str | None = None,
+    max_attempts: int = 3,
+    succeeded_ttl: int | None = None,
+) -> dict:
+    """Queue a job, or return the job already holding dedupe_key.
+
+    A queued or running job holds its key. So does a succeeded one that finished
+    within succeeded_ttl seconds (None: any succeeded job, i.e. once per key).
+    """
+    db = get_supabase_admin()
+    result = db.rpc("enqueue_agent_job", {
+        "p_job_type": job_type,
+        "p_user_id": user_id,
+        "p_payload": payload or {},
+        "p_dedupe_key": dedupe_key,
+        "p_max_attempts": max_attempts,
+        "p_succeeded_ttl_seconds": succeeded_ttl,
+    }).execute()
+    return result.data[0]
+
+
+def claim(worker_id: str, job_types: list[str], visibility_seconds: int) -> dict | None:
+    db = get_supabase_admin()
+    result = db.rpc("claim_agent_job", {
+        "p_worker_id": worker_id,
+        "p_job_types": job_types,
+        "p_visibility_seconds": visibility_seconds,
+    }).execute()
+    return result.data[0] if result.data else None
+
+
+def extend_lease(job: dict, worker_id: str, visibility_seconds: int):
+    """Heartbeat for long jobs so they are not re-claimed while still running."""
+    db = get_supabase_admin()
+    locked_until = datetime.now(timezone.utc) + timedelta(seconds=visibility_seconds)
+    db.table("agent_jobs").update({
+        "locked_until": locked_until.isoformat(),
+    }).eq("id", job["id"]).eq("locked_by", worker_id).eq("status", "running").execute()
+
+
+def complete(job: dict, worker_id: str, result: dict | None = None):
+    db = get_supabase_admin()
+    now = datetime.now(timezone.utc).isoformat()
+    db.table("agent_jobs").update({
+        "status": "succeeded",
+        "result": result or {},
+        "locked_until": None,
+        "finished_at": now,
+        "updated_at": now,
+    }).eq("id", job["id"]).eq("locked_by", worker_id).execute()
+
+
+def fail(job: dict, worker_id: str, error: str, backoff_seconds: float = 30.0):
+    """Record a failed attempt: requeue with exponential backoff, or mark failed when out of attempts."""
+    db = get_supabase_admin()
+    now = datetime.now(timezone.utc)
+    update = {"last_error": error[:2000], "locked_until": None, "updated_at": now.isoformat()}
+    if job["attempts"] >= job["max_attempts"]:
+        update.update({"status": "failed", "finished_at": now.isoformat()})
+    else:
+        delay = backoff_seconds * 2 ** (job["attempts"] - 1)
+        update.update({"status": "queued", "run_after": (now + timedelta(seconds=delay)).isoformat()})
+    db.table("agent_jobs").update(update).eq("id", job["id"]).eq("locked_by", worker_id).execute()
+
+
+def release(job: dict, worker_id: str, delay_seconds: float):
+    """Put a claimed job back without counting the attempt (e.g. the agent pool was full)."""
+    db = get_supabase_admin()
+    now = datetime.now(timezone.utc)
+    db.table("agent_jobs").update({
+        "status": "queued",
+        "attempts": max(0, job["attempts"] - 1),
+        "run_after": (now + timedelta(seconds=delay_seconds)).isoformat(),
+        "locked_until": None,
+        "updated_at": now.isoformat(),
+    }).eq("id", job["id"]).eq("locked_by", worker_id).execute()
+
+
+def get_job(job_id: str) -> dict | None:
+    db = get_supabase_admin()
+    result = db.table("agent_jobs").select("*").eq("id", job_id).limit(1).execute()
+    return result.data[0] if result.data else None
+
+
+def list_jobs(user_id: str, job_type: str | None = None, limit: int = 20) -> list[dict]:
+    db = get_supabase_admin()
+    query = db.table("agent_jobs").select("*").eq("user_id", user_id)
+    if job_type:
+        query = query.eq("job_type", job_type)
+    return query.order("created_at", desc=True).limit(limit).execute().data
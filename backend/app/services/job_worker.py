@@ -0,0 +1,178 @@
+"""Worker loop for the durable agent job queue.
+
+Runs standalone (`python worker.py`) or embedded in the API process
+(JOB_WORKER_EMBEDDED=true). Several workers can run side by side: jobs are
+claimed with SKIP LOCKED, and a lease heartbeat keeps long crews from being
+picked up twice.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+from app.config import get_settings
+from app.services import job_queue, metrics, tracing
+from app.services.agent_executor import AgentQueueFull
+from app.services.agent_policy import get_policy, run_agent
+
+logger = logging.getLogger(__name__)
+
+_processed = metrics.counter("job_worker_jobs_total", "Queued jobs processed by type and outcome")
+_duration = metrics.histogram("job_worker_job_seconds", "Queued job run time by type")
+
+SCHEDULER_INTERVAL_SECONDS = 300
+
+JobHandler = Callable[[dict], Awaitable[dict]]
+
+
+# ── Handlers ──
+async def _pattern_detection(job: dict) -> dict:
+    from app.agents.pattern_agent import run_pattern_detection
+    user_id = job["user_id"]
+    result = await run_agent(get_policy("pattern"), run_pattern_detection, user_id, user_id=user_id)
+    return {"cards": len(result.get("cards", []))}
+
+
+async def _pattern_batch(job: dict) -> dict:
+    from app.services.pattern_batch import run_pattern_batch
+    # Mostly waiting on the batch API; keep it off the agent pool so crews are not starved
+    return await asyncio.to_thread(run_pattern_batch)
+
+
+async def _momentum_backfill(job: dict) -> dict:
+    from app.services.momentum_service import backfill_momentum
+    return await asyncio.to_thread(backfill_momentum)
+
+
+async def _cohort_momentum(job: dict) -> dict:
+    from app.services.cohort_momentum import run_cohort_momentum
+    return await asyncio.to_thread(run_cohort_momentum)
+
+
+async def _screening_narratives(job: dict) -> dict:
+    from app.services.screening_import import run_screening_narratives
+    return await asyncio.to_thread(run_screening_narratives, job["payload"]["profile_ids"])
+
+
+HANDLERS: dict[str, JobHandler] = {
+    job_queue.PATTERN_DETECTION: _pattern_detection,
+    job_queue.PATTERN_BATCH: _pattern_batch,
+    job_queue.MOMENTUM_BACKFILL: _momentum_backfill,
+    job_queue.COHORT_MOMENTUM: _cohort_momentum,
+    job_queue.SCREENING_NARRATIVES: _screening_narratives,
+}
+
+
+def _nightly_jobs() -> dict[str, int]:
+    """Fleet-wide job type -> UTC hour after which it is enqueued once a day."""
+    settings = get_settings()
+    jobs = {}
+    if settings.pattern_batch_enabled:
+        jobs[job_queue.PATTERN_BATCH] = settings.pattern_batch_hour_utc
+    if settings.cohort_momentum_enabled:
+        jobs[job_queue.COHORT_MOMENTUM] = settings.cohort_momentum_hour_utc
+    return jobs
+
+
+class JobWorker:
+    def __init__(self, handlers: dict[str, JobHandler] | None = None):
+        settings = get_settings()
+        self.handlers = handlers or HANDLERS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.poll_interval = settings.job_worker_poll_seconds
+        self.visibility_seconds = settings.job_visibility_timeout_seconds
+        self._slots = asyncio.Semaphore(settings.job_worker_concurrency)
+        self._stopping = asyncio.Event()
+        self._running: set[asyncio.Task] = set()
+        self._scheduled_days: dict[str, str] = {}
+        self._scheduler: asyncio.Task | None = None
+
+    async def run_forever(self):
+        logger.info(f"Job worker {self.worker_id} started for {sorted(self.handlers)}")
+        nightly = {t: hour for t, hour in _nightly_jobs().items() if t in self.handlers}
+        if nightly:
+            self._scheduler = asyncio.create_task(self._schedule_nightly(nightly))
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            try:
+                job = await asyncio.to_thread(
+                    job_queue.claim, self.worker_id, list(self.handlers), self.visibility_seconds
+                )
+            except Exception as e:
+                logger.warning(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._slots.release()
+                await self._sleep(self.poll_interval)
+                continue
+            task = asyncio.create_task(self._process(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def stop(self):
+        self._stopping.set()
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _schedule_nightly(self, jobs: dict[str, int]):
+        """Enqueue each fleet-wide job once per UTC day after its configured hour."""
+        while not self._stopping.is_set():
+            now = datetime.now(timezone.utc)
+            day = now.date().isoformat()
+            for job_type, hour in jobs.items():
+                if now.hour < hour or self._scheduled_days.get(job_type) == day:
+                    continue
+                try:
+                    await asyncio.to_thread(
+                        job_queue.enqueue, job_type, None,
+                        dedupe_key=job_queue.nightly_dedupe_key(job_type, day),
+                    )
+                    self._scheduled_days[job_type] = day
+                except Exception as e:
+                    logger.warning(f"Could not schedule nightly {job_type}: {e}")
+            await self._sleep(SCHEDULER_INTERVAL_SECONDS)
+
+    async def _heartbeat(self, job: dict):
+        while True:
+            await asyncio.sleep(self.visibility_seconds / 3)
+            try:
+                await asyncio.to_thread(job_queue.extend_lease, job, self.worker_id, self.visibility_seconds)
+            except Exception as e:
+                logger.warning(f"Lease heartbeat for job {job['id']} failed: {e}")
+
+    async def _process(self, job: dict):
+        job_type = job["job_type"]
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            with tracing.span(f"job {job_type}", **{"attune.job_id": job["id"], "attune.job_attempt": job["attempts"]}):
+                result = await self.handlers[job_type](job)
+            await asyncio.to_thread(job_queue.complete, job, self.worker_id, result)
+            _processed.inc(job_type=job_type, outcome="succeeded")
+        except AgentQueueFull as e:
+            # Interactive requests have the pool; try again shortly without burning an attempt
+            await asyncio.to_thread(job_queue.release, job, self.worker_id, e.retry_after)
+            _processed.inc(job_type=job_type, outcome="deferred")
+        except asyncio.CancelledError:
+            # Shutting down: the lease expires and another worker picks the job up
+            raise
+        except Exception as e:
+            logger.warning(f"Job {job['id']} ({job_type}) attempt {job['attempts']} failed: {e}")
+            await asyncio.to_thread(job_queue.fail, job, self.worker_id, str(e))
+            _processed.inc(job_type=job_type, outcome="failed")
+        finally:
+            heartbeat.cancel()
+            _duration.observe(loop.time() - start, job_type=job_type)
+            self._slots.release()
@@ -0,0 +1,146 @@
+"""Lightweight in-process metrics registry (counters + histograms).
+
+Metrics are keyed by name and an optional set of string labels. Everything is
+guarded by a single lock so agent worker threads can record safely. The
+registry is exposed as JSON (snapshot) and in the Prometheus text format
+(render_prometheus).
+"""
+import threading
+from bisect import bisect_left
+
+_lock = threading.Lock()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with _lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> list[dict]:
+        with _lock:
+            return [{"labels": dict(k), "value": v} for k, v in self._values.items()]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., +Inf count], sum, count
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        idx = bisect_left(self.buckets, value)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = entry
+            entry[0][idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self) -> list[dict]:
+        with _lock:
+            out = []
+            for key, (counts, total, n) in self._values.items():
+                out.append({
+                    "labels": dict(key),
+                    "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+                    "sum": round(total, 6),
+                    "count": n,
+                })
+            return out
+
+
+_registry: dict[str, Counter | Histogram] = {}
+
+
+def counter(name: str, help_text: str) -> Counter:
+    """Get or create a counter by name."""
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Counter(name, help_text)
+        return metric
+
+
+def histogram(name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a histogram by name."""
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Histogram(name, help_text, buckets)
+        return metric
+
+
+def snapshot() -> dict:
+    """Return a JSON-serializable view of every registered metric."""
+    with _lock:
+        metrics = list(_registry.values())
+    return {
+        m.name: {
+            "type": "counter" if isinstance(m, Counter) else "histogram",
+            "help": m.help,
+            "values": m.snapshot(),
+        }
+        for m in metrics
+    }
+
+
+# ── Prometheus text exposition ──
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text format (version 0.0.4)."""
+    with _lock:
+        metrics = list(_registry.values())
+        values = {m.name: {k: (v if isinstance(m, Counter) else [list(v[0]), v[1], v[2]])
+                           for k, v in m._values.items()} for m in metrics}
+    lines = []
+    for m in metrics:
+        kind = "counter" if isinstance(m, Counter) else "histogram"
+        lines.append(f"# HELP {m.name} {_escape(m.help)}")
+        lines.append(f"# TYPE {m.name} {kind}")
+        for key, value in values[m.name].items():
+            if kind == "counter":
+                lines.append(f"{m.name}{_labels(key)} {_number(value)}")
+                continue
+            counts, total, n = value
+            cumulative = 0
+            for bound, count in zip([*map(_number, m.buckets), "+Inf"], counts):
+                cumulative += count
+                lines.append(f"{m.name}_bucket{_labels(key, (('le', bound),))} {cumulative}")
+            lines.append(f"{m.name}_sum{_labels(key)} {_number(round(total, 6))}")
+            lines.append(f"{m.name}_count{_labels(key)} {n}")
+    return "\n".join(lines) + "\n"
@@ -1,29 +1,218 @@
+"""Momentum score: recency-weighted mood + completion over the last 14 checkins.
+
+The score is maintained incrementally. Each user has a momentum_state row
+holding the composites of their last WINDOW checkins and a running sum; a new
+checkin pushes one composite (and evicts the oldest) in constant time, and
+the resulting score/delta is stamped on the checkin row as daily history.
+The dashboard only reads the state. backfill_momentum() replays existing
+checkins for users that predate this; rebuild_history() does the same for
+one user whose checkins were written in bulk (demo seeding).
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from app.database import get_supabase_admin, select_in
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 14
+RECENT = 3  # the last RECENT checkins count double and drive the delta
+MAX_UPDATE_ATTEMPTS = 3
+BACKFILL_PAGE_SIZE = 200
+
+
+def composite(checkin: dict) -> float:
+    """60% mood (scaled to 100) + 40% task completion."""
+    total = checkin["tasks_total"] or 1
+    completion = (checkin["tasks_completed"] / total) * 100
+    return (checkin["mood_score"] * 10) * 0.6 + completion * 0.4
+
+
+@dataclass
+class MomentumState:
+    composites: list[float] = field(default_factory=list)
+    running_sum: float = 0.0
+
+    def push(self, value: float):
+        self.composites.append(value)
+        self.running_sum += value
+        if len(self.composites) > WINDOW:
+            self.running_sum -= self.composites.pop(0)
+
+    def momentum(self) -> dict:
+        n = len(self.composites)
+        if not n:
+            return {"score": 0, "delta": 0}
+        recent = self.composites[-RECENT:]
+        # Weighted: last 3 days count 2x
+        weighted_score = (self.running_sum + sum(recent)) / (n + len(recent))
+        # Delta: compare last 3 days avg vs first 3 days avg
+        delta = round(sum(recent) / RECENT - sum(self.composites[:RECENT]) / RECENT) if n >= 2 * RECENT else 0
+        return {"score": round(weighted_score), "delta": delta}
+
+    @classmethod
+    def from_checkins(cls, checkins: list[dict]) -> "MomentumState":
+        """State after the given checkins (oldest first)."""
+        state = cls()
+        for c in checkins[-WINDOW:]:
+            state.push(composite(c))
+        return state
+
+
 def calculate_momentum(checkins: list[dict]) -> dict:
-    """Calculate momentum score from checkin history.
+    """Calculate momentum score from checkin history (oldest first).
     Uses weighted average of mood + completion with exponential recency."""
+    return MomentumState.from_checkins(checkins).momentum()
+
+
+# ── Persistence ──
+def _state_row(user_id: str, state: MomentumState, last_checkin: dict, version: int) -> dict:
+    momentum = state.momentum()
+    return {
+        "user_id": user_id,
+        "composites": state.composites,
+        "running_sum": state.running_sum,
+        "score": momentum["score"],
+        "delta": momentum["delta"],
+        "last_checkin_date": str(last_checkin["checkin_date"]),
+        "version": version,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _recent_checkins(user_id: str) -> list[dict]:
+    rows = (
+        get_supabase_admin().table("checkins")
+        .select("id, checkin_date, mood_score, tasks_completed, tasks_total")
+        .eq("user_id", user_id)
+        .order("checkin_date", desc=True)
+        .order("created_at", desc=True)
+        .limit(WINDOW)
+        .execute()
+    ).data
+    rows.reverse()
+    return rows
+
+
+def rebuild_state(user_id: str, checkins: list[dict] | None = None) -> dict | None:
+    """Recompute the user's state from their latest checkins and save it. Returns the state row."""
+    checkins = checkins if checkins is not None else _recent_checkins(user_id)
     if not checkins:
-        return {"score": 0, "delta": 0}
+        return None
+    row = _state_row(user_id, MomentumState.from_checkins(checkins), checkins[-1], version=1)
+    get_supabase_admin().table("momentum_state").upsert(row, on_conflict="user_id").execute()
+    return row
 
-    scores = []
-    for c in checkins:
-        total = c["tasks_total"] or 1
-        completion = (c["tasks_completed"] / total) * 100
-        # Composite: 60% mood (scaled to 100) + 40% completion
-        composite = (c["mood_score"] * 10) * 0.6 + completion * 0.4
-        scores.append(composite)
-
-    # Weighted: last 3 days count 2x
-    n = len(scores)
-    weights = [2.0 if i >= n - 3 else 1.0 for i in range(n)]
-    total_weight = sum(weights)
-    weighted_score = sum(s * w for s, w in zip(scores, weights)) / total_weight
-
-    # Delta: compare last 3 days avg vs first 3 days avg
-    if n >= 6:
-        early = sum(scores[:3]) / 3
-        recent = sum(scores[-3:]) / 3
-        delta = round(recent - early)
+
+def record_checkin(checkin: dict) -> dict:
+    """Fold a just-written checkin into its user's state and stamp it with the new momentum.
+
+    Backdated checkins (older than the latest one folded in) fall outside the
+    running window: the state is rebuilt and the checkin's own history value
+    is left for the backfill job.
+    """
+    db = get_supabase_admin()
+    user_id = checkin["user_id"]
+    checkin_date = str(checkin["checkin_date"])
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        rows = db.table("momentum_state").select("*").eq("user_id", user_id).limit(1).execute().data
+        current = rows[0] if rows else None
+        if current is None or checkin_date < str(current["last_checkin_date"]):
+            row = rebuild_state(user_id)
+            momentum = {"score": row["score"], "delta": row["delta"]}
+            if current is not None:
+                return momentum
+            break
+        state = MomentumState(list(current["composites"]), current["running_sum"])
+        state.push(composite(checkin))
+        row = _state_row(user_id, state, checkin, version=current["version"] + 1)
+        # Optimistic concurrency: lose the race to a parallel checkin -> reload and retry
+        if db.table("momentum_state").update(row).eq("user_id", user_id).eq("version", current["version"]).execute().data:
+            momentum = {"score": row["score"], "delta": row["delta"]}
+            break
     else:
-        delta = 0
+        logger.warning(f"Momentum update for {user_id} kept conflicting; rebuilding")
+        row = rebuild_state(user_id)
+        momentum = {"score": row["score"], "delta": row["delta"]}
+
+    db.table("checkins").update({
+        "momentum_score": momentum["score"], "momentum_delta": momentum["delta"],
+    }).eq("id", checkin["id"]).execute()
+    return momentum
+
+
+def get_momentum(user_id: str, recent_checkins: list[dict]) -> dict:
+    """Precomputed momentum for the dashboard; builds the state once for users without one."""
+    rows = (
+        get_supabase_admin().table("momentum_state")
+        .select("score, delta")
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+    ).data
+    if rows:
+        return {"score": rows[0]["score"], "delta": rows[0]["delta"]}
+    row = rebuild_state(user_id, recent_checkins[-WINDOW:])
+    return {"score": row["score"], "delta": row["delta"]} if row else {"score": 0, "delta": 0}
+
+
+# ── Backfill ──
+def _fetch_checkins(user_ids: list[str]) -> list[dict]:
+    db = get_supabase_admin()
+    return select_in(
+        lambda: db.table("checkins")
+        .select("id, user_id, checkin_date, mood_score, tasks_completed, tasks_total")
+        .order("user_id").order("checkin_date").order("created_at").order("id"),
+        "user_id", user_ids,
+    )
+
+
+def replay(checkins: list[dict]) -> tuple[MomentumState, list[dict]]:
+    """Fold one user's checkins (oldest first); returns the final state and per-checkin history."""
+    state, history = MomentumState(), []
+    for c in checkins:
+        state.push(composite(c))
+        history.append({"id": c["id"], **state.momentum()})
+    return state, history
+
+
+def rebuild_history(user_id: str, checkins: list[dict]) -> dict | None:
+    """Replay all of one user's checkins (oldest first, with ids): save the state and stamp each checkin."""
+    if not checkins:
+        return None
+    db = get_supabase_admin()
+    state, history = replay(checkins)
+    row = _state_row(user_id, state, checkins[-1], version=1)
+    db.table("momentum_state").upsert(row, on_conflict="user_id").execute()
+    db.rpc("set_checkin_momentum", {"p_rows": history}).execute()
+    return row
+
+
+def backfill_momentum(page_size: int = BACKFILL_PAGE_SIZE) -> dict:
+    """Rebuild state and per-checkin history for every user. Blocking; returns counts for the job result."""
+    db = get_supabase_admin()
+    summary = {"users": 0, "checkins": 0}
+    after = None
+    while True:
+        query = db.table("users").select("id").order("id").limit(page_size)
+        if after is not None:
+            query = query.gt("id", after)
+        user_ids = [row["id"] for row in query.execute().data]
+        if not user_ids:
+            return summary
+        after = user_ids[-1]
 
-    return {"score": round(weighted_score), "delta": delta}
+        by_user: dict[str, list[dict]] = {}
+        for c in _fetch_checkins(user_ids):
+            by_user.setdefault(c["user_id"], []).append(c)
+        states, history = [], []
+        for user_id, checkins in by_user.items():
+            state, user_history = replay(checkins)
+            states.append(_state_row(user_id, state, checkins[-1], version=1))
+            history.extend(user_history)
+        if states:
+            db.table("momentum_state").upsert(states, on_conflict="user_id").execute()
+            db.rpc("set_checkin_momentum", {"p_rows": history}).execute()
+        summary["users"] += len(states)
+        summary["checkins"] += len(history)
+        logger.info(f"Momentum backfill: {summary['users']} users, {summary['checkins']} checkins so far")
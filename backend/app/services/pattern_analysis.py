@@ -0,0 +1,417 @@
+"""Statistical pre-analysis for pattern detection.
+
+Computes candidate findings (same-day and lagged correlations, group effects)
+over a user's checkin, plan and intervention series with NumPy. Significance
+comes from vectorized permutation tests, so no distribution assumptions are
+needed for the small samples we have. A user gets 20+ tests per run, so the
+p-values are Benjamini-Hochberg adjusted across all of them (q-values) and
+only findings within the false discovery rate MAX_FDR are kept; noise alone
+would clear a raw p threshold several times. The pattern agent receives the
+compact findings table instead of raw rows, and each card's
+supportingEvidence is taken from the finding it cites.
+"""
+import re
+from datetime import date, timedelta
+from dataclasses import dataclass, field
+import numpy as np
+from app.database import get_supabase_admin, select_in
+
+HISTORY_LIMIT = 30  # checkins analysed per user
+MIN_CHECKINS = 7
+N_PERMUTATIONS = 2000
+MAX_FDR = 0.1  # Benjamini-Hochberg q-value cutoff across one user's tests
+MAX_FINDINGS = 8
+MAX_EVIDENCE = 7
+
+_ENERGY_LEVEL = {"low": 0.0, "medium": 1.0, "high": 2.0}
+_ENERGY_TO_BRAIN = {"low": "foggy", "medium": "focused", "high": "wired"}
+_TIME_OF_DAY = {"morning": (0, 12), "afternoon": (12, 17), "evening": (17, 24)}
+_SLOT_RE = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?", re.IGNORECASE)
+
+
+@dataclass
+class Finding:
+    id: str
+    kind: str  # correlation | lagged | group
+    description: str
+    effect: float  # Pearson r, or Cohen's d for group effects
+    p_value: float
+    n: int
+    evidence: list[dict] = field(default_factory=list)
+    condition: dict | None = None  # machine-checkable form, see hypothesis_engine
+    q_value: float = 1.0  # p adjusted for all tests run for the user (Benjamini-Hochberg)
+
+    def row(self) -> str:
+        stat = "r" if self.kind != "group" else "d"
+        days = ",".join(str(e["day"]) for e in self.evidence)
+        return (
+            f"{self.id} | {self.kind} | {self.description} | {stat}={self.effect:+.2f} | "
+            f"p={self.p_value:.3f} | q={self.q_value:.3f} | n={self.n} | days {days or '-'}"
+        )
+
+
+@dataclass
+class Analysis:
+    days: int
+    findings: list[Finding]
+    through: str | None = None  # last checkin date analysed; cards are evaluated on later data only
+
+    def table(self) -> str:
+        header = "id | kind | finding | effect | p | q | n | evidence days"
+        return "\n".join([header] + [f.row() for f in self.findings])
+
+    def by_id(self) -> dict[str, Finding]:
+        return {f.id: f for f in self.findings}
+
+
+# ── Statistics ──
+def _permutation_corr(x: np.ndarray, y: np.ndarray, rng: np.random.Generator) -> tuple[float, float]:
+    """Pearson r and two-sided permutation p-value (all permutations in one matrix product)."""
+    if len(x) < 3 or x.std() == 0 or y.std() == 0:
+        return 0.0, 1.0
+    xz = (x - x.mean()) / x.std()
+    yz = (y - y.mean()) / y.std()
+    r = float(xz @ yz / len(x))
+    perms = rng.permuted(np.broadcast_to(yz, (N_PERMUTATIONS, len(yz))), axis=1)
+    r_null = perms @ xz / len(x)
+    p = (np.count_nonzero(np.abs(r_null) >= abs(r) - 1e-12) + 1) / (N_PERMUTATIONS + 1)
+    return r, float(p)
+
+
+def _permutation_group(values: np.ndarray, mask: np.ndarray, rng: np.random.Generator) -> tuple[float, float]:
+    """Cohen's d of values[mask] vs values[~mask] with a two-sided permutation p-value."""
+    k, n = int(mask.sum()), len(values)
+    if k < 2 or n - k < 2:
+        return 0.0, 1.0
+    pooled = np.sqrt(((k - 1) * values[mask].var(ddof=1) + (n - k - 1) * values[~mask].var(ddof=1)) / (n - 2))
+    diff = values[mask].mean() - values[~mask].mean()
+    if pooled == 0:
+        return 0.0, 1.0
+    masks = rng.permuted(np.broadcast_to(mask, (N_PERMUTATIONS, n)), axis=1).astype(float)
+    null = masks @ values / k - (1 - masks) @ values / (n - k)
+    p = (np.count_nonzero(np.abs(null) >= abs(diff) - 1e-12) + 1) / (N_PERMUTATIONS + 1)
+    return float(diff / pooled), float(p)
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """BH-adjusted q-values (step-up, monotone, capped at 1), in input order."""
+    m = len(p_values)
+    if not m:
+        return p_values
+    order = np.argsort(p_values)
+    scaled = p_values[order] * m / np.arange(1, m + 1)
+    q = np.minimum.accumulate(scaled[::-1])[::-1]
+    out = np.empty(m)
+    out[order] = np.minimum(q, 1.0)
+    return out
+
+
+# ── Series ──
+def _slot_hour(slot: str) -> int | None:
+    match = _SLOT_RE.search(slot or "")
+    if not match:
+        return None
+    hour = int(match.group(1)) % 24
+    suffix = (match.group(3) or "").lower()
+    if suffix.startswith("p") and hour < 12:
+        hour += 12
+    elif suffix.startswith("a") and hour == 12:
+        hour = 0
+    return hour
+
+
+def _time_of_day(hour: int) -> str:
+    return next(name for name, (lo, hi) in _TIME_OF_DAY.items() if lo <= hour < hi)
+
+
+def task_features(task: dict) -> dict | None:
+    """time_of_day / category / done for a plan task with a known outcome, else None."""
+    if task.get("status") not in ("completed", "skipped", "pending"):
+        return None
+    hour = _slot_hour(task.get("time_slot", ""))
+    return {
+        "time_of_day": _time_of_day(hour) if hour is not None else "",
+        "category": task.get("category") or "other",
+        "done": task.get("status") == "completed",
+    }
+
+
+def day_features(checkin: dict, plan: dict | None, stuck: int) -> dict:
+    """One day's values for every series the findings (and compiled conditions) refer to."""
+    plan = plan or {}
+    energy_label = checkin.get("energy_level") or "medium"
+    brain = plan.get("brain_state", "")
+    total = checkin["tasks_total"]
+    return {
+        "mood": float(checkin["mood_score"]),
+        "energy": _ENERGY_LEVEL.get(energy_label, 1.0),
+        "completion": checkin["tasks_completed"] / total if total else 0.0,
+        "stuck": float(stuck),
+        "brain": brain,
+        "brain_mismatch": bool(brain) and _ENERGY_TO_BRAIN.get(energy_label) != brain,
+        "tasks": [f for f in map(task_features, plan.get("tasks") or []) if f is not None],
+    }
+
+
+def _day_series(checkins: list[dict], plans: list[dict], interventions: list[dict]) -> dict:
+    """Per-day arrays (chronological, day 1 = oldest checkin) plus per-task rows."""
+    dates = [str(c["checkin_date"]) for c in checkins]
+    day_of_date = {d: i for i, d in enumerate(dates)}
+    plan_by_id = {p["id"]: p for p in plans}
+    plan_by_date = {str(p["plan_date"]): p for p in plans}
+
+    completed = np.array([c["tasks_completed"] for c in checkins], dtype=float)
+    total = np.array([c["tasks_total"] for c in checkins], dtype=float)
+    brain = np.array([
+        (plan_by_id.get(c.get("plan_id")) or plan_by_date.get(str(c["checkin_date"])) or {}).get("brain_state", "")
+        for c in checkins
+    ])
+
+    stuck = np.zeros(len(checkins))
+    for intv in interventions:
+        plan = plan_by_id.get(intv.get("plan_id"))
+        day = day_of_date.get(str(plan["plan_date"]) if plan else str(intv["created_at"])[:10])
+        if day is not None:
+            stuck[day] += 1
+
+    task_day, task_tod, task_category, task_done = [], [], [], []
+    for checkin_date, day in day_of_date.items():
+        for t in (plan_by_date.get(checkin_date) or {}).get("tasks") or []:
+            features = task_features(t)
+            if features is None:
+                continue
+            task_day.append(day)
+            task_tod.append(features["time_of_day"])
+            task_category.append(features["category"])
+            task_done.append(1.0 if features["done"] else 0.0)
+
+    return {
+        "dates": dates,
+        "mood": np.array([c["mood_score"] for c in checkins], dtype=float),
+        "energy": np.array([_ENERGY_LEVEL.get(c.get("energy_level"), 1.0) for c in checkins]),
+        "energy_label": [c.get("energy_level") or "medium" for c in checkins],
+        "completion": np.divide(completed, total, out=np.zeros_like(completed), where=total > 0),
+        "completed": completed,
+        "brain": brain,
+        "stuck": stuck,
+        "task_day": np.array(task_day, dtype=int),
+        "task_tod": np.array(task_tod),
+        "task_category": np.array(task_category),
+        "task_done": np.array(task_done),
+    }
+
+
+def _day_detail(s: dict, i: int) -> str:
+    return (
+        f"{s['dates'][i]}: mood {int(s['mood'][i])}/10, {s['energy_label'][i]} energy, "
+        f"{round(s['completion'][i] * 100)}% completion"
+        + (f", {int(s['stuck'][i])} stuck request(s)" if s["stuck"][i] else "")
+    )
+
+
+def _evidence(s: dict, days: np.ndarray, detail=None) -> list[dict]:
+    detail = detail or (lambda i: _day_detail(s, i))
+    return [{"day": int(i) + 1, "detail": detail(int(i))} for i in days[-MAX_EVIDENCE:]]
+
+
+def _agreeing_days(x: np.ndarray, y: np.ndarray, r: float) -> np.ndarray:
+    """Days that follow the direction of the correlation (both sides of the median agree)."""
+    dx, dy = np.sign(x - np.median(x)), np.sign(y - np.median(y))
+    return np.flatnonzero((dx != 0) & (dx * dy == np.sign(r)))
+
+
+# ── Findings ──
+def analyze(checkins: list[dict], plans: list[dict], interventions: list[dict], seed: int = 0) -> Analysis:
+    """Candidate findings over chronological checkins; deterministic for a given seed."""
+    rng = np.random.default_rng(seed)
+    s = _day_series(checkins, plans, interventions)
+    n = len(s["mood"])
+    tests: list[tuple[Finding, bool]] = []  # every test counts toward the correction, evidence or not
+
+    def add(kind, description, effect, p, sample, evidence, condition):
+        finding = Finding("", kind, description, round(effect, 3), p, sample, evidence, condition)
+        tests.append((finding, bool(evidence)))
+
+    # Same-day correlations
+    same_day = [
+        ("mood", "completion", "Mood rises with same-day task completion"),
+        ("energy", "completion", "Higher self-reported energy goes with higher completion"),
+        ("energy", "mood", "Energy level and mood move together"),
+        ("stuck", "mood", "Stuck requests relate to same-day mood"),
+    ]
+    for a, b, text in same_day:
+        r, p = _permutation_corr(s[a], s[b], rng)
+        add("correlation", text, r, p, n, _evidence(s, _agreeing_days(s[a], s[b], r)),
+            {"type": "co_move", "x": _side(a, s[a]), "y": _side(b, s[b]), "direction": int(np.sign(r))})
+
+    # Lagged (previous day -> next day) effects
+    lagged = [
+        ("completion", "energy", "Previous-day output predicts next-day energy"),
+        ("completion", "mood", "Previous-day output predicts next-day mood"),
+        ("mood", "completion", "Previous-day mood predicts next-day completion"),
+        ("stuck", "completion", "Getting stuck predicts next-day completion"),
+    ]
+    for a, b, text in lagged:
+        x, y = s[a][:-1], s[b][1:]
+        r, p = _permutation_corr(x, y, rng)
+        days = _agreeing_days(x, y, r) + 1  # evidence points at the following day
+        add("lagged", text, r, p, n - 1, _evidence(
+            s, days, lambda i, a=a: f"after day {i} ({a} {_fmt(s[a][i - 1], a)}): {_day_detail(s, i)}"
+        ), {"type": "co_move", "x": _side(a, x, lag=1), "y": _side(b, y), "direction": int(np.sign(r))})
+
+    # Brain state chosen at planning time vs outcomes
+    for state in ("foggy", "focused", "wired"):
+        mask = s["brain"] == state
+        d, p = _permutation_group(s["completion"], mask, rng)
+        add("group", f"Completion on '{state}' plan days vs other days", d, p, n, _evidence(s, np.flatnonzero(mask)),
+            _group_condition({"series": "brain", "eq": state}, "completion", s["completion"], mask, d))
+    mismatch = np.array([
+        bool(b) and _ENERGY_TO_BRAIN.get(e) != b for b, e in zip(s["brain"], s["energy_label"])
+    ])
+    d, p = _permutation_group(s["completion"], mismatch, rng)
+    add("group", "Completion when planned brain state did not match reported energy", d, p, n,
+        _evidence(s, np.flatnonzero(mismatch), lambda i: f"planned {s['brain'][i]}, reported {_day_detail(s, i)}"),
+        _group_condition({"series": "brain_mismatch", "eq": True}, "completion", s["completion"], mismatch, d))
+
+    # Intervention triggers: conditions on days the user got stuck
+    stuck_days = s["stuck"] > 0
+    for series, text in (("energy", "Energy on days with stuck requests"), ("mood", "Mood on days with stuck requests")):
+        d, p = _permutation_group(s[series], stuck_days, rng)
+        add("group", text, d, p, n, _evidence(s, np.flatnonzero(stuck_days)),
+            _group_condition({"series": "stuck", "gt": 0}, series, s[series], stuck_days, d))
+    prev_stuck = stuck_days[1:]
+    d, p = _permutation_group(s["completion"][:-1], prev_stuck, rng)
+    add("group", "Previous-day completion before days with stuck requests", d, p, n - 1,
+        _evidence(s, np.flatnonzero(prev_stuck) + 1),
+        _group_condition({"series": "stuck", "gt": 0}, "completion", s["completion"][:-1], prev_stuck, d, lag=1))
+
+    # Task-level effects: time of day and category
+    done = s["task_done"]
+    for column, label, feature in (
+        ("task_tod", "scheduled in the {}", "time_of_day"),
+        ("task_category", "in category '{}'", "category"),
+    ):
+        for value in sorted(set(s[column].tolist()) - {""}):
+            mask = s[column] == value
+            d, p = _permutation_group(done, mask, rng)
+            rate = done[mask].mean() if mask.any() else 0.0
+            days = np.unique(s["task_day"][mask & (done == (1.0 if d > 0 else 0.0))])
+            add("group", f"Completion of tasks {label.format(value)} ({round(rate * 100)}% done)", d, p,
+                int(mask.sum()), _evidence(s, days),
+                {"type": "task_rate", "column": feature, "eq": value, "direction": int(np.sign(d))})
+
+    q_values = benjamini_hochberg(np.array([f.p_value for f, _ in tests]))
+    findings = []
+    for (f, has_evidence), q in zip(tests, q_values.tolist()):
+        if q <= MAX_FDR and has_evidence:
+            f.p_value, f.q_value = round(f.p_value, 4), round(q, 4)
+            findings.append(f)
+    findings.sort(key=lambda f: (f.q_value, f.p_value, -abs(f.effect)))
+    findings = findings[:MAX_FINDINGS]
+    for i, f in enumerate(findings, start=1):
+        f.id = f"F{i}"
+    return Analysis(days=n, findings=findings, through=s["dates"][-1] if n else None)
+
+
+def _side(series: str, values: np.ndarray, lag: int = 0, threshold: float | None = None) -> dict:
+    threshold = np.median(values) if threshold is None else threshold
+    return {"series": series, "lag": lag, "threshold": round(float(threshold), 4)}
+
+
+def _group_condition(when: dict, series: str, values: np.ndarray, mask: np.ndarray, d: float, lag: int = 0) -> dict:
+    """Days matching `when` should land on the side of the other days' mean that the effect points to."""
+    baseline = values[~mask].mean() if (~mask).any() else values.mean()
+    return {"type": "group", "when": when, "y": _side(series, values, lag, baseline), "direction": int(np.sign(d))}
+
+
+def _fmt(value: float, series: str) -> str:
+    if series == "completion":
+        return f"{round(value * 100)}%"
+    if series == "energy":
+        return {0.0: "low", 1.0: "medium", 2.0: "high"}[float(value)]
+    return f"{value:g}"
+
+
+def confidence_for(finding: Finding) -> str:
+    """Same evidence-count rule the agent was given (2-3 low, 4-6 medium, 7+ high), capped by significance."""
+    count = len(finding.evidence)
+    level = "high" if count >= 7 else "medium" if count >= 4 else "low"
+    if finding.q_value > 0.05:
+        level = "low" if level == "medium" else "medium" if level == "high" else level
+    return level
+
+
+# ── Loading ──
+def load_history(user_id: str) -> tuple[list[dict], list[dict], list[dict]]:
+    """Chronological checkins plus the plans and interventions inside that window."""
+    db = get_supabase_admin()
+    checkins = (
+        db.table("checkins")
+        .select("checkin_date, plan_id, mood_score, energy_level, tasks_completed, tasks_total")
+        .eq("user_id", user_id)
+        .order("checkin_date", desc=True)
+        .limit(HISTORY_LIMIT)
+        .execute()
+    ).data
+    checkins.reverse()
+    if not checkins:
+        return [], [], []
+    since = str(checkins[0]["checkin_date"])
+    plans = (
+        db.table("daily_plans")
+        .select("id, plan_date, brain_state, tasks, created_at")
+        .eq("user_id", user_id)
+        .gte("plan_date", since)
+        .order("created_at", desc=False)
+        .execute()
+    ).data
+    interventions = (
+        db.table("interventions")
+        .select("plan_id, created_at")
+        .eq("user_id", user_id)
+        .gte("created_at", since)
+        .execute()
+    ).data
+    return checkins, plans, interventions
+
+
+def load_histories(user_ids: list[str], since_days: int = 60) -> dict[str, tuple[list[dict], list[dict], list[dict]]]:
+    """Bulk variant of load_history for many users: each table read in id batches and paged (select_in)."""
+    db = get_supabase_admin()
+    since = (date.today() - timedelta(days=since_days)).isoformat()
+    checkins = select_in(
+        lambda: db.table("checkins")
+        .select("user_id, checkin_date, plan_id, mood_score, energy_level, tasks_completed, tasks_total")
+        .gte("checkin_date", since)
+        .order("user_id").order("checkin_date").order("id"),
+        "user_id", user_ids,
+    )
+    plans = select_in(
+        lambda: db.table("daily_plans")
+        .select("id, user_id, plan_date, brain_state, tasks, created_at")
+        .gte("plan_date", since)
+        .order("user_id").order("created_at").order("id"),
+        "user_id", user_ids,
+    )
+    interventions = select_in(
+        lambda: db.table("interventions")
+        .select("user_id, plan_id, created_at")
+        .gte("created_at", since)
+        .order("user_id").order("created_at").order("id"),
+        "user_id", user_ids,
+    )
+
+    histories = {uid: ([], [], []) for uid in user_ids}
+    for i, rows in enumerate((checkins, plans, interventions)):
+        for row in rows:
+            histories[row["user_id"]][i].append(row)
+    for uid, (user_checkins, _, _) in histories.items():
+        del user_checkins[:-HISTORY_LIMIT]
+    return histories
+
+
+def analyze_user(user_id: str) -> Analysis:
+    checkins, plans, interventions = load_history(user_id)
+    if len(checkins) < MIN_CHECKINS:
+        return Analysis(days=len(checkins), findings=[])
+    return analyze(checkins, plans, interventions)
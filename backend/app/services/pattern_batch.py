@@ -0,0 +1,131 @@
+"""Nightly fleet-wide pattern detection.
+
+Sweeps users with enough checkins and stale (or no) hypothesis cards, runs the
+statistical pre-analysis for a page of users at a time, sends one prompt per
+user through a batch LLM provider and writes all resulting cards in bulk.
+Scheduled once a day through the job queue (see job_worker).
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from app.config import get_settings
+from app.database import get_supabase_admin
+from app.agents.pattern_agent import build_pattern_prompt, card_rows, parse_pattern_output, pattern_agent
+from app.services import metrics
+from app.services.batch_llm import (
+    AnthropicBatchProvider, BatchProvider, BatchRequest, LocalBatchProvider, run_batch,
+)
+from app.services.hypothesis_store import store_cards
+from app.services.pattern_analysis import MIN_CHECKINS, Analysis, analyze, load_histories
+
+logger = logging.getLogger(__name__)
+
+_users = metrics.counter("pattern_batch_users_total", "Users processed by nightly pattern detection by outcome")
+_cards = metrics.counter("pattern_batch_cards_total", "Hypothesis cards written by nightly pattern detection")
+
+PAGE_SIZE = 200
+BATCH_MAX_REQUESTS = 10_000
+
+_SYSTEM_PROMPT = (
+    f"{pattern_agent.backstory}\n\n"
+    "Respond with only a JSON object of the form "
+    '{"cards": [{"findingId", "patternDetected", "prediction", "confidence", "status"}]}.'
+)
+
+
+def candidate_users(after: str | None, limit: int) -> list[str]:
+    """Next page of users (by id) with >= MIN_CHECKINS checkins and no card newer than the refresh window."""
+    result = get_supabase_admin().rpc("pattern_batch_candidates", {
+        "p_min_checkins": MIN_CHECKINS,
+        "p_stale_hours": get_settings().pattern_refresh_hours,
+        "p_after": after,
+        "p_limit": limit,
+    }).execute()
+    return [row["user_id"] for row in result.data]
+
+
+def rule_based_response(analysis: Analysis) -> str:
+    """Deterministic stand-in for the LLM: one card per top finding."""
+    cards = [
+        {
+            "findingId": f.id,
+            "patternDetected": f.description,
+            "prediction": (
+                f"This will keep holding over the next week ({'positive' if f.effect > 0 else 'negative'} effect)."
+            ),
+            "confidence": "medium",
+            "status": "active",
+        }
+        for f in analysis.findings[:3]
+    ]
+    return json.dumps({"cards": cards})
+
+
+def _provider(analyses: dict[str, Analysis]) -> BatchProvider:
+    settings = get_settings()
+    if settings.pattern_batch_provider == "local":
+        return LocalBatchProvider(lambda r: rule_based_response(analyses[r.custom_id]))
+    return AnthropicBatchProvider(settings.pattern_batch_model)
+
+
+def run_pattern_batch(provider_factory=_provider) -> dict:
+    """Sweep all eligible users once. Blocking; returns counts for the job result."""
+    settings = get_settings()
+    summary = {"users": 0, "analyzed": 0, "cards": 0, "errors": 0}
+    analyses: dict[str, Analysis] = {}
+
+    with ThreadPoolExecutor(max_workers=settings.pattern_batch_concurrency) as pool:
+        # 1. Sweep and analyze, a page of users (three bulk queries) at a time
+        after = None
+        while user_ids := candidate_users(after, PAGE_SIZE):
+            after = user_ids[-1]
+            summary["users"] += len(user_ids)
+            histories = load_histories(user_ids)
+            for uid, analysis in zip(user_ids, pool.map(lambda u: analyze(*histories[u]), user_ids)):
+                if analysis.findings:
+                    analyses[uid] = analysis
+        summary["analyzed"] = len(analyses)
+        _users.inc(summary["users"] - summary["analyzed"], outcome="no_findings")
+
+        # 2. Submit every prompt; large sweeps are split into several batches polled in parallel
+        requests = [
+            BatchRequest(custom_id=uid, system=_SYSTEM_PROMPT, prompt=build_pattern_prompt(a))
+            for uid, a in analyses.items()
+        ]
+        provider = provider_factory(analyses)
+        chunks = [requests[i:i + BATCH_MAX_REQUESTS] for i in range(0, len(requests), BATCH_MAX_REQUESTS)]
+        results = [
+            result
+            for chunk_results in pool.map(
+                lambda chunk: run_batch(
+                    provider, chunk,
+                    poll_seconds=settings.pattern_batch_poll_seconds,
+                    timeout_seconds=settings.pattern_batch_timeout_seconds,
+                ),
+                chunks,
+            )
+            for result in chunk_results
+        ]
+
+        # 3. Parse results concurrently and write all cards in bulk
+        def _rows(result):
+            if result.error or result.text is None:
+                logger.warning(f"Batch pattern request for {result.custom_id} failed: {result.error}")
+                return None
+            return card_rows(result.custom_id, parse_pattern_output(result.text), analyses[result.custom_id])
+
+        rows = []
+        for result_rows in pool.map(_rows, results):
+            if result_rows is None:
+                summary["errors"] += 1
+                _users.inc(outcome="error")
+                continue
+            rows.extend(result_rows)
+            _users.inc(outcome="ok")
+
+    # Merges restatements of existing cards and re-applies each user's active-card cap
+    stored = store_cards(rows)
+    summary["cards"] = len(stored)
+    _cards.inc(len(stored))
+    logger.info(f"Nightly pattern batch finished: {summary}")
+    return summary
@@ -0,0 +1,149 @@
+"""Plan-result cache keyed on normalized planning inputs.
+
+A repeat /plan/generate with the same profile, history, brain state, tasks and
+time window returns the previously generated plan instead of re-running the crew.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from app.config import get_settings
+from app.database import get_supabase_admin
+from app.services import metrics
+
+_hits = metrics.counter("plan_cache_hits_total", "Plan cache lookups served from cache")
+_misses = metrics.counter("plan_cache_misses_total", "Plan cache lookups that ran the planner")
+_bypasses = metrics.counter("plan_cache_bypass_total", "Plan requests that skipped the cache (regenerate)")
+_evictions = metrics.counter("plan_cache_evictions_total", "Plan cache entries evicted (LRU or TTL)")
+
+
+def normalize_tasks(tasks: list[str] | None) -> list[str]:
+    """Case-fold, collapse whitespace, drop blanks/duplicates and sort."""
+    if not tasks:
+        return []
+    normalized = {" ".join(t.split()).casefold() for t in tasks}
+    normalized.discard("")
+    return sorted(normalized)
+
+
+def _digest(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def planning_fingerprint(user_id: str) -> dict:
+    """Fetch the profile version and a digest of the recent history the planner reads."""
+    db = get_supabase_admin()
+    profile = (
+        db.table("cognitive_profiles")
+        .select("id, created_at")
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    # Mirror the window get_user_history exposes to the agents (14 checkins, 5 interventions)
+    checkins = (
+        db.table("checkins")
+        .select("id, checkin_date, mood_score, energy_level, tasks_completed, tasks_total")
+        .eq("user_id", user_id)
+        .order("checkin_date", desc=True)
+        .limit(14)
+        .execute()
+    )
+    interventions = (
+        db.table("interventions")
+        .select("id, user_rating")
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .limit(5)
+        .execute()
+    )
+    return {
+        "profileVersion": profile.data[0]["id"] if profile.data else None,
+        "historyDigest": _digest([checkins.data, interventions.data]),
+    }
+
+
+def make_plan_cache_key(
+    user_id: str,
+    fingerprint: dict,
+    brain_state: str,
+    tasks: list[str] | None,
+    time_window_minutes: int | None,
+) -> str:
+    return _digest({
+        "user": user_id,
+        "profile": fingerprint.get("profileVersion"),
+        "history": fingerprint.get("historyDigest"),
+        "brainState": brain_state,
+        "tasks": normalize_tasks(tasks),
+        "timeWindow": time_window_minutes,
+    })
+
+
+class PlanCache:
+    """Thread-safe LRU cache with per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                _misses.inc()
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                _evictions.inc(reason="ttl")
+                _misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            _hits.inc()
+            return value
+
+    def put(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                _evictions.inc(reason="lru")
+
+    def record_bypass(self):
+        _bypasses.inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        hits, misses = _hits.value(), _misses.value()
+        lookups = hits + misses
+        return {
+            "size": size,
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "bypasses": _bypasses.value(),
+            "hitRate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_plan_cache: PlanCache | None = None
+
+
+def get_plan_cache() -> PlanCache:
+    global _plan_cache
+    if _plan_cache is None:
+        settings = get_settings()
+        _plan_cache = PlanCache(settings.plan_cache_max_entries, settings.plan_cache_ttl_seconds)
+    return _plan_cache
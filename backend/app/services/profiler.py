@@ -0,0 +1,310 @@
+"""On-demand sampling profiler for live API and worker processes.
+
+Off by default, and then it costs next to nothing: no sampler thread exists
+and the request middleware reads one attribute. An admin arms a session for
+the next N requests whose path matches a glob ("/api/plan/*"), or for a
+fixed number of seconds. While a session samples, a daemon thread walks
+sys._current_frames() every PROFILE_INTERVAL_MS. That covers the event loop,
+asyncio.to_thread workers and agent executor threads (crew runs), and each
+stack is rooted at its thread's name.
+
+When a session ends, two collapsed-stack files are written to PROFILE_DIR
+(the folded format read by flamegraph.pl, speedscope and inferno):
+
+    <id>.wall.folded   samples per stack, for every thread, idle or not
+    <id>.cpu.folded    microseconds of thread CPU time per stack (Linux)
+
+Thread CPU time comes from /proc/self/task/<tid>/schedstat. The CPU used
+between two samples is charged to the stack seen at the second one.
+
+In requests mode the sampler only runs while a profiled request is in
+flight. Threads are not tied to requests, so concurrent unprofiled requests
+can show up in the same stacks. Sessions are per process. With several
+uvicorn workers an admin call reaches one of them. SIGUSR2 starts (or
+stops) a timed session in any process, including worker.py.
+
+Overhead while sampling is bounded in three ways:
+- The interval is stretched if sampling costs more than PROFILE_MAX_OVERHEAD
+  of wall time.
+- Every session ends after PROFILE_MAX_SECONDS.
+- Stacks are cut at MAX_DEPTH frames.
+"""
+import asyncio
+import fnmatch
+import itertools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+MODES = ("requests", "duration")
+MAX_DEPTH = 128
+_session_numbers = itertools.count(1)  # sessions started within the same second get distinct ids
+
+
+class ProfilerBusy(Exception):
+    """A profiling session is already running in this process."""
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    for marker in ("site-packages/", "dist-packages/"):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    cwd = os.getcwd() + os.sep
+    return filename[len(cwd):] if filename.startswith(cwd) else filename
+
+
+def collapse_stack(thread_name: str, frame) -> str:
+    """"thread;outer (file:line);...;leaf (file:line)" for one thread's current frame."""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        code = frame.f_code
+        labels.append(f"{getattr(code, 'co_qualname', code.co_name)} ({_short_path(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    if frame is not None:
+        labels.append("[truncated]")
+    labels.append(thread_name)
+    return ";".join(label.replace(";", ":") for label in reversed(labels))
+
+
+def thread_cpu_seconds(native_id: int) -> float | None:
+    """On-CPU time of one thread of this process, or None (thread gone, no schedstat)."""
+    try:
+        with open(f"/proc/self/task/{native_id}/schedstat") as f:
+            return int(f.read().split()[0]) / 1e9
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class ProfileSession:
+    id: str
+    mode: str
+    route_pattern: str | None
+    requests: int | None
+    seconds: float
+    interval: float
+    started_at: float = field(default_factory=time.time)
+    status: str = "armed"
+    claimed: int = 0
+    in_flight: int = 0
+    samples: int = 0
+    files: list[str] = field(default_factory=list)
+    wall: Counter = field(default_factory=Counter)
+    cpu: Counter = field(default_factory=Counter)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "pid": os.getpid(),
+            "mode": self.mode,
+            "routePattern": self.route_pattern,
+            "requests": self.requests,
+            "requestsProfiled": self.claimed,
+            "seconds": self.seconds,
+            "status": self.status,
+            "startedAt": self.started_at,
+            "samples": self.samples,
+            "intervalMs": round(self.interval * 1000, 2),
+            "stacks": len(self.wall),
+            "files": self.files,
+        }
+
+
+class SamplingProfiler:
+    """At most one session per process; the sampler thread lives only as long as the session."""
+
+    def __init__(self, directory: str, interval: float, max_seconds: float, max_overhead: float):
+        self.directory = directory
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_overhead = max_overhead
+        self._lock = threading.Lock()
+        self._session: ProfileSession | None = None
+        self._last: ProfileSession | None = None
+        self._thread: threading.Thread | None = None
+        self._sampling = threading.Event()  # set while samples should be taken
+        self._done = threading.Event()
+
+    @property
+    def armed(self) -> bool:
+        """Unlocked read for the request middleware's fast path."""
+        return self._session is not None
+
+    def start(self, mode: str, route_pattern: str | None = None, requests: int | None = None,
+              seconds: float | None = None) -> ProfileSession:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        with self._lock:
+            if self._session is not None:
+                raise ProfilerBusy(f"Session {self._session.id} is {self._session.status}")
+            session = ProfileSession(
+                id=f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_session_numbers)}",
+                mode=mode,
+                route_pattern=route_pattern if mode == "requests" else None,
+                requests=requests if mode == "requests" else None,
+                seconds=min(seconds or self.max_seconds, self.max_seconds),
+                interval=self.interval,
+            )
+            self._session = session
+            self._done.clear()
+            self._sampling.clear()
+            if mode == "duration":
+                session.status = "sampling"
+                self._sampling.set()
+            self._thread = threading.Thread(target=self._run, args=(session,), name="profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Profiling session {session.id} started ({mode}, up to {session.seconds:g}s)")
+        return session
+
+    def stop(self) -> ProfileSession | None:
+        """End the current session and wait for its files (blocking; call off the event loop)."""
+        with self._lock:
+            session, thread = self._session, self._thread
+            if session is None:
+                return None
+            self._end(session, "stopped")
+        thread.join()
+        return session
+
+    def current(self) -> ProfileSession | None:
+        return self._session or self._last
+
+    # ── Request hooks (profiling middleware) ──
+    def claim(self, path: str) -> ProfileSession | None:
+        """The requests-mode session this request now counts toward, if its path matches."""
+        with self._lock:
+            session = self._session
+            if (session is None or session.mode != "requests" or session.status not in ("armed", "sampling")
+                    or session.claimed >= session.requests
+                    or not fnmatch.fnmatchcase(path, session.route_pattern)):
+                return None
+            session.claimed += 1
+            session.in_flight += 1
+            session.status = "sampling"
+            self._sampling.set()
+            return session
+
+    def release(self, session: ProfileSession):
+        """End of a claimed request; a no-op for the sampler once that session has ended."""
+        with self._lock:
+            session.in_flight -= 1
+            if session is not self._session or session.in_flight > 0:
+                return
+            self._sampling.clear()
+            if session.claimed >= session.requests:
+                self._end(session, "finished")
+
+    def _end(self, session: ProfileSession, status: str):
+        """Called with the lock held; the sampler thread writes the files and clears the session."""
+        if session.status in ("armed", "sampling"):
+            session.status = status
+        self._sampling.clear()
+        self._done.set()
+
+    # ── Sampler thread ──
+    def _run(self, session: ProfileSession):
+        deadline = session.started_at + session.seconds
+        cpu_seen: dict[int, float] = {}
+        was_sampling = False
+        try:
+            while not self._done.is_set():
+                if time.time() >= deadline:
+                    with self._lock:
+                        self._end(session, "finished" if session.mode == "duration" else "timed out")
+                    break
+                if not self._sampling.wait(timeout=0.1):
+                    was_sampling = False
+                    continue
+                if not was_sampling:
+                    cpu_seen.clear()  # CPU used while paused belongs to no sample
+                    was_sampling = True
+                begin = time.perf_counter()
+                self._sample(session, cpu_seen)
+                cost = time.perf_counter() - begin
+                if cost > session.interval * self.max_overhead:
+                    session.interval = cost / self.max_overhead
+                self._done.wait(session.interval)
+        except Exception as e:
+            logger.warning(f"Profiling session {session.id} failed: {e}")
+            session.status = "failed"
+        finally:
+            self._write(session)
+            with self._lock:
+                self._session = None
+                self._last = session
+            logger.info(f"Profiling session {session.id} {session.status}: {session.samples} samples, {session.files}")
+
+    def _sample(self, session: ProfileSession, cpu_seen: dict[int, float]):
+        threads = {t.ident: t for t in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            thread = threads.get(ident)
+            stack = collapse_stack(thread.name if thread else f"thread-{ident}", frame)
+            session.wall[stack] += 1
+            native_id = getattr(thread, "native_id", None)
+            cpu = thread_cpu_seconds(native_id) if native_id else None
+            if cpu is None:
+                continue
+            previous = cpu_seen.get(ident)
+            cpu_seen[ident] = cpu
+            if previous is not None and cpu > previous:
+                session.cpu[stack] += round((cpu - previous) * 1e6)
+        session.samples += 1
+
+    def _write(self, session: ProfileSession):
+        if not session.wall:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for kind, counts in (("wall", session.wall), ("cpu", session.cpu)):
+                path = os.path.join(self.directory, f"{session.id}.{kind}.folded")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in counts.most_common())
+                session.files.append(path)
+        except OSError as e:
+            logger.warning(f"Could not write profile {session.id} to {self.directory}: {e}")
+
+
+_profiler: SamplingProfiler | None = None
+
+
+def get_profiler() -> SamplingProfiler:
+    global _profiler
+    if _profiler is None:
+        settings = get_settings()
+        _profiler = SamplingProfiler(
+            directory=settings.profile_dir,
+            interval=settings.profile_interval_ms / 1000,
+            max_seconds=settings.profile_max_seconds,
+            max_overhead=settings.profile_max_overhead,
+        )
+    return _profiler
+
+
+def install_signal_handler():
+    """SIGUSR2 starts a PROFILE_SIGNAL_SECONDS session, or stops the running one (call on the event loop)."""
+    loop = asyncio.get_running_loop()
+
+    def toggle():
+        profiler = get_profiler()
+        if profiler.armed:
+            loop.run_in_executor(None, profiler.stop)
+        else:
+            profiler.start("duration", seconds=get_settings().profile_signal_seconds)
+
+    try:
+        loop.add_signal_handler(signal.SIGUSR2, toggle)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        pass  # no SIGUSR2 (Windows) or not the main thread
@@ -0,0 +1,251 @@
+"""Routing of agent progress messages to the user whose run produced them.
+
+The agent executor opens a RunContext (run id + user id) in the context it
+runs each crew under. CrewAI copies the context into its event handlers, so
+handlers can call current_run() to find the originating user. Messages are
+handed to the event loop with call_soon_threadsafe and only reach that user's
+stream, where they get a sequence id and wait in a replay buffer. Connections
+read the stream in frames, at most `progress_frame_rate` per second, with
+bursts of tool events coalesced.
+
+With a fanout backend (see progress_fanout) messages travel through a pub/sub
+server instead, so a crew in one process reaches websockets held by another.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from app.config import get_settings
+from app.services.progress_fanout import FanoutBackend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RunContext:
+    run_id: str
+    user_id: str
+    route: str = ""  # execution policy name ("plan", "screening", ...), used as a metrics label
+
+
+_current_run: contextvars.ContextVar[RunContext | None] = contextvars.ContextVar("agent_run", default=None)
+
+
+def enter_run(user_id: str, route: str = "") -> RunContext:
+    """Start a run for user_id in the current context (call inside the context the crew will run in)."""
+    run = RunContext(run_id=uuid.uuid4().hex, user_id=user_id, route=route)
+    _current_run.set(run)
+    return run
+
+
+def current_run() -> RunContext | None:
+    return _current_run.get()
+
+
+# Bursty events where only the latest one per run matters within a frame
+COALESCED_TYPES = frozenset({"tool_started", "queue_position"})
+
+
+def coalesce(messages: list[dict]) -> list[dict]:
+    """Keep only the last COALESCED_TYPES message per (type, run); everything else passes through in order."""
+    last: dict[tuple, int] = {}
+    for i, message in enumerate(messages):
+        if message.get("type") in COALESCED_TYPES:
+            last[(message["type"], message.get("runId"))] = i
+    keep = set(last.values())
+    return [m for i, m in enumerate(messages) if m.get("type") not in COALESCED_TYPES or i in keep]
+
+
+class _Stream:
+    """One user's event stream: sequence counter, replay ring buffer and live subscriptions."""
+
+    def __init__(self, replay_size: int):
+        # Start from the wall clock (ms) so ids keep increasing when a stream is recreated
+        self.seq = int(time.time() * 1000)
+        self.first_seq = self.seq  # cursors below this came from an earlier (expired) stream
+        self.buffer: deque[dict] = deque(maxlen=replay_size)
+        self.subscriptions: set["Subscription"] = set()
+        self.idle_since: float | None = None
+
+    def append(self, message: dict):
+        self.seq += 1
+        self.buffer.append({**message, "seq": self.seq})
+        for subscription in self.subscriptions:
+            subscription._wake()
+
+    def since(self, cursor: int) -> list[dict]:
+        """Buffered messages after `cursor`, led by a resync marker if some were already evicted."""
+        if cursor >= self.seq:
+            return []
+        oldest = self.buffer[0]["seq"] if self.buffer else self.seq + 1
+        if cursor < oldest - 1:
+            resync = {"type": "resync", "seq": oldest - 1}
+            if cursor >= self.first_seq:
+                resync["missed"] = oldest - 1 - cursor  # a message count only within this stream's ids
+            return [resync, *self.buffer]
+        return list(itertools.islice(self.buffer, cursor + 1 - oldest, None))
+
+
+def _expire_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_exception(asyncio.TimeoutError())
+
+
+class Subscription:
+    """A connection's cursor into a user's stream, read in throttled, coalesced frames."""
+
+    def __init__(self, user_id: str, stream: _Stream, cursor: int, frame_interval: float):
+        self.user_id = user_id
+        self.cursor = cursor
+        self._stream = stream
+        self._frame_interval = frame_interval
+        self._last_frame = 0.0
+        self._waiter: asyncio.Future | None = None
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def next_frame(self, timeout: float) -> list[dict]:
+        """Messages since the last frame. Raises asyncio.TimeoutError if nothing arrives in `timeout`."""
+        loop = asyncio.get_running_loop()
+        if self._stream.seq <= self.cursor:
+            # A bare future + timer: wait_for would wrap every wait in a task
+            self._waiter = waiter = loop.create_future()
+            timer = loop.call_later(timeout, _expire_waiter, waiter)
+            try:
+                await waiter
+            finally:
+                timer.cancel()
+                self._waiter = None
+        delay = self._last_frame + self._frame_interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)  # let a burst collect into one frame
+        messages = self._stream.since(self.cursor)
+        self.cursor = self._stream.seq
+        self._last_frame = loop.time()
+        return coalesce(messages)
+
+
+class ProgressHub:
+    """Per-user event streams, fed from any thread.
+
+    Each message gets the next sequence id of its user's stream and is kept in
+    a bounded replay buffer, so a reconnecting client can resume from the last
+    id it saw. Streams outlive their last connection by `idle_ttl` seconds to
+    cover reconnects.
+    """
+
+    def __init__(self, replay_size: int = 256, frame_rate: float = 10.0, idle_ttl: float = 300.0):
+        self.replay_size = replay_size
+        self.frame_interval = 1 / frame_rate if frame_rate > 0 else 0.0
+        self.idle_ttl = idle_ttl
+        self._streams: dict[str, _Stream] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+        self._fanout: FanoutBackend | None = None
+
+    async def start(self, fanout: FanoutBackend | None = None):
+        """Bind to the running loop and, if given, route all messages through a fanout backend."""
+        self._loop = asyncio.get_running_loop()
+        if fanout is None:
+            return
+        await fanout.start(self._deliver_many)
+        self._fanout = fanout
+        with self._lock:
+            user_ids = list(self._streams)
+        for user_id in user_ids:
+            fanout.listen(user_id)
+
+    async def stop(self):
+        fanout, self._fanout = self._fanout, None
+        if fanout is not None:
+            await fanout.stop()
+
+    def subscribe(self, user_id: str, last_seq: int | None = None) -> Subscription:
+        """Attach a connection to user_id's stream. Must be called on the event loop.
+
+        With last_seq, buffered messages after it are replayed first.
+        """
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            stream = self._streams.get(user_id)
+            created = stream is None
+            if created:
+                stream = self._streams[user_id] = _Stream(self.replay_size)
+        if created and self._fanout is not None:
+            self._fanout.listen(user_id)
+        cursor = stream.seq if last_seq is None else min(last_seq, stream.seq)
+        subscription = Subscription(user_id, stream, cursor, self.frame_interval)
+        stream.subscriptions.add(subscription)
+        stream.idle_since = None
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        stream = subscription._stream
+        stream.subscriptions.discard(subscription)
+        if not stream.subscriptions:
+            stream.idle_since = self._loop.time()
+            self._loop.call_later(self.idle_ttl, self._expire, subscription.user_id)
+
+    def _expire(self, user_id: str):
+        with self._lock:
+            stream = self._streams.get(user_id)
+            if stream is None or stream.idle_since is None or self._loop.time() - stream.idle_since < self.idle_ttl:
+                return  # reconnected (or disconnected again later)
+            del self._streams[user_id]
+        if self._fanout is not None:
+            self._fanout.unlisten(user_id)
+
+    def connections(self) -> int:
+        with self._lock:
+            return sum(len(s.subscriptions) for s in self._streams.values())
+
+    def publish(self, user_id: str, message: dict):
+        """Deliver message to user_id's stream. Safe to call from any thread."""
+        if self._fanout is not None:
+            self._fanout.publish(user_id, message)  # subscribers may be in another process
+            return
+        loop = self._loop
+        if loop is None or user_id not in self._streams:
+            return  # nobody is listening (racy read is fine: worst case one message is dropped)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(user_id, message)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._deliver, user_id, message)
+
+    def _deliver(self, user_id: str, message: dict):
+        with self._lock:
+            stream = self._streams.get(user_id)
+        if stream is not None:
+            stream.append(message)
+
+    def _deliver_many(self, user_id: str, messages: list[dict]):
+        for message in messages:
+            self._deliver(user_id, message)
+
+
+_hub: ProgressHub | None = None
+_hub_lock = threading.Lock()
+
+
+def get_progress_hub() -> ProgressHub:
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            settings = get_settings()
+            _hub = ProgressHub(
+                replay_size=settings.progress_replay_size,
+                frame_rate=settings.progress_frame_rate,
+                idle_ttl=settings.progress_replay_ttl_seconds,
+            )
+        return _hub
@@ -0,0 +1,349 @@
+"""Cross-process fanout for agent progress messages.
+
+A crew running in one API worker (or in worker.py) has to reach a websocket
+held by another process. When a fanout backend is configured, ProgressHub
+publishes every message through it and delivers whatever arrives on the
+channels of its locally connected users:
+
+  local     no backend: in-process delivery only (default, no dependencies)
+  postgres  LISTEN/NOTIFY, one channel per user (needs asyncpg and a session-mode
+            connection string: transaction poolers do not support LISTEN)
+  redis     PUBLISH/SUBSCRIBE, one channel per user, against any Redis-compatible
+            server (needs redis)
+
+Publishes are buffered and flushed every `progress_fanout_flush_ms`: a user's
+messages from one flush travel as a single payload, and all payloads of a
+flush share one round trip. MemoryBroker is an in-process stand-in for the
+server so several hubs (simulated workers) can be wired together locally.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable
+from app.config import get_settings
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+_messages = metrics.counter("progress_fanout_messages_total", "Progress messages through the fanout backend by outcome")
+_flush_size = metrics.histogram(
+    "progress_fanout_flush_messages", "Messages per fanout flush", buckets=(1, 5, 10, 50, 100, 500, 1000, 5000)
+)
+
+Deliver = Callable[[str, list[dict]], None]
+
+
+def _encode(messages: list[dict], limit: int) -> list[str]:
+    """JSON arrays of messages, each at most `limit` bytes (an oversized single message is dropped)."""
+    payloads, batch, size = [], [], 2
+    for message in messages:
+        encoded = json.dumps(message, separators=(",", ":"), default=str)
+        if len(encoded) + 2 > limit:
+            _messages.inc(outcome="oversized")
+            continue
+        if batch and size + len(encoded) + 1 > limit:
+            payloads.append(f"[{','.join(batch)}]")
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        payloads.append(f"[{','.join(batch)}]")
+    return payloads
+
+
+class FanoutBackend(ABC):
+    """Buffers publishes from any thread and flushes them in batches on the event loop.
+
+    Subclasses implement the transport: _listen/_unlisten for a channel and _send
+    for one flush worth of (channel, payload) pairs (abstract), plus _connect/_close
+    when they hold a connection. Incoming
+    payloads are handed to _receive on the event loop.
+    """
+
+    payload_limit = 512 * 1024
+
+    def __init__(self, flush_interval: float = 0.02):
+        self.flush_interval = flush_interval
+        self._buffer: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._deliver: Deliver | None = None
+        self._users_by_channel: dict[str, str] = {}
+        self._subscription_lock: asyncio.Lock | None = None
+        self._flusher: asyncio.Task | None = None
+
+    def channel(self, user_id: str) -> str:
+        return f"progress:{user_id}"
+
+    async def start(self, deliver: Deliver):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._subscription_lock = asyncio.Lock()
+        self._deliver = deliver
+        await self._connect()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            await self._flush()  # hand over what is still buffered
+        await self._close()
+        self._loop = None
+
+    def publish(self, user_id: str, message: dict):
+        """Queue a message for user_id's channel. Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            _messages.inc(outcome="dropped")
+            return
+        with self._lock:
+            self._buffer.append((user_id, message))
+            first = len(self._buffer) == 1
+        if first:
+            self._call_soon(self._wake.set)
+
+    def listen(self, user_id: str):
+        """Start receiving user_id's channel (first local subscriber). Called on the event loop."""
+        channel = self.channel(user_id)
+        self._users_by_channel[channel] = user_id
+        asyncio.create_task(self._change_subscription(self._listen, channel))
+
+    def unlisten(self, user_id: str):
+        channel = self.channel(user_id)
+        self._users_by_channel.pop(channel, None)
+        asyncio.create_task(self._change_subscription(self._unlisten, channel))
+
+    async def _change_subscription(self, change, channel: str):
+        async with self._subscription_lock:  # keeps listen/unlisten for a channel in call order
+            try:
+                await change(channel)
+            except Exception as e:
+                logger.warning(f"Progress fanout {change.__name__} {channel} failed: {e}")
+
+    def _call_soon(self, fn, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            fn(*args)
+        else:
+            self._loop.call_soon_threadsafe(fn, *args)
+
+    async def _flush_loop(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.flush_interval)  # let the batch fill up
+            self._wake.clear()
+            await self._flush()
+
+    async def _flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        by_user: dict[str, list[dict]] = {}
+        for user_id, message in batch:
+            by_user.setdefault(user_id, []).append(message)
+        payloads = [
+            (self.channel(user_id), payload)
+            for user_id, messages in by_user.items()
+            for payload in _encode(messages, self.payload_limit)
+        ]
+        try:
+            await self._send(payloads)
+            _messages.inc(len(batch), outcome="published")
+            _flush_size.observe(len(batch))
+        except Exception as e:
+            logger.warning(f"Progress fanout flush of {len(batch)} messages failed: {e}")
+            _messages.inc(len(batch), outcome="dropped")
+
+    def _receive(self, channel: str, payload: str | bytes):
+        """Deliver one incoming payload to the hub. Runs on the event loop."""
+        user_id = self._users_by_channel.get(channel)
+        if user_id is None:
+            return  # unsubscribed while the payload was in flight
+        try:
+            messages = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Discarding malformed progress payload on {channel}")
+            return
+        self._deliver(user_id, messages)
+
+    # ── Transport ──
+    async def _connect(self):
+        pass
+
+    async def _close(self):
+        pass
+
+    @abstractmethod
+    async def _listen(self, channel: str):
+        ...
+
+    @abstractmethod
+    async def _unlisten(self, channel: str):
+        ...
+
+    @abstractmethod
+    async def _send(self, payloads: list[tuple[str, str]]):
+        ...
+
+
+class MemoryBroker:
+    """In-process stand-in for a pub/sub server, shared by several MemoryFanout backends."""
+
+    def __init__(self):
+        self._subscribers: dict[str, set["MemoryFanout"]] = {}
+        self._lock = threading.Lock()
+        self.round_trips = 0
+
+    def subscribe(self, channel: str, fanout: "MemoryFanout"):
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(fanout)
+
+    def unsubscribe(self, channel: str, fanout: "MemoryFanout"):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(fanout)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, payloads: list[tuple[str, str]]):
+        with self._lock:
+            self.round_trips += 1
+            targets = [(fanout, channel, payload)
+                       for channel, payload in payloads
+                       for fanout in self._subscribers.get(channel, ())]
+        for fanout, channel, payload in targets:
+            fanout._call_soon(fanout._receive, channel, payload)
+
+
+class MemoryFanout(FanoutBackend):
+    def __init__(self, broker: MemoryBroker, flush_interval: float = 0.02):
+        super().__init__(flush_interval)
+        self.broker = broker
+
+    async def _close(self):
+        for channel in list(self._users_by_channel):
+            self.broker.unsubscribe(channel, self)
+
+    async def _listen(self, channel: str):
+        self.broker.subscribe(channel, self)
+
+    async def _unlisten(self, channel: str):
+        self.broker.unsubscribe(channel, self)
+
+    async def _send(self, payloads: list[tuple[str, str]]):
+        self.broker.publish(payloads)
+
+
+class PostgresFanout(FanoutBackend):
+    # NOTIFY payloads are limited to 8000 bytes
+    payload_limit = 7900
+
+    def __init__(self, dsn: str, flush_interval: float = 0.02):
+        import asyncpg  # optional dependency, only needed for this backend
+        super().__init__(flush_interval)
+        self._asyncpg = asyncpg
+        self.dsn = dsn
+        self._listener = None
+        self._notifier = None
+
+    def channel(self, user_id: str) -> str:
+        # Channel names are identifiers (max 63 bytes); hash so any user id fits
+        return f"progress_{hashlib.sha1(user_id.encode()).hexdigest()}"
+
+    async def _connect(self):
+        self._listener = await self._asyncpg.connect(self.dsn)
+        self._notifier = await self._asyncpg.connect(self.dsn)
+
+    async def _close(self):
+        for conn in (self._listener, self._notifier):
+            if conn is not None:
+                await conn.close()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._receive(channel, payload)
+
+    async def _listen(self, channel: str):
+        await self._listener.add_listener(channel, self._on_notify)
+
+    async def _unlisten(self, channel: str):
+        await self._listener.remove_listener(channel, self._on_notify)
+
+    async def _send(self, payloads: list[tuple[str, str]]):
+        channels = [channel for channel, _ in payloads]
+        bodies = [payload for _, payload in payloads]
+        await self._notifier.execute(
+            "SELECT pg_notify(c, p) FROM unnest($1::text[], $2::text[]) AS t(c, p)", channels, bodies
+        )
+
+
+class RedisFanout(FanoutBackend):
+    def __init__(self, url: str, flush_interval: float = 0.02):
+        import redis.asyncio as redis  # optional dependency, only needed for this backend
+        super().__init__(flush_interval)
+        self._client = redis.from_url(url)
+        self._pubsub = self._client.pubsub()
+        self._reader: asyncio.Task | None = None
+
+    async def _connect(self):
+        await self._client.ping()
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def _close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        await self._pubsub.aclose()
+        await self._client.aclose()
+
+    async def _read_loop(self):
+        while True:
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(self.flush_interval)
+                continue
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logger.warning(f"Progress fanout read failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if message is not None and message["type"] == "message":
+                channel = message["channel"]
+                self._receive(channel.decode() if isinstance(channel, bytes) else channel, message["data"])
+
+    async def _listen(self, channel: str):
+        await self._pubsub.subscribe(channel)
+
+    async def _unlisten(self, channel: str):
+        await self._pubsub.unsubscribe(channel)
+
+    async def _send(self, payloads: list[tuple[str, str]]):
+        async with self._client.pipeline(transaction=False) as pipe:
+            for channel, payload in payloads:
+                pipe.publish(channel, payload)
+            await pipe.execute()
+
+
+def create_fanout() -> FanoutBackend | None:
+    """The configured cross-process backend, or None for in-process delivery."""
+    settings = get_settings()
+    kind = settings.progress_fanout
+    flush_interval = settings.progress_fanout_flush_ms / 1000
+    if kind == "local":
+        return None
+    if not settings.progress_fanout_url:
+        raise ValueError(f"PROGRESS_FANOUT={kind} needs PROGRESS_FANOUT_URL")
+    if kind == "postgres":
+        return PostgresFanout(settings.progress_fanout_url, flush_interval)
+    if kind == "redis":
+        return RedisFanout(settings.progress_fanout_url, flush_interval)
+    raise ValueError(f"Unknown PROGRESS_FANOUT backend: {kind}")
@@ -0,0 +1,334 @@
+"""Server-side ledger of agent runs (agent_runs table).
+
+Every run_agent call produces one row: route (execution policy), entrypoint,
+user, outcome, attempts, the fallback taken, whether the output was valid,
+a hash of the inputs, queue wait and duration. CrewAI event listeners add
+what happened inside the crew: the agents involved, each agent step's
+timing, LLM/tool call counts and token usage per agent.
+
+The record lives in a contextvar that run_agent sets before submitting to
+the agent executor, so the crew thread and the event handlers (which run
+in a copy of the emitting context) all update the same record. Rows are
+buffered and inserted in batches off the request path. A record is
+serialized at flush time, which gives event handlers that run just after
+the crew returns a chance to land.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from crewai.events.event_bus import crewai_event_bus
+from crewai.events.event_types import (
+    AgentExecutionCompletedEvent,
+    AgentExecutionErrorEvent,
+    AgentExecutionStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+    ToolUsageErrorEvent,
+    ToolUsageFinishedEvent,
+)
+from opentelemetry import trace
+from app.config import get_settings
+from app.database import get_supabase_admin
+from app.services import metrics
+from app.services.agent_metrics import agent_role, task_label, token_usage
+
+logger = logging.getLogger(__name__)
+
+_rows = metrics.counter("agent_ledger_rows_total", "Agent run ledger rows by outcome (written, dropped)")
+_flush_size = metrics.histogram(
+    "agent_ledger_flush_rows", "Rows per agent ledger insert", buckets=(1, 5, 10, 50, 100, 500, 1000)
+)
+
+MAX_STEPS = 200  # per run; a runaway delegation loop should not produce a huge row
+
+
+def input_hash(route: str, entrypoint: str, args: tuple) -> str:
+    """Stable hash of what a run was asked to do (same inputs -> same hash)."""
+    payload = json.dumps([route, entrypoint, list(args)], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+@dataclass
+class RunRecord:
+    route: str
+    entrypoint: str
+    user_id: str | None
+    input_hash: str
+    started_at: float = field(default_factory=time.time)
+    trace_id: str | None = None
+    attempts: int = 0
+    status: str = "running"
+    fallback: str | None = None
+    output_valid: bool | None = None
+    error: str | None = None
+    duration_ms: int | None = None
+    queue_wait_ms: int = 0
+    steps: list[dict] = field(default_factory=list)
+    by_agent: dict[str, dict] = field(default_factory=dict)
+    _open_steps: dict[str, dict] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def _agent(self, role: str | None) -> dict:
+        role = role or "unknown"
+        entry = self.by_agent.get(role)
+        if entry is None:
+            entry = self.by_agent[role] = {
+                "steps": 0, "stepMs": 0, "llmCalls": 0, "toolCalls": 0,
+                "promptTokens": 0, "completionTokens": 0, "errors": 0,
+            }
+        return entry
+
+    def step_started(self, event_id: str, role: str | None, task: str | None, at: float):
+        with self._lock:
+            # The end event's handler may have run first (handlers race on CrewAI's pool)
+            step = self._open_steps.pop(event_id, None) or {}
+            step.update(agent=role or "unknown", task=task, start=at)
+            self._close_step(event_id, step)
+
+    def step_finished(self, started_event_id: str | None, role: str | None, at: float, ok: bool):
+        with self._lock:
+            step = self._open_steps.pop(started_event_id, None) or {"agent": role or "unknown"}
+            step.update(end=at, ok=ok)
+            self._close_step(started_event_id, step)
+
+    def _close_step(self, event_id: str | None, step: dict):
+        if "start" not in step or "end" not in step:
+            if event_id is not None:
+                self._open_steps[event_id] = step
+            return
+        ms = round((step["end"] - step["start"]) * 1000)
+        agent = self._agent(step["agent"])
+        agent["steps"] += 1
+        agent["stepMs"] += ms
+        agent["errors"] += not step["ok"]
+        if len(self.steps) < MAX_STEPS:
+            self.steps.append({
+                "agent": step["agent"], "task": step.get("task"),
+                "offsetMs": round((step["start"] - self.started_at) * 1000), "ms": ms, "ok": step["ok"],
+            })
+
+    def llm_call(self, role: str | None, usage: dict[str, int], ok: bool):
+        with self._lock:
+            agent = self._agent(role)
+            agent["llmCalls"] += 1
+            agent["promptTokens"] += usage.get("prompt", 0)
+            agent["completionTokens"] += usage.get("completion", 0)
+            agent["errors"] += not ok
+
+    def tool_call(self, role: str | None, ok: bool):
+        with self._lock:
+            agent = self._agent(role)
+            agent["toolCalls"] += 1
+            agent["errors"] += not ok
+
+    def finish(self, status: str, output_valid: bool | None = None, error: BaseException | None = None):
+        self.status = status
+        self.output_valid = output_valid
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"[:500]
+        self.duration_ms = round((time.time() - self.started_at) * 1000)
+
+    def to_row(self) -> dict:
+        with self._lock:
+            agents = {role: dict(v) for role, v in self.by_agent.items()}
+            steps = list(self.steps)
+            unfinished = [s for s in self._open_steps.values() if "start" in s]
+        # Steps still open when the row is written (no end event, e.g. a cancelled crew)
+        steps += [
+            {"agent": s["agent"], "task": s.get("task"), "offsetMs": round((s["start"] - self.started_at) * 1000),
+             "ms": None, "ok": None}
+            for s in unfinished
+        ][:max(0, MAX_STEPS - len(steps))]
+        steps.sort(key=lambda s: s["offsetMs"])
+        return {
+            "route": self.route,
+            "entrypoint": self.entrypoint,
+            "user_id": self.user_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "retries": max(0, self.attempts - 1),
+            "fallback": self.fallback,
+            "output_valid": self.output_valid,
+            "error": self.error,
+            "input_hash": self.input_hash,
+            "agents": sorted(set(agents) | {s["agent"] for s in steps}),
+            "steps": steps,
+            "agent_stats": agents,
+            "llm_calls": sum(a["llmCalls"] for a in agents.values()),
+            "tool_calls": sum(a["toolCalls"] for a in agents.values()),
+            "prompt_tokens": sum(a["promptTokens"] for a in agents.values()),
+            "completion_tokens": sum(a["completionTokens"] for a in agents.values()),
+            "queue_wait_ms": self.queue_wait_ms,
+            "duration_ms": self.duration_ms,
+            "trace_id": self.trace_id,
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+        }
+
+
+_current_record: contextvars.ContextVar[RunRecord | None] = contextvars.ContextVar("agent_run_record", default=None)
+
+
+def current_record() -> RunRecord | None:
+    return _current_record.get()
+
+
+def start_record(route: str, entrypoint: str, user_id: str | None, args: tuple) -> tuple[RunRecord, contextvars.Token]:
+    """New record, made current for the caller's context (reset with the returned token)."""
+    span_context = trace.get_current_span().get_span_context()
+    record = RunRecord(
+        route=route,
+        entrypoint=entrypoint,
+        user_id=user_id,
+        input_hash=input_hash(route, entrypoint, args),
+        trace_id=format(span_context.trace_id, "032x") if span_context.is_valid else None,
+    )
+    return record, _current_record.set(record)
+
+
+def end_record(token: contextvars.Token):
+    record = _current_record.get()
+    _current_record.reset(token)
+    if record is not None and get_settings().agent_ledger_enabled:
+        get_run_ledger().submit(record)
+
+
+def note_queue_wait(seconds: float):
+    """Called by the agent executor (inside the job's context) once a job leaves the queue."""
+    record = _current_record.get()
+    if record is not None:
+        record.queue_wait_ms += round(seconds * 1000)
+
+
+# ── CrewAI listeners ──
+_registered = False
+
+
+def register_run_ledger():
+    """Subscribe the ledger listeners to the CrewAI event bus (once per process)."""
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    @crewai_event_bus.on(AgentExecutionStartedEvent)
+    def on_agent_started(source, event):
+        if (record := current_record()) is not None:
+            record.step_started(event.event_id, agent_role(event), task_label(event), event.timestamp.timestamp())
+
+    @crewai_event_bus.on(AgentExecutionCompletedEvent)
+    def on_agent_completed(source, event):
+        if (record := current_record()) is not None:
+            record.step_finished(event.started_event_id, agent_role(event), event.timestamp.timestamp(), ok=True)
+
+    @crewai_event_bus.on(AgentExecutionErrorEvent)
+    def on_agent_error(source, event):
+        if (record := current_record()) is not None:
+            record.step_finished(event.started_event_id, agent_role(event), event.timestamp.timestamp(), ok=False)
+
+    @crewai_event_bus.on(LLMCallCompletedEvent)
+    def on_llm_completed(source, event):
+        if (record := current_record()) is not None:
+            record.llm_call(event.agent_role, token_usage(event.usage), ok=True)
+
+    @crewai_event_bus.on(LLMCallFailedEvent)
+    def on_llm_failed(source, event):
+        if (record := current_record()) is not None:
+            record.llm_call(event.agent_role, {}, ok=False)
+
+    @crewai_event_bus.on(ToolUsageFinishedEvent)
+    def on_tool_finished(source, event):
+        if (record := current_record()) is not None:
+            record.tool_call(event.agent_role, ok=not event.failure)
+
+    @crewai_event_bus.on(ToolUsageErrorEvent)
+    def on_tool_error(source, event):
+        if (record := current_record()) is not None:
+            record.tool_call(event.agent_role, ok=False)
+
+
+# ── Batched writer ──
+class RunLedger:
+    """Buffers finished records from any thread and inserts them in batches on the event loop."""
+
+    def __init__(self, flush_interval: float = 2.0, batch_size: int = 200, max_buffer: int = 5000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self._buffer: list[RunRecord] = []
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._flusher: asyncio.Task | None = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            while await self._flush():  # write out what is still buffered
+                pass
+        self._loop = None
+
+    def submit(self, record: RunRecord):
+        """Queue a finished record. Never blocks; drops it when the writer is down or the buffer is full."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            _rows.inc(outcome="dropped")
+            return
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                _rows.inc(outcome="dropped")
+                return
+            self._buffer.append(record)
+            first = len(self._buffer) == 1
+        if first:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _flush_loop(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.flush_interval)  # let the batch fill up (and late event handlers land)
+            self._wake.clear()
+            while await self._flush():
+                pass
+
+    async def _flush(self) -> bool:
+        """Insert up to batch_size rows. Returns whether more are waiting."""
+        with self._lock:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            more = bool(self._buffer)
+        if not batch:
+            return False
+        rows = [record.to_row() for record in batch]
+        try:
+            await asyncio.to_thread(lambda: get_supabase_admin().table("agent_runs").insert(rows).execute())
+            _rows.inc(len(rows), outcome="written")
+            _flush_size.observe(len(rows))
+        except Exception as e:
+            logger.warning(f"Agent ledger insert of {len(rows)} rows failed: {e}")
+            _rows.inc(len(rows), outcome="dropped")
+        return more
+
+
+_ledger: RunLedger | None = None
+
+
+def get_run_ledger() -> RunLedger:
+    global _ledger
+    if _ledger is None:
+        settings = get_settings()
+        _ledger = RunLedger(
+            flush_interval=settings.agent_ledger_flush_seconds,
+            batch_size=settings.agent_ledger_batch_size,
+        )
+    return _ledger
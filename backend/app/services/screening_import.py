@@ -0,0 +1,328 @@
+"""Bulk ASRS-6 import for partner organizations.
+
+Records stream in as CSV or NDJSON (fields user_id, q1..q6 and optional
+answered_at). They are parsed line by line and written CHUNK_ROWS at a time.
+Each chunk is scored in one matrix product: DIMENSION_MAP becomes a 6x6
+question -> dimension weight matrix, so an N x 6 answer matrix gives every
+total and dimension score at once. Each chunk then costs a handful of bulk
+writes: its asrs_responses, one deterministic profile per record (the rules
+the degraded screening path uses), and a single queued job that fills in the
+LLM narratives later through the batch LLM interface.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator
+import numpy as np
+from app.agents.tools.scoring_tools import ANSWER_LABELS, ASRS_QUESTIONS, DIMENSION_MAP
+from app.config import get_settings
+from app.database import get_supabase_admin, select_in
+from app.services import job_queue, metrics
+from app.services.batch_llm import AnthropicBatchProvider, BatchProvider, BatchRequest, LocalBatchProvider, run_batch
+from app.services.degraded import deterministic_profile
+
+logger = logging.getLogger(__name__)
+
+_records = metrics.counter("screening_import_records_total", "Bulk-imported ASRS records by outcome")
+
+DIMENSION_KEYS = list(DIMENSION_MAP)
+# WEIGHTS[q, d] = 1 when question q feeds dimension d
+WEIGHTS = np.zeros((len(ASRS_QUESTIONS), len(DIMENSION_KEYS)))
+for _d, _questions in enumerate(DIMENSION_MAP.values()):
+    WEIGHTS[_questions, _d] = 1.0
+_DIMENSION_MAX = WEIGHTS.sum(axis=0) * (len(ANSWER_LABELS) - 1)
+
+POSITIVE_SCREEN_THRESHOLD = 14
+MAX_REPORTED_ERRORS = 50
+PENDING_NOTE = "Your full narrative portrait is being written and will appear here shortly."
+_LABEL_SCORES = {label.lower(): i for i, label in enumerate(ANSWER_LABELS)}
+
+
+@dataclass
+class MatrixScores:
+    totals: np.ndarray       # (N,) ASRS-6 total, 0-24
+    positive: np.ndarray     # (N,) bool
+    dimensions: np.ndarray   # (N, 6) 0-100, columns in DIMENSION_KEYS order
+
+
+def score_matrix(answers: np.ndarray) -> MatrixScores:
+    """Vectorized score_asrs for an (N, 6) matrix of answers (0-4, question order)."""
+    answers = np.asarray(answers, dtype=np.float64)
+    totals = answers.sum(axis=1).astype(np.int64)
+    # np.rint rounds half to even, like round() in score_asrs
+    dimensions = np.rint(answers @ WEIGHTS / _DIMENSION_MAX * 100).astype(np.int64)
+    return MatrixScores(totals, totals >= POSITIVE_SCREEN_THRESHOLD, dimensions)
+
+
+# ── Parsing ──
+class RecordError(ValueError):
+    pass
+
+
+def _answer(value) -> int:
+    if isinstance(value, str):
+        value = value.strip()
+        if value.lower() in _LABEL_SCORES:
+            return _LABEL_SCORES[value.lower()]
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        raise RecordError(f"invalid answer {value!r}")
+    if not 0 <= score < len(ANSWER_LABELS):
+        raise RecordError(f"answer {score} out of range 0-{len(ANSWER_LABELS) - 1}")
+    return score
+
+
+def parse_record(record: dict) -> tuple[str, list[int], str | None]:
+    """(user_id, answers in question order, answered_at) from one CSV row or NDJSON object."""
+    try:
+        user_id = str(uuid.UUID(str(record.get("user_id", "")).strip()))
+    except ValueError:
+        raise RecordError("user_id must be a UUID")
+    answers = []
+    for q in range(1, len(ASRS_QUESTIONS) + 1):
+        if record.get(f"q{q}") in (None, ""):
+            raise RecordError(f"missing q{q}")
+        answers.append(_answer(record[f"q{q}"]))
+    answered_at = record.get("answered_at") or None
+    if answered_at is not None:
+        try:
+            answered_at = datetime.fromisoformat(str(answered_at).strip()).isoformat()
+        except ValueError:
+            raise RecordError("answered_at must be an ISO 8601 date or timestamp")
+    return user_id, answers, answered_at
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _records_from(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """(line number, record, error) per non-blank line. CSV needs a header row; quoted newlines are not supported."""
+    header = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt == "csv":
+            fields = next(csv.reader([line]))
+            if header is None:
+                header = [f.strip().lower() for f in fields]
+                continue
+            if len(fields) != len(header):
+                yield line_no, None, f"expected {len(header)} fields, got {len(fields)}"
+                continue
+            yield line_no, dict(zip(header, fields)), None
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, None, "invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "expected a JSON object"
+                continue
+            yield line_no, record, None
+
+
+# ── Writing ──
+def _existing_users(user_ids: list[str]) -> set[str]:
+    db = get_supabase_admin()
+    rows = select_in(lambda: db.table("users").select("id").order("id"), "id", user_ids)
+    return {row["id"] for row in rows}
+
+
+def import_chunk(records: list[tuple[int, str, list[int], str | None]], import_id: str, chunk_index: int) -> dict:
+    """Score and bulk-write one chunk of parsed records. Blocking; returns counts, errors and the narrative job."""
+    known = _existing_users([user_id for _, user_id, _, _ in records])
+    errors = [{"line": line, "error": "unknown user_id"} for line, user_id, _, _ in records if user_id not in known]
+    records = [r for r in records if r[1] in known]
+    summary = {"imported": len(records), "errors": errors, "jobId": None}
+    if not records:
+        return summary
+
+    scores = score_matrix(np.array([answers for _, _, answers, _ in records]))
+    now = datetime.now(timezone.utc).isoformat()
+    responses, profiles = [], []
+    for (_, user_id, answers, answered_at), total, positive, dims in zip(
+        records, scores.totals.tolist(), scores.positive.tolist(), scores.dimensions.tolist()
+    ):
+        # Bulk inserts need the same columns on every row
+        created_at = answered_at or now
+        responses.extend({
+            "user_id": user_id,
+            "question_index": q,
+            "question_text": ASRS_QUESTIONS[q],
+            "answer_label": ANSWER_LABELS[score],
+            "score": score,
+            "created_at": created_at,
+        } for q, score in enumerate(answers))
+        profile = deterministic_profile(dict(zip(DIMENSION_KEYS, dims)), PENDING_NOTE)
+        profiles.append({
+            "user_id": user_id,
+            "dimensions": profile["dimensions"],
+            "profile_tags": profile["profileTags"],
+            "summary": profile["summary"],
+            "asrs_total_score": total,
+            "is_positive_screen": positive,
+            "created_at": created_at,
+        })
+
+    db = get_supabase_admin()
+    db.table("asrs_responses").insert(responses).execute()
+    profile_ids = [row["id"] for row in db.table("cognitive_profiles").insert(profiles).execute().data]
+    job = job_queue.enqueue(
+        job_queue.SCREENING_NARRATIVES,
+        None,
+        {"profile_ids": profile_ids},
+        dedupe_key=f"{job_queue.SCREENING_NARRATIVES}:{import_id}:{chunk_index}",
+    )
+    summary["jobId"] = job["id"]
+    return summary
+
+
+async def import_stream(chunks: AsyncIterator[bytes], fmt: str) -> dict:
+    """Parse, score and write a CSV/NDJSON upload without holding it in memory."""
+    chunk_rows = get_settings().screening_import_chunk_rows
+    import_id = uuid.uuid4().hex
+    summary = {"importId": import_id, "rows": 0, "imported": 0, "rejected": 0, "errors": [], "jobIds": []}
+    pending: list[tuple[int, str, list[int], str | None]] = []
+
+    def reject(line: int, error: str):
+        summary["rejected"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line, "error": error})
+
+    async def flush():
+        result = await asyncio.to_thread(import_chunk, pending, import_id, len(summary["jobIds"]))
+        summary["imported"] += result["imported"]
+        for error in result["errors"]:
+            reject(error["line"], error["error"])
+        if result["jobId"]:
+            summary["jobIds"].append(result["jobId"])
+        pending.clear()
+
+    async for line, record, error in _records_from(_lines(chunks), fmt):
+        summary["rows"] += 1
+        if error is None:
+            try:
+                pending.append((line, *parse_record(record)))
+            except RecordError as e:
+                error = str(e)
+        if error is not None:
+            reject(line, error)
+        if len(pending) >= chunk_rows:
+            await flush()
+    if pending:
+        await flush()
+
+    _records.inc(summary["imported"], outcome="imported")
+    _records.inc(summary["rejected"], outcome="rejected")
+    logger.info(
+        f"Screening import {import_id}: {summary['imported']} imported, {summary['rejected']} rejected, "
+        f"{len(summary['jobIds'])} narrative jobs"
+    )
+    return summary
+
+
+# ── Narratives ──
+def _system_prompt() -> str:
+    from app.agents.screening_agent import screening_agent  # builds the crew agent; only needed by the job
+    return (
+        f"{screening_agent.backstory}\n\n"
+        "Respond with only a JSON object of the form "
+        '{"summary": "2-3 sentence narrative", "insights": {"<dimension key>": "one-sentence insight"}}.'
+    )
+
+
+def build_narrative_prompt(profile: dict) -> str:
+    dims = "\n".join(f"- {d['key']} ({d['label']}): {d['value']}/100" for d in profile["dimensions"])
+    return (
+        f"ASRS-6 total score: {profile['asrs_total_score']} "
+        f"({'positive' if profile['is_positive_screen'] else 'negative'} screen)\n"
+        f"Radar dimensions (higher means MORE of that trait, not worse):\n{dims}\n"
+        f"Profile tags: {', '.join(profile['profile_tags'])}\n\n"
+        "Write an empowering one-sentence insight for each dimension key and a 2-3 sentence "
+        "narrative summary of how this person's brain works."
+    )
+
+
+def apply_narrative(profile: dict, text: str) -> dict:
+    """Profile row with the LLM's insights and summary merged in (unknown keys ignored)."""
+    start, end = text.find("{"), text.rfind("}") + 1
+    narrative = json.loads(text[start:end])
+    insights = narrative.get("insights") or {}
+    return {
+        "id": profile["id"],
+        "user_id": profile["user_id"],
+        "dimensions": [{**d, "insight": insights.get(d["key"]) or d["insight"]} for d in profile["dimensions"]],
+        "summary": narrative["summary"],
+    }
+
+
+def rule_based_narrative(profile: dict) -> str:
+    """Deterministic stand-in for the LLM: the templated summary without the pending note."""
+    values = {d["key"]: d["value"] for d in profile["dimensions"]}
+    return json.dumps({"summary": deterministic_profile(values, "")["summary"].strip(), "insights": {}})
+
+
+def _provider(profiles: dict[str, dict]) -> BatchProvider:
+    settings = get_settings()
+    if settings.pattern_batch_provider == "local":
+        return LocalBatchProvider(lambda r: rule_based_narrative(profiles[r.custom_id]))
+    return AnthropicBatchProvider(settings.pattern_batch_model)
+
+
+def run_screening_narratives(profile_ids: list[str], provider_factory=_provider) -> dict:
+    """Replace the templated narrative of imported profiles with LLM-written ones. Blocking.
+
+    Uses the batch LLM settings of nightly pattern detection (PATTERN_BATCH_PROVIDER/MODEL).
+    """
+    settings = get_settings()
+    db = get_supabase_admin()
+    profiles = {
+        row["id"]: row
+        for row in select_in(
+            lambda: db.table("cognitive_profiles")
+            .select("id, user_id, dimensions, profile_tags, asrs_total_score, is_positive_screen")
+            .order("id"),
+            "id", profile_ids,
+        )
+    }
+    system = _system_prompt()
+    requests = [
+        BatchRequest(custom_id=pid, system=system, prompt=build_narrative_prompt(p), max_tokens=1024)
+        for pid, p in profiles.items()
+    ]
+    results = run_batch(
+        provider_factory(profiles), requests,
+        poll_seconds=settings.pattern_batch_poll_seconds,
+        timeout_seconds=settings.pattern_batch_timeout_seconds,
+    )
+    rows, errors = [], 0
+    for result in results:
+        try:
+            if result.error or result.text is None:
+                raise ValueError(result.error)
+            rows.append(apply_narrative(profiles[result.custom_id], result.text))
+        except (ValueError, KeyError) as e:
+            errors += 1
+            logger.warning(f"Narrative for profile {result.custom_id} failed: {e}")
+    if rows:
+        db.table("cognitive_profiles").upsert(rows, on_conflict="id").execute()
+    return {"profiles": len(profiles), "written": len(rows), "errors": errors}
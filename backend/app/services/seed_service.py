@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from app.database import get_supabase_admin
+from app.services.momentum_service import rebuild_history
 
 ALEX_UUID = "00000000-0000-0000-0000-000000000001"
 
@@ -22,6 +23,7 @@ def seed_demo_data(user_id: str = ALEX_UUID):
     db.table("hypothesis_cards").delete().eq("user_id", user_id).execute()
     db.table("daily_plans").delete().eq("user_id", user_id).execute()
     db.table("checkins").delete().eq("user_id", user_id).execute()
+    db.table("momentum_state").delete().eq("user_id", user_id).execute()
     db.table("asrs_responses").delete().eq("user_id", user_id).execute()
     db.table("cognitive_profiles").delete().eq("user_id", user_id).execute()
 
@@ -66,15 +68,17 @@ def seed_demo_data(user_id: str = ALEX_UUID):
     ]
     asrs_scores = [3, 3, 2, 4, 2, 4]
 
-    for i, (question, score) in enumerate(zip(asrs_questions, asrs_scores)):
-        labels = ["Never", "Rarely", "Sometimes", "Often", "Very Often"]
-        db.table("asrs_responses").insert({
+    labels = ["Never", "Rarely", "Sometimes", "Often", "Very Often"]
+    db.table("asrs_responses").insert([
+        {
             "user_id": user_id,
             "question_index": i,
             "question_text": question,
             "answer_label": labels[score],
             "score": score,
-        }).execute()
+        }
+        for i, (question, score) in enumerate(zip(asrs_questions, asrs_scores))
+    ]).execute()
 
     # ── 3. Daily Check-ins (14 days) ──
     mood_scores = [5, 6, 5, 3, 5, 6, 6, 7, 6, 7, 6, 8, 7, 8]
@@ -134,14 +138,14 @@ def seed_demo_data(user_id: str = ALEX_UUID):
          "Plan next iteration scope", "Update project documentation", "Celebrate team wins"],
     ]
 
-    checkin_ids = []
-    plan_ids = []
+    # Built per day, inserted as one batch per table (one round trip each)
+    checkin_rows = []
+    plan_rows = []
 
     for day_index in range(14):
         checkin_date = (today - timedelta(days=13 - day_index)).isoformat()
 
-        # Insert checkin
-        checkin_result = db.table("checkins").insert({
+        checkin_rows.append({
             "user_id": user_id,
             "checkin_date": checkin_date,
             "mood_score": mood_scores[day_index],
@@ -149,8 +153,7 @@ def seed_demo_data(user_id: str = ALEX_UUID):
             "tasks_completed": tasks_completed[day_index],
             "tasks_total": tasks_total[day_index],
             "notes": f"Day {day_index + 1} check-in",
-        }).execute()
-        checkin_ids.append(checkin_result.data[0]["id"] if checkin_result.data else None)
+        })
 
         # Build task list for daily plan
         day_tasks = daily_task_titles[day_index]
@@ -172,14 +175,21 @@ def seed_demo_data(user_id: str = ALEX_UUID):
             })
 
         brain_state = energy_to_brain_state[energy_levels[day_index]]
-        plan_result = db.table("daily_plans").insert({
+        plan_rows.append({
             "user_id": user_id,
             "plan_date": checkin_date,
             "brain_state": brain_state,
             "tasks": plan_tasks,
             "overall_rationale": f"Day {day_index + 1} plan optimized for {brain_state} state ({energy_levels[day_index]} energy).",
-        }).execute()
-        plan_ids.append(plan_result.data[0]["id"] if plan_result.data else None)
+        })
+
+    checkin_result = db.table("checkins").insert(checkin_rows).execute()
+    # Bulk inserts bypass record_checkin: rebuild momentum state and per-checkin history
+    rebuild_history(user_id, sorted(checkin_result.data or [], key=lambda c: str(c["checkin_date"])))
+    plan_result = db.table("daily_plans").insert(plan_rows).execute()
+    # PostgREST returns inserted rows in input order; key by date anyway
+    plan_id_by_date = {str(row["plan_date"]): row["id"] for row in plan_result.data or []}
+    plan_ids = [plan_id_by_date.get(row["plan_date"]) for row in plan_rows]
 
     # ── 4. Interventions (Day 4 and Day 11) ──
     # Day 4 intervention (low energy day, stuck on task index 2)
@@ -0,0 +1,102 @@
+"""Incremental JSON parser for streamed agent output.
+
+The planning and intervention agents stream their final answer token by token.
+IncrementalTaskParser watches that text for a `"tasks"` / `"restructuredTasks"`
+array and yields each task object as soon as its closing brace arrives, so the
+websocket can forward tasks long before the crew run finishes.
+"""
+import json
+import re
+from pydantic import ValidationError
+from app.models import Task
+
+_ARRAY_KEY = re.compile(r'"(tasks|restructuredTasks)"\s*:\s*\[')
+
+
+class IncrementalTaskParser:
+    """Feed raw LLM chunks in; get fully-formed Task dicts out. O(total chars)."""
+
+    def __init__(self):
+        self._seen: set[tuple] = set()
+        self.start_message()
+
+    def start_message(self, message_id: str | None = None):
+        """Reset scan state for a new LLM call; tasks already emitted stay deduplicated."""
+        self.message_id = message_id
+        self._buf = ""
+        self._pos = 0              # next unscanned character in _buf
+        self._in_array = False     # inside a tasks array, between elements
+        self._obj_start = -1       # start index of the current task object
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> list[dict]:
+        if not chunk:
+            return []
+        self._buf += chunk
+        found: list[dict] = []
+
+        while self._pos < len(self._buf):
+            if not self._in_array:
+                match = _ARRAY_KEY.search(self._buf, self._pos)
+                if match is None:
+                    # Keep enough tail to match a key split across chunks
+                    self._pos = max(self._pos, len(self._buf) - 32)
+                    break
+                self._in_array = True
+                self._pos = match.end()
+                continue
+
+            ch = self._buf[self._pos]
+            if self._obj_start < 0:
+                if ch == "{":
+                    self._obj_start = self._pos
+                    self._depth = 1
+                elif ch == "]":
+                    self._in_array = False
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    task = self._parse(self._buf[self._obj_start:self._pos + 1])
+                    if task is not None:
+                        found.append(task)
+                    self._obj_start = -1
+            self._pos += 1
+
+        self._compact()
+        return found
+
+    def _parse(self, text: str) -> dict | None:
+        try:
+            task = Task.model_validate(json.loads(text)).model_dump()
+        except (json.JSONDecodeError, ValidationError):
+            return None
+        key = (task["index"], task["title"])
+        if key in self._seen:
+            return None
+        self._seen.add(key)
+        return task
+
+    def _compact(self):
+        """Drop already-scanned text so the buffer stays bounded by one task object."""
+        keep_from = self._obj_start if self._obj_start >= 0 else self._pos
+        if keep_from > 4096:
+            self._buf = self._buf[keep_from:]
+            self._pos -= keep_from
+            if self._obj_start >= 0:
+                self._obj_start = 0
@@ -0,0 +1,170 @@
+"""Request tracing with OpenTelemetry spans.
+
+One trace follows a request from the FastAPI route through the agent
+executor, crew kickoff, agent steps, LLM calls, tool invocations and
+Supabase queries. Span context lives in contextvars, so it crosses
+asyncio.to_thread and the agent executor (which runs each job in a copy of
+the submitting context) without extra plumbing.
+
+The service keeps its own TracerProvider instead of the global one, which
+CrewAI's telemetry may claim. Exporters (TRACE_EXPORTER):
+
+    none     tracing off; spans are no-ops
+    console  pretty-printed spans on stdout
+    file     one JSON span per line in TRACE_FILE
+    otlp     OTLP/HTTP to TRACE_OTLP_ENDPOINT (Jaeger, Tempo, an OTel collector)
+
+Sampling is decided once per trace at the root span: TRACE_SAMPLE_RATIO by
+default, overridden per path prefix with TRACE_SAMPLE_ROUTES
+("/api/plan=1,/api/dashboard=0.05"). Child spans follow their parent.
+"""
+import contextlib
+import logging
+import threading
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+EXPORTERS = ("none", "console", "file", "otlp")
+PATH_ATTRIBUTE = "url.path"
+
+_tracer: trace.Tracer = trace.NoOpTracer()
+_provider: TracerProvider | None = None
+
+
+# ── Sampling ──
+def parse_route_ratios(spec: str) -> list[tuple[str, float]]:
+    """"/api/plan=1,/api/dashboard=0.05" -> [(prefix, ratio)], longest prefix first."""
+    ratios = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        prefix, _, ratio = item.partition("=")
+        ratios.append((prefix.strip(), min(1.0, max(0.0, float(ratio)))))
+    return sorted(ratios, key=lambda r: len(r[0]), reverse=True)
+
+
+class RouteRatioSampler(Sampler):
+    """Trace-id ratio sampling with per-path-prefix overrides (root spans carry url.path)."""
+
+    def __init__(self, default_ratio: float, route_ratios: list[tuple[str, float]]):
+        self._default = TraceIdRatioBased(default_ratio)
+        self._routes = [(prefix, TraceIdRatioBased(ratio)) for prefix, ratio in route_ratios]
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        sampler = self._default
+        path = (attributes or {}).get(PATH_ATTRIBUTE)
+        if path:
+            sampler = next((s for prefix, s in self._routes if path.startswith(prefix)), self._default)
+        result = sampler.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        # Keep the caller's attributes on sampled spans (TraceIdRatioBased drops them)
+        if result.decision == Decision.RECORD_AND_SAMPLE:
+            return SamplingResult(result.decision, attributes, result.trace_state)
+        return result
+
+    def get_description(self) -> str:
+        return f"RouteRatioSampler{{{self._default.get_description()}, {len(self._routes)} routes}}"
+
+
+# ── Exporters ──
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends each finished span as one JSON line (the OTel SDK's own span JSON)."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock, open(self._path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            logger.warning(f"Could not write spans to {self._path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def _exporter(settings) -> SpanExporter:
+    if settings.trace_exporter == "console":
+        return ConsoleSpanExporter()
+    if settings.trace_exporter == "file":
+        return JsonLinesSpanExporter(settings.trace_file)
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    return OTLPSpanExporter(endpoint=settings.trace_otlp_endpoint or None)
+
+
+# ── Setup ──
+def setup_tracing(service_name: str = "attune-api") -> bool:
+    """Configure the tracer from settings (once per process). Returns whether tracing is on."""
+    global _tracer, _provider
+    if _provider is not None:
+        return True
+    settings = get_settings()
+    if settings.trace_exporter not in EXPORTERS:
+        logger.warning(f"Unknown TRACE_EXPORTER {settings.trace_exporter!r}, tracing disabled")
+        return False
+    if settings.trace_exporter == "none":
+        return False
+    sampler = ParentBased(RouteRatioSampler(
+        settings.trace_sample_ratio, parse_route_ratios(settings.trace_sample_routes),
+    ))
+    _provider = TracerProvider(resource=Resource.create({"service.name": service_name}), sampler=sampler)
+    _provider.add_span_processor(BatchSpanProcessor(_exporter(settings)))
+    _tracer = _provider.get_tracer("attune")
+    logger.info(f"Tracing to {settings.trace_exporter} (sample ratio {settings.trace_sample_ratio:g})")
+    return True
+
+
+def shutdown_tracing():
+    """Flush spans still buffered in the batch processor."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def enabled() -> bool:
+    return _provider is not None
+
+
+def get_tracer() -> trace.Tracer:
+    return _tracer
+
+
+@contextlib.contextmanager
+def span(name: str, kind: trace.SpanKind = trace.SpanKind.INTERNAL, **attributes):
+    """Current-context span; exceptions are recorded and mark the span as an error."""
+    with _tracer.start_as_current_span(name, kind=kind, attributes=attributes) as current:
+        yield current
+
+
+@contextlib.contextmanager
+def child_span(name: str, kind: trace.SpanKind = trace.SpanKind.INTERNAL, **attributes):
+    """Span only inside a sampled trace; never starts a trace of its own (e.g. queue polling)."""
+    if not trace.get_current_span().is_recording():
+        yield trace.INVALID_SPAN
+        return
+    with span(name, kind, **attributes) as current:
+        yield current
+
+
+def run_in_span(name: str, fn, *args, **attributes):
+    """fn(*args) inside a span (for callables handed to ctx.run or a thread)."""
+    with span(name, **attributes):
+        return fn(*args)
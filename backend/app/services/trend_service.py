@@ -0,0 +1,83 @@
+"""Long-range checkin trends: SQL rollups plus shape-preserving downsampling.
+
+Rollups (daily, weekly or monthly aggregates of mood, completion, brain-state
+mix and momentum) are computed in Postgres by the checkin_trend_rollup RPC.
+If a window still has more buckets than the requested point count, LTTB
+(Largest-Triangle-Three-Buckets) keeps the buckets that best preserve the
+shape of the composite series, so the payload size stays constant however
+long the window is.
+"""
+from datetime import date, timedelta
+import numpy as np
+from app.database import get_supabase_admin
+
+GRANULARITIES = ("day", "week", "month")
+MAX_WINDOW_DAYS = 10 * 366
+DEFAULT_POINTS = 60
+MAX_POINTS = 500
+
+
+def pick_granularity(days: int) -> str:
+    """Coarsest bucket that still leaves a readable number of points."""
+    if days <= 120:
+        return "day"
+    if days <= 730:
+        return "week"
+    return "month"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the `threshold` (>= 3) points LTTB keeps, always including the first and last."""
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    # Interior points split into threshold - 2 buckets
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Third vertex: average of the next bucket (or the last point)
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - next_x) * (by - y[a]) - (x[a] - bx) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def rollup(user_id: str, start: date, end: date, granularity: str) -> list[dict]:
+    return get_supabase_admin().rpc("checkin_trend_rollup", {
+        "p_user_id": user_id,
+        "p_start": start.isoformat(),
+        "p_end": end.isoformat(),
+        "p_granularity": granularity,
+    }).execute().data
+
+
+def trend(user_id: str, days: int, end: date | None = None, granularity: str | None = None,
+          points: int = DEFAULT_POINTS) -> dict:
+    """Rolled-up, downsampled trend for the `days` days ending on `end` (default: today)."""
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    granularity = granularity or pick_granularity(days)
+    buckets = rollup(user_id, start, end, granularity)
+    total = len(buckets)
+
+    if total > points:
+        x = np.array([np.datetime64(str(b["bucket"])[:10]).astype(int) for b in buckets], dtype=float)
+        # Select on the momentum composite so peaks in either mood or completion survive
+        y = np.array([float(b["mood_avg"]) * 6.0 + float(b["completion_avg"]) * 0.4 for b in buckets])
+        buckets = [buckets[i] for i in lttb_indices(x, y, points)]
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "granularity": granularity,
+        "total": total,
+        "buckets": buckets,
+    }
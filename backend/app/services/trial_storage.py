@@ -0,0 +1,188 @@
+"""Compact storage for the per-trial arrays of cognitive tests.
+
+Trials of reaction-time and time-perception tests live in
+cognitive_test_trials (one bytea blob per test) rather than inside
+cognitive_tests.raw_data. A blob is a small header followed by one
+little-endian typed array per field (columns, not rows, so zlib finds the
+repetition). The body is zlib-compressed when that makes it smaller.
+Derived fields (errorMs, errorPct) are not stored; they are recomputed on
+decode. Trials that would not round-trip exactly (fractional milliseconds,
+unknown fields) stay in raw_data as JSON.
+
+    header  <2sBBH  magic b"CT", format version, flags (bit 0: zlib), trial count
+    body    column arrays in TRIAL_SCHEMAS order
+
+A new test is saved with its trials as JSON. They are stripped from
+raw_data only after the blob is written, so a failed blob write loses
+nothing. Summary reads select cognitive_tests only; blobs are fetched and decoded
+only when raw trials are requested.
+"""
+import json
+import logging
+import struct
+import zlib
+import numpy as np
+from app.database import get_supabase_admin, select_in
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CT"
+VERSION = 1
+FLAG_ZLIB = 0x01
+_HEADER = struct.Struct("<2sBBH")
+MIGRATION_PAGE_SIZE = 500
+
+TRIAL_SCHEMAS: dict[str, list[tuple[str, str]]] = {
+    "reaction_time": [("trialIndex", "<u2"), ("reactionTimeMs", "<i4"), ("isFalseStart", "u1")],
+    "time_perception": [("trialIndex", "<u2"), ("targetMs", "<i4"), ("actualMs", "<i4")],
+}
+_DERIVED = {"time_perception": ("errorMs", "errorPct")}
+
+
+def _derive(test_type: str, columns: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    if test_type != "time_perception":
+        return {}
+    target = columns["targetMs"].astype(np.int64)
+    error = np.abs(columns["actualMs"].astype(np.int64) - target)
+    # Same arithmetic as the frontend: errorPct = errorMs / targetMs * 100
+    return {"errorMs": error, "errorPct": error / target * 100}
+
+
+# ── Codec ──
+def encode_trials(test_type: str, trials: list[dict], compress: bool = True) -> bytes | None:
+    """Packed trials, or None when they cannot be stored losslessly in the binary format."""
+    schema = TRIAL_SCHEMAS.get(test_type)
+    if schema is None or not trials or len(trials) > 0xFFFF:
+        return None
+    names = {name for name, _ in schema}
+    allowed = names | set(_DERIVED.get(test_type, ()))
+    if any(not isinstance(t, dict) or not names <= t.keys() or not t.keys() <= allowed for t in trials):
+        return None
+    columns = {}
+    try:
+        for name, dtype in schema:
+            values = np.array([t[name] for t in trials], dtype=np.float64)
+            packed = values.astype(dtype)
+            if not np.array_equal(packed.astype(np.float64), values):
+                return None  # fractional or out-of-range value
+            columns[name] = packed
+    except (TypeError, ValueError):
+        return None
+    for name, values in _derive(test_type, columns).items():
+        given = [t.get(name) for t in trials]
+        if any(g is not None for g in given) and not np.allclose(np.array(given, dtype=np.float64), values):
+            return None  # client-supplied derived value we could not reproduce
+    body = b"".join(columns[name].tobytes() for name, _ in schema)
+    flags = 0
+    if compress:
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body):
+            body, flags = packed, FLAG_ZLIB
+    return _HEADER.pack(MAGIC, VERSION, flags, len(trials)) + body
+
+
+def decode_trials(test_type: str, blob: bytes) -> list[dict]:
+    magic, version, flags, count = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported trial blob (magic {magic!r}, version {version})")
+    body = blob[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    columns, offset = {}, 0
+    for name, dtype in TRIAL_SCHEMAS[test_type]:
+        columns[name] = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+        offset += columns[name].nbytes
+    columns.update(_derive(test_type, columns))
+    as_lists = {
+        name: values.astype(bool).tolist() if name == "isFalseStart" else values.tolist()
+        for name, values in columns.items()
+    }
+    return [{name: values[i] for name, values in as_lists.items()} for i in range(count)]
+
+
+def to_bytea(blob: bytes) -> str:
+    """PostgREST takes and returns bytea as a \\x-prefixed hex string."""
+    return "\\x" + blob.hex()
+
+
+def from_bytea(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("\\x") else value)
+
+
+# ── Storage ──
+def split_raw_data(test_type: str, raw_data: dict, compress: bool = True) -> tuple[dict, bytes | None]:
+    """(raw_data without trials, blob) when the trials pack; otherwise (raw_data, None)."""
+    blob = encode_trials(test_type, raw_data.get("trials") or [], compress)
+    if blob is None:
+        return raw_data, None
+    return {k: v for k, v in raw_data.items() if k != "trials"}, blob
+
+
+def trial_row(test_id: str, user_id: str, test_type: str, blob: bytes) -> dict:
+    return {"test_id": test_id, "user_id": user_id, "test_type": test_type, "data": to_bytea(blob)}
+
+
+def pack_saved_trials(test_id: str, user_id: str, test_type: str, blob: bytes) -> bool:
+    """Write a just-saved test's blob, then strip its JSON trials. On failure the JSON copy stays."""
+    db = get_supabase_admin()
+    try:
+        db.table("cognitive_test_trials").insert(trial_row(test_id, user_id, test_type, blob)).execute()
+        db.rpc("strip_migrated_trials", {"p_test_ids": [test_id]}).execute()
+    except Exception as e:
+        logger.warning(f"Packing trials of test {test_id} failed, kept as JSON: {e}")
+        return False
+    return True
+
+
+def load_trials(tests: list[dict]) -> dict[str, list[dict]]:
+    """Trials per test id for the given cognitive_tests rows (id, test_type, raw_data optional)."""
+    out = {}
+    ids = [t["id"] for t in tests if t["test_type"] in TRIAL_SCHEMAS]
+    if ids:
+        db = get_supabase_admin()
+        rows = select_in(
+            lambda: db.table("cognitive_test_trials").select("test_id, test_type, data").order("test_id"),
+            "test_id", ids,
+        )
+        for row in rows:
+            out[row["test_id"]] = decode_trials(row["test_type"], from_bytea(row["data"]))
+    for t in tests:  # rows that never packed keep their trials as JSON
+        if t["id"] not in out and (t.get("raw_data") or {}).get("trials"):
+            out[t["id"]] = t["raw_data"]["trials"]
+    return out
+
+
+def migrate_raw_trials(page_size: int = MIGRATION_PAGE_SIZE, compress: bool = True) -> dict:
+    """Move JSON trials of existing rows into cognitive_test_trials. Blocking and resumable."""
+    db = get_supabase_admin()
+    summary = {"migrated": 0, "kept_json": 0, "bytes_before": 0, "bytes_after": 0}
+    after = None
+    while True:
+        query = (
+            db.table("cognitive_tests").select("id, user_id, test_type, raw_data")
+            .in_("test_type", list(TRIAL_SCHEMAS))
+            .not_.is_("raw_data->trials", "null")
+            .order("id").limit(page_size)
+        )
+        if after is not None:
+            query = query.gt("id", after)
+        rows = query.execute().data
+        if not rows:
+            break
+        after = rows[-1]["id"]
+        packed = []
+        for row in rows:
+            _, blob = split_raw_data(row["test_type"], row["raw_data"], compress)
+            if blob is None:
+                summary["kept_json"] += 1
+                continue
+            packed.append(trial_row(row["id"], row["user_id"], row["test_type"], blob))
+            summary["bytes_before"] += len(json.dumps(row["raw_data"]["trials"]))
+            summary["bytes_after"] += len(blob)
+        if packed:
+            db.table("cognitive_test_trials").upsert(packed, on_conflict="test_id").execute()
+            # Strips trials only where the blob now exists, so a crash in between loses nothing
+            db.rpc("strip_migrated_trials", {"p_test_ids": [r["test_id"] for r in packed]}).execute()
+        summary["migrated"] += len(packed)
+        logger.info(f"Trial storage migration: {summary['migrated']} migrated, {summary['kept_json']} kept as JSON")
+    return summary
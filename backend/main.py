@@ -1,11 +1,25 @@
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings
-from app.routes import auth, screening, profile, plan, dashboard, user, feedback, analytics
+from app.routes import auth, screening, profile, plan, dashboard, user, feedback, analytics, jobs, checkins, profiler
 from app.routes.websocket import router as ws_router
+from app.middleware.profiling import ProfileRequestsMiddleware
+from app.middleware.query_stats import track_queries
+from app.middleware.tracing import trace_requests
 from app.routes import cognitive_tests
+from app.services import metrics, tracing
+from app.services.profiler import get_profiler, install_signal_handler
+from app.services.agent_metrics import register_agent_metrics
+from app.services.agent_tracing import register_agent_tracing
+from app.services.job_worker import JobWorker
+from app.services.progress import get_progress_hub
+from app.services.progress_fanout import create_fanout
+from app.services.run_ledger import get_run_ledger, register_run_ledger
 
 settings = get_settings()
+tracing.setup_tracing()
 
 app = FastAPI(
     title="Attune API",
@@ -24,6 +38,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfileRequestsMiddleware)
+app.middleware("http")(track_queries)
+app.middleware("http")(trace_requests)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(screening.router, prefix="/api/screening", tags=["screening"])
@@ -35,8 +52,80 @@ app.include_router(feedback.router, prefix="/api/feedback", tags=["feedback"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
 app.include_router(ws_router, tags=["websocket"])
 app.include_router(cognitive_tests.router, prefix="/api/tests", tags=["cognitive_tests"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(checkins.router, prefix="/api/checkins", tags=["checkins"])
+app.include_router(profiler.router, prefix="/api/profiler", tags=["profiler"])
+
+
+# ── Agent progress fanout (PROGRESS_FANOUT=postgres|redis to reach other workers) ──
+@app.on_event("startup")
+async def start_progress_hub():
+    await get_progress_hub().start(create_fanout())
+
+
+@app.on_event("shutdown")
+async def stop_progress_hub():
+    await get_progress_hub().stop()
+
+
+# ── Agent metrics, trace spans (TRACE_EXPORTER) and the agent_runs ledger from CrewAI events ──
+@app.on_event("startup")
+async def start_agent_observability():
+    register_agent_metrics()
+    register_agent_tracing()
+    register_run_ledger()
+    await get_run_ledger().start()
+
+
+@app.on_event("shutdown")
+async def stop_agent_observability():
+    await get_run_ledger().stop()
+    tracing.shutdown_tracing()
+
+
+# ── On-demand sampling profiler (admin /api/profiler, or SIGUSR2 for a timed session) ──
+@app.on_event("startup")
+async def start_profiler_hook():
+    install_signal_handler()
+
+
+@app.on_event("shutdown")
+async def stop_profiler():
+    await asyncio.to_thread(get_profiler().stop)  # write out a session still running
+
+
+# ── Embedded job worker (disable with JOB_WORKER_EMBEDDED=false when running worker.py) ──
+_job_worker: JobWorker | None = None
+_job_worker_task: asyncio.Task | None = None
+
+
+@app.on_event("startup")
+async def start_job_worker():
+    global _job_worker, _job_worker_task
+    if settings.job_worker_embedded:
+        _job_worker = JobWorker()
+        _job_worker_task = asyncio.create_task(_job_worker.run_forever())
+
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    if _job_worker is not None:
+        await _job_worker.stop()
+        _job_worker_task.cancel()
 
 
 @app.get("/")
 def health():
     return {"status": "ok", "service": "attune-api"}
+
+
+@app.get("/api/metrics")
+def get_metrics():
+    """In-process counters and histograms (cache hit rates, agent path timings)."""
+    return metrics.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Same registry in the Prometheus text exposition format, for scraping."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,75 @@
+"""Benchmark for the cohort momentum engine on synthetic checkins.
+
+Feeds USERS x DAYS checkins (one per user per day) to CohortAggregator a page
+at a time, as the nightly job does, and compares against the per-user
+pure-Python momentum replay on a sample of users.
+
+    cd backend && python -m scripts.bench_cohort_momentum --users 100000 --days 365
+"""
+import argparse
+import time
+import numpy as np
+from app.services.cohort_momentum import CheckinColumns, CohortAggregator
+from app.services.momentum_service import replay
+
+TAGS = ("Deep-Diver", "Momentum-Builder", "Intensity-Engine", "Sprinter", "Night-Owl", "Steady-State")
+
+
+def synthetic_page(rng: np.random.Generator, first_user: int, users: int, days: int, first_day: int) -> CheckinColumns:
+    total = rng.integers(0, 9, users * days, dtype=np.int16)
+    return CheckinColumns(
+        user_ids=[f"user-{first_user + u}" for u in range(users)],
+        tags=[list(rng.choice(TAGS, 2, replace=False)) for _ in range(users)],
+        user=np.repeat(np.arange(users, dtype=np.int32), days),
+        day=np.tile(np.arange(first_day, first_day + days, dtype=np.int32), users),
+        mood=rng.integers(1, 11, users * days, dtype=np.int16),
+        completed=np.floor(rng.random(users * days) * (total + 1)).astype(np.int16),
+        total=total,
+        brain=rng.integers(-1, 3, users * days, dtype=np.int8),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--page-users", type=int, default=1000)
+    parser.add_argument("--python-sample", type=int, default=500, help="users timed with the per-user loop")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    first_day = 20_000
+    aggregator = CohortAggregator(first_day=first_day, days=args.days)
+    generate = compute = 0.0
+    for start in range(0, args.users, args.page_users):
+        t0 = time.perf_counter()
+        page = synthetic_page(rng, start, min(args.page_users, args.users - start), args.days, first_day)
+        t1 = time.perf_counter()
+        aggregator.add(page)
+        compute += time.perf_counter() - t1
+        generate += t1 - t0
+    t0 = time.perf_counter()
+    snapshot = aggregator.snapshot()
+    compute += time.perf_counter() - t0
+
+    rows = aggregator.checkins
+    print(f"vectorized: {args.users} users x {args.days} days = {rows:,} checkins in {compute:.2f} s "
+          f"({rows / compute / 1e6:.1f} M checkins/s; synthetic data generation {generate:.2f} s)")
+    print(f"  population p50 {snapshot['population']['percentiles']['p50']}, "
+          f"{len(snapshot['cohorts']['profileTag'])} tag cohorts, {len(snapshot['cohorts']['brainState'])} brain-state cohorts")
+
+    sample = synthetic_page(rng, 0, args.python_sample, args.days, first_day)
+    checkins = [
+        {"id": i, "mood_score": int(m), "tasks_completed": int(c), "tasks_total": int(t)}
+        for i, (m, c, t) in enumerate(zip(sample.mood, sample.completed, sample.total))
+    ]
+    t0 = time.perf_counter()
+    for u in range(args.python_sample):
+        replay(checkins[u * args.days:(u + 1) * args.days])
+    per_user = (time.perf_counter() - t0) / args.python_sample
+    print(f"per-user python loop: {per_user * 1000:.2f} ms/user -> ~{per_user * args.users:.0f} s for {args.users} users "
+          f"({per_user * args.users / compute:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Fanout benchmark for agent progress routing.
+
+Compares the old broadcast (every event into every connection's queue) with
+ProgressHub's per-user routing. Events are published from worker threads, the
+way CrewAI handlers publish them, to thousands of subscribed connections.
+Frames counts what the connections would send: with a frame rate set, bursts
+for one user are throttled into fewer frames, and with --tool-events
+(coalesced per run) into fewer messages as well.
+
+    cd backend && python -m scripts.bench_progress_fanout --connections 5000 --events 2000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+from app.services.progress import ProgressHub, Subscription
+
+
+class BroadcastHub(ProgressHub):
+    """The previous behaviour: ignore the target user and fill every stream."""
+
+    def publish(self, user_id: str, message: dict):
+        self._loop.call_soon_threadsafe(self._deliver_all, message)
+
+    def _deliver_all(self, message: dict):
+        with self._lock:
+            streams = list(self._streams.values())
+        for stream in streams:
+            stream.append(message)
+
+
+async def _consume(subscription: Subscription, latencies: list[float], stats: dict):
+    while True:
+        messages = await subscription.next_frame(timeout=60)
+        stats["frames"] += 1
+        now = time.perf_counter()
+        for message in messages:
+            if message["type"] == "resync":
+                stats["lost"] += message["missed"]
+                continue
+            latencies.append(now - message["sent"])
+            stats["delivered"] += 1
+            if message["user"] != subscription.user_id:
+                stats["cross_user"] += 1
+
+
+async def run(hub: ProgressHub, connections: int, users: int, events: int, threads: int,
+              event_type: str) -> dict:
+    user_ids = [f"user-{i}" for i in range(users)]
+    latencies: list[float] = []
+    stats = {"delivered": 0, "frames": 0, "cross_user": 0, "lost": 0}
+    subs = [hub.subscribe(user_ids[i % users]) for i in range(connections)]
+    consumers = [asyncio.create_task(_consume(s, latencies, stats)) for s in subs]
+
+    def publisher(count: int, seed: int):
+        rng = random.Random(seed)
+        for _ in range(count):
+            user_id = rng.choice(user_ids)
+            hub.publish(user_id, {"type": event_type, "user": user_id, "runId": user_id,
+                                  "sent": time.perf_counter()})
+
+    per_thread = events // threads
+    start = time.perf_counter()
+    workers = [threading.Thread(target=publisher, args=(per_thread, n)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    await asyncio.gather(*(asyncio.to_thread(w.join) for w in workers))
+    # Wait until every connection has read up to the end of its stream
+    while any(s.cursor < s._stream.seq for s in subs):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    for task in consumers:
+        task.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    for s in subs:
+        hub.unsubscribe(s)
+
+    latencies.sort()
+    return {
+        "events/s": per_thread * threads / elapsed,
+        **stats,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=None, help="distinct users (default: one per connection)")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--frame-rate", type=float, default=0.0, help="frames/s per connection (0: unthrottled)")
+    parser.add_argument("--tool-events", action="store_true", help="publish coalescable tool_started events")
+    args = parser.parse_args()
+    users = args.users or args.connections
+    options = {"replay_size": args.events, "frame_rate": args.frame_rate}
+
+    for name, hub in (("broadcast", BroadcastHub(**options)), ("per-user", ProgressHub(**options))):
+        event_type = "tool_started" if args.tool_events else "agent_started"
+        result = asyncio.run(run(hub, args.connections, users, args.events, args.threads, event_type))
+        print(
+            f"{name:>10}: {result['events/s']:>10.0f} events/s  {result['delivered']:>9} delivered "
+            f"in {result['frames']:>9} frames  {result['cross_user']:>9} to other users  {result['lost']} lost  "
+            f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
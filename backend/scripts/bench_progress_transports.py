@@ -0,0 +1,156 @@
+"""Connection-overhead benchmark: progress over websockets vs Server-Sent Events.
+
+Starts a uvicorn server per transport (in a subprocess, so its memory can be
+measured on its own) that serves the production streaming loops without JWT
+auth, opens N watchers against it, and reports connect time, server memory
+per connection and the time for one published message to reach every watcher.
+
+    cd backend && python -m scripts.bench_progress_transports --connections 2000
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+import aiohttp
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.routes.websocket import pump_websocket, sse_events
+from app.services.progress import ProgressHub
+
+
+def _rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    hub = ProgressHub(frame_rate=0)
+
+    @app.websocket("/ws/{user_id}")
+    async def ws(websocket: WebSocket, user_id: str):
+        await websocket.accept()
+        subscription = hub.subscribe(user_id)
+        try:
+            await pump_websocket(websocket, subscription)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            hub.unsubscribe(subscription)
+
+    @app.get("/sse/{user_id}")
+    async def sse(user_id: str):
+        async def stream():
+            subscription = hub.subscribe(user_id)
+            try:
+                async for event in sse_events(subscription):
+                    yield event
+            finally:
+                hub.unsubscribe(subscription)
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"connections": hub.connections(), "rss_kb": _rss_kb()}
+
+    @app.post("/publish")
+    async def publish():
+        with hub._lock:
+            user_ids = list(hub._streams)
+
+        def crew():  # publish from a worker thread, like CrewAI handlers do
+            for user_id in user_ids:
+                hub.publish(user_id, {"type": "agent_started", "message": "Analyzing your cognitive profile..."})
+        await asyncio.to_thread(crew)
+        return {"users": len(user_ids)}
+
+    return app
+
+
+async def _watch_ws(session: aiohttp.ClientSession, base: str, user_id: str, received: asyncio.Queue):
+    async with session.ws_connect(f"{base.replace('http', 'ws')}/ws/{user_id}") as ws:
+        async for message in ws:
+            if '"agent_started"' in message.data:
+                received.put_nowait(time.perf_counter())
+
+
+async def _watch_sse(session: aiohttp.ClientSession, base: str, user_id: str, received: asyncio.Queue):
+    async with session.get(f"{base}/sse/{user_id}") as response:
+        async for line in response.content:
+            if line.startswith(b"data:") and b'"agent_started"' in line:
+                received.put_nowait(time.perf_counter())
+
+
+async def measure(transport: str, port: int, connections: int) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "scripts.bench_progress_transports", "--serve", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    watch = _watch_ws if transport == "websocket" else _watch_sse
+    received: asyncio.Queue = asyncio.Queue()
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0),
+                                         timeout=aiohttp.ClientTimeout(total=None)) as session:
+            for _ in range(100):
+                try:
+                    async with session.get(f"{base}/stats") as r:
+                        baseline = await r.json()
+                    break
+                except aiohttp.ClientConnectionError:
+                    await asyncio.sleep(0.1)
+            start = time.perf_counter()
+            watchers = [asyncio.create_task(watch(session, base, f"user-{i}", received)) for i in range(connections)]
+            while True:
+                async with session.get(f"{base}/stats") as r:
+                    loaded = await r.json()
+                if loaded["connections"] >= connections:
+                    break
+                await asyncio.sleep(0.05)
+            connect_seconds = time.perf_counter() - start
+
+            sent = time.perf_counter()
+            async with session.post(f"{base}/publish") as r:
+                await r.json()
+            last = sent
+            for _ in range(connections):
+                last = await asyncio.wait_for(received.get(), timeout=60)
+            for task in watchers:
+                task.cancel()
+            await asyncio.gather(*watchers, return_exceptions=True)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "connect_s": connect_seconds,
+        "kb_per_conn": (loaded["rss_kb"] - baseline["rss_kb"]) / connections,
+        "fanout_ms": (last - sent) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        import uvicorn
+        uvicorn.run(build_app(), host="127.0.0.1", port=args.serve, log_level="warning")
+        return
+
+    for transport in ("websocket", "sse"):
+        result = asyncio.run(measure(transport, args.port, args.connections))
+        print(
+            f"{transport:>9}: {args.connections} watchers connected in {result['connect_s']:.2f} s  "
+            f"{result['kb_per_conn']:.1f} KB/connection  fanout to all {result['fanout_ms']:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -249,3 +249,524 @@ CREATE INDEX IF NOT EXISTS idx_cognitive_tests_type ON cognitive_tests(test_type
 ALTER TABLE cognitive_tests ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "Own tests only" ON cognitive_tests
   FOR ALL USING (auth.uid() = user_id);
+
+-- ============================================================
+-- PHASE 6: Durable Agent Job Queue
+-- ============================================================
+-- Background agent work (pattern detection, ...) is queued here and
+-- claimed by workers with FOR UPDATE SKIP LOCKED. A job that is not
+-- finished before locked_until becomes visible again (worker crash).
+-- dedupe_key is unique: enqueueing the same key twice returns the
+-- existing job instead of creating a second one.
+CREATE TABLE IF NOT EXISTS agent_jobs (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  job_type TEXT NOT NULL,
+  user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+  payload JSONB NOT NULL DEFAULT '{}',
+  dedupe_key TEXT UNIQUE,
+  status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL DEFAULT 3,
+  run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+  locked_until TIMESTAMPTZ,
+  locked_by TEXT,
+  last_error TEXT,
+  result JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_ready ON agent_jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_user ON agent_jobs(user_id, created_at DESC);
+
+ALTER TABLE agent_jobs ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Own jobs only" ON agent_jobs
+  FOR SELECT USING (auth.uid() = user_id);
+
+-- Insert a job unless one with the same dedupe_key exists; returns the live row either way.
+CREATE OR REPLACE FUNCTION enqueue_agent_job(
+  p_job_type TEXT,
+  p_user_id UUID,
+  p_payload JSONB,
+  p_dedupe_key TEXT,
+  p_max_attempts INTEGER DEFAULT 3
+) RETURNS SETOF agent_jobs AS $$
+BEGIN
+  RETURN QUERY
+    INSERT INTO agent_jobs (job_type, user_id, payload, dedupe_key, max_attempts)
+    VALUES (p_job_type, p_user_id, COALESCE(p_payload, '{}'), p_dedupe_key, p_max_attempts)
+    ON CONFLICT (dedupe_key) DO NOTHING
+    RETURNING *;
+  IF NOT FOUND THEN
+    RETURN QUERY SELECT * FROM agent_jobs WHERE dedupe_key = p_dedupe_key;
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Claim the next runnable job for a worker. Expired leases that have used up
+-- their attempts are failed first so they are not retried forever.
+CREATE OR REPLACE FUNCTION claim_agent_job(
+  p_worker_id TEXT,
+  p_job_types TEXT[],
+  p_visibility_seconds INTEGER
+) RETURNS SETOF agent_jobs AS $$
+BEGIN
+  UPDATE agent_jobs
+     SET status = 'failed', last_error = 'visibility timeout exceeded', finished_at = now(), updated_at = now()
+   WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts;
+
+  RETURN QUERY
+    UPDATE agent_jobs
+       SET status = 'running',
+           attempts = attempts + 1,
+           locked_by = p_worker_id,
+           locked_until = now() + make_interval(secs => p_visibility_seconds),
+           updated_at = now()
+     WHERE id = (
+       SELECT id FROM agent_jobs
+        WHERE job_type = ANY(p_job_types)
+          AND ((status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND locked_until < now()))
+        ORDER BY run_after
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+     )
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- PHASE 7: Nightly Batch Pattern Detection
+-- ============================================================
+-- Keyset-paginated sweep of users due for pattern detection: at least
+-- p_min_checkins checkins and no hypothesis card in the last p_stale_hours.
+CREATE OR REPLACE FUNCTION pattern_batch_candidates(
+  p_min_checkins INTEGER,
+  p_stale_hours INTEGER,
+  p_after UUID DEFAULT NULL,
+  p_limit INTEGER DEFAULT 200
+) RETURNS TABLE (user_id UUID) AS $$
+  SELECT c.user_id
+    FROM checkins c
+   WHERE p_after IS NULL OR c.user_id > p_after
+   GROUP BY c.user_id
+  HAVING count(*) >= p_min_checkins
+     AND NOT EXISTS (
+       SELECT 1 FROM hypothesis_cards h
+        WHERE h.user_id = c.user_id
+          AND h.created_at > now() - make_interval(hours => p_stale_hours)
+     )
+   ORDER BY c.user_id
+   LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+CREATE INDEX IF NOT EXISTS idx_hypothesis_user_created ON hypothesis_cards(user_id, created_at DESC);
+
+-- ============================================================
+-- PHASE 8: Incremental Hypothesis Evaluation
+-- ============================================================
+-- condition: machine-checkable form of the prediction (see hypothesis_engine.py)
+-- evaluation: running out-of-sample counts {"trials", "hits"}
+-- evaluated_through: last checkin_date already evaluated (cursor)
+ALTER TABLE hypothesis_cards ADD COLUMN IF NOT EXISTS condition JSONB;
+ALTER TABLE hypothesis_cards ADD COLUMN IF NOT EXISTS evaluation JSONB NOT NULL DEFAULT '{}';
+ALTER TABLE hypothesis_cards ADD COLUMN IF NOT EXISTS evaluated_through DATE;
+
+-- ============================================================
+-- PHASE 9: Hypothesis Card Dedupe + Bounded Active Set
+-- ============================================================
+-- Restated cards are merged into existing ones (last_detected_at bumped);
+-- cards beyond each user's active cap get archived_at and leave the dashboard.
+ALTER TABLE hypothesis_cards ADD COLUMN IF NOT EXISTS last_detected_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE hypothesis_cards ADD COLUMN IF NOT EXISTS archived_at TIMESTAMPTZ;
+
+UPDATE hypothesis_cards SET last_detected_at = created_at WHERE last_detected_at > created_at;
+
+-- One-off: keep only the 6 newest active cards per user
+UPDATE hypothesis_cards SET archived_at = now()
+ WHERE id IN (
+   SELECT id FROM (
+     SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY created_at DESC) AS rn
+       FROM hypothesis_cards
+      WHERE archived_at IS NULL
+   ) ranked
+   WHERE rn > 6
+ );
+
+CREATE INDEX IF NOT EXISTS idx_hypothesis_active ON hypothesis_cards(user_id, created_at) WHERE archived_at IS NULL;
+
+-- Sweep by most recent detection of an active card instead of card creation
+CREATE OR REPLACE FUNCTION pattern_batch_candidates(
+  p_min_checkins INTEGER,
+  p_stale_hours INTEGER,
+  p_after UUID DEFAULT NULL,
+  p_limit INTEGER DEFAULT 200
+) RETURNS TABLE (user_id UUID) AS $$
+  SELECT c.user_id
+    FROM checkins c
+   WHERE p_after IS NULL OR c.user_id > p_after
+   GROUP BY c.user_id
+  HAVING count(*) >= p_min_checkins
+     AND NOT EXISTS (
+       SELECT 1 FROM hypothesis_cards h
+        WHERE h.user_id = c.user_id
+          AND h.archived_at IS NULL
+          AND h.last_detected_at > now() - make_interval(hours => p_stale_hours)
+     )
+   ORDER BY c.user_id
+   LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================================
+-- PHASE 10: Incremental Momentum
+-- ============================================================
+-- One row per user: composites of the last 14 checkins (oldest first) and their
+-- running sum, updated per checkin (see momentum_service.py). version guards
+-- against two checkins updating the same state concurrently.
+CREATE TABLE IF NOT EXISTS momentum_state (
+  user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  composites JSONB NOT NULL DEFAULT '[]',
+  running_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  score INTEGER NOT NULL DEFAULT 0,
+  delta INTEGER NOT NULL DEFAULT 0,
+  last_checkin_date DATE,
+  version INTEGER NOT NULL DEFAULT 1,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE momentum_state ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Own data only" ON momentum_state
+  FOR ALL USING (auth.uid() = user_id);
+
+-- Daily history: momentum as of each checkin
+ALTER TABLE checkins ADD COLUMN IF NOT EXISTS momentum_score INTEGER;
+ALTER TABLE checkins ADD COLUMN IF NOT EXISTS momentum_delta INTEGER;
+
+-- Bulk history write for the backfill job: p_rows = [{"id", "score", "delta"}, ...]
+CREATE OR REPLACE FUNCTION set_checkin_momentum(p_rows JSONB) RETURNS VOID AS $$
+  UPDATE checkins c
+     SET momentum_score = (r->>'score')::INTEGER,
+         momentum_delta = (r->>'delta')::INTEGER
+    FROM jsonb_array_elements(p_rows) AS r
+   WHERE c.id = (r->>'id')::UUID;
+$$ LANGUAGE sql;
+
+-- ============================================================
+-- PHASE 11: Nightly Cohort Momentum
+-- ============================================================
+-- Keyset-paginated columnar load: one row per user with their checkins since
+-- p_since as parallel arrays (ordered by date) and their latest profile tags.
+CREATE OR REPLACE FUNCTION cohort_checkin_columns(
+  p_since DATE,
+  p_after UUID DEFAULT NULL,
+  p_limit INTEGER DEFAULT 1000
+) RETURNS TABLE (
+  user_id UUID,
+  profile_tags TEXT[],
+  dates DATE[],
+  moods INTEGER[],
+  completed INTEGER[],
+  totals INTEGER[],
+  energy_levels TEXT[]
+) AS $$
+  SELECT c.user_id,
+         (SELECT p.profile_tags FROM cognitive_profiles p
+           WHERE p.user_id = c.user_id ORDER BY p.created_at DESC LIMIT 1),
+         array_agg(c.checkin_date ORDER BY c.checkin_date, c.created_at),
+         array_agg(c.mood_score ORDER BY c.checkin_date, c.created_at),
+         array_agg(c.tasks_completed ORDER BY c.checkin_date, c.created_at),
+         array_agg(c.tasks_total ORDER BY c.checkin_date, c.created_at),
+         array_agg(c.energy_level ORDER BY c.checkin_date, c.created_at)
+    FROM checkins c
+   WHERE c.checkin_date >= p_since
+     AND (p_after IS NULL OR c.user_id > p_after)
+   GROUP BY c.user_id
+   ORDER BY c.user_id
+   LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- One aggregate snapshot per day (population + cohort distributions and trends)
+CREATE TABLE IF NOT EXISTS cohort_momentum_snapshots (
+  snapshot_date DATE PRIMARY KEY,
+  stats JSONB NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Service role only: no user-facing policies
+ALTER TABLE cohort_momentum_snapshots ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================
+-- PHASE 12: Long-Range Trend Rollups
+-- ============================================================
+-- Daily/weekly/monthly aggregates of one user's checkins in [p_start, p_end].
+-- Brain state follows the dashboard mapping of energy_level (low/medium/high ->
+-- foggy/focused/wired); completion treats tasks_total = 0 as 1 like the API does.
+CREATE OR REPLACE FUNCTION checkin_trend_rollup(
+  p_user_id UUID,
+  p_start DATE,
+  p_end DATE,
+  p_granularity TEXT DEFAULT 'day'
+) RETURNS TABLE (
+  bucket DATE,
+  checkins INTEGER,
+  mood_avg NUMERIC,
+  completion_avg NUMERIC,
+  tasks_completed INTEGER,
+  tasks_total INTEGER,
+  foggy INTEGER,
+  focused INTEGER,
+  wired INTEGER,
+  momentum_avg NUMERIC
+) AS $$
+  SELECT date_trunc(p_granularity, c.checkin_date)::DATE AS bucket,
+         count(*)::INTEGER,
+         avg(c.mood_score),
+         avg(c.tasks_completed * 100.0 / GREATEST(c.tasks_total, 1)),
+         sum(c.tasks_completed)::INTEGER,
+         sum(c.tasks_total)::INTEGER,
+         count(*) FILTER (WHERE c.energy_level = 'low')::INTEGER,
+         count(*) FILTER (WHERE c.energy_level = 'medium' OR c.energy_level IS NULL)::INTEGER,
+         count(*) FILTER (WHERE c.energy_level = 'high')::INTEGER,
+         avg(c.momentum_score)
+    FROM checkins c
+   WHERE c.user_id = p_user_id
+     AND c.checkin_date BETWEEN p_start AND p_end
+   GROUP BY 1
+   ORDER BY 1;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================================
+-- PHASE 13: Cognitive Test Population Norms
+-- ============================================================
+-- One fixed-edge histogram per (test type, metric); edges live in
+-- app/services/cognitive_metrics.py (NORM_EDGES). Each saved test
+-- increments one bin per metric. Rebuild from raw trials with
+-- `python worker.py --test-norms` after changing the edges.
+CREATE TABLE IF NOT EXISTS cognitive_test_norms (
+  test_type TEXT NOT NULL,
+  metric TEXT NOT NULL,
+  counts BIGINT[] NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (test_type, metric)
+);
+
+-- Aggregates only, read and written by the backend (service role)
+ALTER TABLE cognitive_test_norms ENABLE ROW LEVEL SECURITY;
+
+-- p_bins: {"<metric>": {"bin": <0-based bin>, "size": <number of bins>}, ...}
+CREATE OR REPLACE FUNCTION record_test_norms(p_test_type TEXT, p_bins JSONB)
+RETURNS VOID AS $$
+DECLARE
+  m TEXT;
+  b JSONB;
+  i INTEGER;
+BEGIN
+  FOR m, b IN SELECT * FROM jsonb_each(p_bins) LOOP
+    i := (b->>'bin')::INTEGER + 1;
+    INSERT INTO cognitive_test_norms (test_type, metric, counts)
+    VALUES (p_test_type, m, array_fill(0::BIGINT, ARRAY[(b->>'size')::INTEGER]))
+    ON CONFLICT (test_type, metric) DO NOTHING;
+    UPDATE cognitive_test_norms
+       SET counts[i] = counts[i] + 1, updated_at = now()
+     WHERE test_type = p_test_type AND metric = m;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- PHASE 14: Packed Cognitive Test Trials
+-- ============================================================
+-- Per-trial arrays move out of cognitive_tests.raw_data into a side table
+-- as a compact little-endian blob (format in app/services/trial_storage.py),
+-- so summary reads never load them. Existing rows are converted with
+-- `python worker.py --migrate-trials`.
+CREATE TABLE IF NOT EXISTS cognitive_test_trials (
+  test_id UUID PRIMARY KEY REFERENCES cognitive_tests(id) ON DELETE CASCADE,
+  user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  test_type TEXT NOT NULL,
+  data BYTEA NOT NULL
+);
+
+ALTER TABLE cognitive_test_trials ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Own tests only" ON cognitive_test_trials
+  FOR ALL USING (auth.uid() = user_id);
+
+-- Drop the JSON copy once the packed one exists (migration step)
+CREATE OR REPLACE FUNCTION strip_migrated_trials(p_test_ids UUID[])
+RETURNS VOID AS $$
+  UPDATE cognitive_tests t
+     SET raw_data = t.raw_data - 'trials'
+   WHERE t.id = ANY(p_test_ids)
+     AND EXISTS (SELECT 1 FROM cognitive_test_trials c WHERE c.test_id = t.id);
+$$ LANGUAGE sql;
+
+-- ============================================================
+-- PHASE 15: Agent Run Ledger
+-- ============================================================
+-- One row per run_agent call, written in batches by the backend
+-- (app/services/run_ledger.py). status: ok | degraded | error |
+-- cancelled | rejected | circuit_open | deadline. fallback is the degraded
+-- path's reason (circuit_open, deadline, provider_error). steps holds
+-- [{agent, task, offsetMs, ms, ok}]; agent_stats per-agent step time,
+-- LLM/tool calls and tokens.
+CREATE TABLE IF NOT EXISTS agent_runs (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  route TEXT NOT NULL,
+  entrypoint TEXT NOT NULL,
+  user_id UUID,  -- no FK, so a deleted user never fails a batch insert (account deletion clears rows)
+  status TEXT NOT NULL,
+  attempts SMALLINT NOT NULL DEFAULT 0,
+  retries SMALLINT NOT NULL DEFAULT 0,
+  fallback TEXT,
+  output_valid BOOLEAN,
+  error TEXT,
+  input_hash TEXT NOT NULL,
+  agents TEXT[] NOT NULL DEFAULT '{}',
+  steps JSONB NOT NULL DEFAULT '[]',
+  agent_stats JSONB NOT NULL DEFAULT '{}',
+  llm_calls INTEGER NOT NULL DEFAULT 0,
+  tool_calls INTEGER NOT NULL DEFAULT 0,
+  prompt_tokens INTEGER NOT NULL DEFAULT 0,
+  completion_tokens INTEGER NOT NULL DEFAULT 0,
+  queue_wait_ms INTEGER NOT NULL DEFAULT 0,
+  duration_ms INTEGER,
+  trace_id TEXT,
+  started_at TIMESTAMPTZ NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_agent_runs_route_started ON agent_runs(route, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_agent_runs_user_started ON agent_runs(user_id, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_agent_runs_input_hash ON agent_runs(input_hash);
+
+-- Operational data, read and written by the backend (service role)
+ALTER TABLE agent_runs ENABLE ROW LEVEL SECURITY;
+
+-- Latency percentiles since p_since, grouped by p_group:
+--   route    route / entrypoint
+--   agent    agent role (per agent step, from steps)
+--   segment  route / guest-or-registered / screen-positive-or-not
+-- (run-level groups count runs; the agent group counts steps)
+CREATE OR REPLACE FUNCTION agent_run_latency(p_since TIMESTAMPTZ, p_group TEXT DEFAULT 'route')
+RETURNS TABLE (
+  group_key TEXT, runs BIGINT, p50_ms DOUBLE PRECISION, p95_ms DOUBLE PRECISION,
+  error_rate DOUBLE PRECISION, degraded_rate DOUBLE PRECISION, avg_retries DOUBLE PRECISION,
+  avg_tokens DOUBLE PRECISION
+) AS $$
+BEGIN
+  IF p_group = 'agent' THEN
+    RETURN QUERY
+      SELECT s->>'agent',
+             count(*),
+             percentile_cont(0.5) WITHIN GROUP (ORDER BY (s->>'ms')::DOUBLE PRECISION),
+             percentile_cont(0.95) WITHIN GROUP (ORDER BY (s->>'ms')::DOUBLE PRECISION),
+             avg(CASE WHEN (s->>'ok')::BOOLEAN THEN 0.0 ELSE 1.0 END),
+             avg(CASE WHEN r.status = 'degraded' THEN 1.0 ELSE 0.0 END),
+             avg(r.retries::DOUBLE PRECISION),
+             avg(COALESCE((r.agent_stats->(s->>'agent')->>'promptTokens')::DOUBLE PRECISION, 0)
+               + COALESCE((r.agent_stats->(s->>'agent')->>'completionTokens')::DOUBLE PRECISION, 0))
+        FROM agent_runs r, jsonb_array_elements(r.steps) s
+       WHERE r.started_at >= p_since AND s->>'ms' IS NOT NULL
+       GROUP BY 1 ORDER BY 1;
+  ELSE
+    RETURN QUERY
+      WITH scoped AS (
+        SELECT r.*,
+               CASE WHEN p_group = 'segment' THEN
+                 r.route
+                 || CASE WHEN u.is_guest THEN '/guest' ELSE '/registered' END
+                 || CASE
+                      WHEN p.is_positive_screen THEN '/screen_positive'
+                      WHEN p.is_positive_screen IS NULL THEN '/unscreened'
+                      ELSE '/screen_negative'
+                    END
+               ELSE r.route || '/' || r.entrypoint END AS key
+          FROM agent_runs r
+          LEFT JOIN users u ON u.id = r.user_id
+          LEFT JOIN LATERAL (
+            SELECT cp.is_positive_screen FROM cognitive_profiles cp
+             WHERE cp.user_id = r.user_id ORDER BY cp.created_at DESC LIMIT 1
+          ) p ON TRUE
+         WHERE r.started_at >= p_since AND r.duration_ms IS NOT NULL
+      )
+      SELECT key,
+             count(*),
+             percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms::DOUBLE PRECISION),
+             percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms::DOUBLE PRECISION),
+             avg(CASE WHEN status IN ('ok', 'degraded') THEN 0.0 ELSE 1.0 END),
+             avg(CASE WHEN status = 'degraded' THEN 1.0 ELSE 0.0 END),
+             avg(retries::DOUBLE PRECISION),
+             avg((prompt_tokens + completion_tokens)::DOUBLE PRECISION)
+        FROM scoped GROUP BY key ORDER BY key;
+  END IF;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Per-route run counts and latency for one user (analytics summary)
+CREATE OR REPLACE FUNCTION agent_run_user_summary(p_user_id UUID)
+RETURNS TABLE (
+  route TEXT, runs BIGINT, succeeded BIGINT, degraded BIGINT,
+  avg_ms DOUBLE PRECISION, p50_ms DOUBLE PRECISION, p95_ms DOUBLE PRECISION, total_tokens BIGINT
+) AS $$
+  SELECT route,
+         count(*),
+         count(*) FILTER (WHERE status = 'ok'),
+         count(*) FILTER (WHERE status = 'degraded'),
+         avg(duration_ms) FILTER (WHERE status IN ('ok', 'degraded')),
+         percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms) FILTER (WHERE status IN ('ok', 'degraded')),
+         percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) FILTER (WHERE status IN ('ok', 'degraded')),
+         sum(prompt_tokens + completion_tokens)
+    FROM agent_runs
+   WHERE user_id = p_user_id
+   GROUP BY route ORDER BY route;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================================
+-- PHASE 16: Live-Only Job Dedupe
+-- ============================================================
+-- A dedupe_key is held only while its job is queued or running, so a
+-- failed job never blocks a retry. A succeeded job is returned instead of
+-- a new one for p_succeeded_ttl_seconds after it finished (NULL: forever,
+-- for once-per-key jobs such as the nightly ones).
+ALTER TABLE agent_jobs DROP CONSTRAINT IF EXISTS agent_jobs_dedupe_key_key;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_agent_jobs_live_dedupe
+  ON agent_jobs(dedupe_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_dedupe ON agent_jobs(dedupe_key, finished_at DESC);
+
+DROP FUNCTION IF EXISTS enqueue_agent_job(TEXT, UUID, JSONB, TEXT, INTEGER);
+CREATE OR REPLACE FUNCTION enqueue_agent_job(
+  p_job_type TEXT,
+  p_user_id UUID,
+  p_payload JSONB,
+  p_dedupe_key TEXT,
+  p_max_attempts INTEGER DEFAULT 3,
+  p_succeeded_ttl_seconds INTEGER DEFAULT NULL
+) RETURNS SETOF agent_jobs AS $$
+BEGIN
+  IF p_dedupe_key IS NOT NULL THEN
+    -- Serialize enqueues of one key so the lookup and the insert agree
+    PERFORM pg_advisory_xact_lock(hashtext(p_dedupe_key));
+    RETURN QUERY
+      SELECT * FROM agent_jobs
+       WHERE dedupe_key = p_dedupe_key
+         AND (status IN ('queued', 'running')
+              OR (status = 'succeeded'
+                  AND (p_succeeded_ttl_seconds IS NULL
+                       OR finished_at > now() - make_interval(secs => p_succeeded_ttl_seconds))))
+       ORDER BY status IN ('queued', 'running') DESC, finished_at DESC
+       LIMIT 1;
+    IF FOUND THEN
+      RETURN;
+    END IF;
+  END IF;
+  RETURN QUERY
+    INSERT INTO agent_jobs (job_type, user_id, payload, dedupe_key, max_attempts)
+    VALUES (p_job_type, p_user_id, COALESCE(p_payload, '{}'), p_dedupe_key, p_max_attempts)
+    ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+    RETURNING *;
+  IF NOT FOUND THEN
+    RETURN QUERY SELECT * FROM agent_jobs WHERE dedupe_key = p_dedupe_key AND status IN ('queued', 'running');
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,79 @@
+"""Standalone worker for the durable agent job queue.
+
+Run alongside the API (set JOB_WORKER_EMBEDDED=false there):
+    python worker.py
+Run the nightly pattern batch once, in the foreground:
+    python worker.py --pattern-batch
+Rebuild momentum state and history for all users (one-off backfill):
+    python worker.py --momentum-backfill
+Compute today's population/cohort momentum snapshot:
+    python worker.py --cohort-momentum
+Rebuild cognitive test population norms from stored trials:
+    python worker.py --test-norms
+Move JSON trial arrays of existing cognitive tests into packed binary storage:
+    python worker.py --migrate-trials
+
+Send SIGUSR2 to a running worker to profile it for PROFILE_SIGNAL_SECONDS
+(again to stop early); flamegraph stacks are written to PROFILE_DIR.
+"""
+import argparse
+import asyncio
+import logging
+from app.services import tracing
+from app.services.agent_metrics import register_agent_metrics
+from app.services.agent_tracing import register_agent_tracing
+from app.services.job_worker import JobWorker
+from app.services.profiler import get_profiler, install_signal_handler
+from app.services.progress import get_progress_hub
+from app.services.progress_fanout import create_fanout
+from app.services.run_ledger import get_run_ledger, register_run_ledger
+
+
+async def main():
+    register_agent_metrics()
+    if tracing.setup_tracing("attune-worker"):
+        register_agent_tracing()
+    register_run_ledger()
+    ledger = get_run_ledger()
+    await ledger.start()
+    install_signal_handler()
+    # Progress from crews run here only reaches websockets with a cross-process fanout configured
+    hub = get_progress_hub()
+    await hub.start(create_fanout())
+    worker = JobWorker()
+    try:
+        await worker.run_forever()
+    finally:
+        await worker.stop()
+        await hub.stop()
+        await ledger.stop()
+        tracing.shutdown_tracing()
+        await asyncio.to_thread(get_profiler().stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attune background job worker")
+    parser.add_argument("--pattern-batch", action="store_true", help="run one pattern batch sweep and exit")
+    parser.add_argument("--momentum-backfill", action="store_true", help="backfill momentum state and history, then exit")
+    parser.add_argument("--cohort-momentum", action="store_true", help="compute the cohort momentum snapshot, then exit")
+    parser.add_argument("--test-norms", action="store_true", help="rebuild cognitive test norms, then exit")
+    parser.add_argument("--migrate-trials", action="store_true", help="pack existing JSON test trials, then exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.pattern_batch:
+        from app.services.pattern_batch import run_pattern_batch
+        print(run_pattern_batch())
+    elif args.momentum_backfill:
+        from app.services.momentum_service import backfill_momentum
+        print(backfill_momentum())
+    elif args.cohort_momentum:
+        from app.services.cohort_momentum import run_cohort_momentum
+        print(run_cohort_momentum())
+    elif args.test_norms:
+        from app.services.cognitive_metrics import rebuild_norms
+        print(rebuild_norms())
+    elif args.migrate_trials:
+        from app.services.trial_storage import migrate_raw_trials
+        print(migrate_raw_trials())
+    else:
+        asyncio.run(main())
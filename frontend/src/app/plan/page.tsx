@@ -534,7 +534,7 @@ export default function PlanPage() {
 
   const {
     brainState, setBrainState,
-    plan, isGenerating, generateDailyPlan,
+    plan, isGenerating, progressMessage, streamedTasks, generateDailyPlan,
     isIntervening, intervention, triggerStuck, clearIntervention,
     toggleTaskComplete, resetPlan, error,
   } = useDailyPlan();
@@ -551,7 +551,17 @@ export default function PlanPage() {
       <PageContainer className="max-w-2xl">
         <div className="flex min-h-[50vh] flex-col items-center justify-center gap-4 text-center">
           <LoadingSpinner label="Building your personalised plan…" size={28} />
-          <p className="text-xs text-faint-foreground">Scheduling your tasks with smart breaks.</p>
+          <p className="text-xs text-faint-foreground">{progressMessage ?? "Scheduling your tasks with smart breaks."}</p>
+          {streamedTasks.length > 0 && (
+            <ul className="mt-2 flex w-full flex-col gap-2 text-left">
+              {streamedTasks.map((task) => (
+                <li key={task.id} className="rounded-xl border border-border bg-surface px-4 py-3 text-sm">
+                  <span className="font-medium text-foreground">{task.title}</span>
+                  {task.duration && <span className="ml-2 text-xs text-muted-foreground">{task.duration} min</span>}
+                </li>
+              ))}
+            </ul>
+          )}
         </div>
       </PageContainer>
     );
@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useCallback } from "react";
+import { useState, useCallback, useRef } from "react";
 import { useUser } from "@/hooks/useUser";
 import api from "@/lib/api";
 import { supabase } from "@/lib/supabase";
@@ -213,6 +213,7 @@ export interface UseDailyPlanReturn {
   plan: PlanResponse | null;
   isGenerating: boolean;
   progressMessage: string | null;
+  streamedTasks: PlanTask[];
   generateDailyPlan: (userTasks: UserTask[]) => Promise<void>;
   isIntervening: boolean;
   intervention: InterventionResponse | null;
@@ -233,6 +234,12 @@ export function useDailyPlan(): UseDailyPlanReturn {
   const [intervention, setIntervention] = useState<InterventionResponse | null>(null);
   const [error, setError] = useState<string | null>(null);
   const [progressMessage, setProgressMessage] = useState<string | null>(null);
+  // Tasks streamed over the progress WebSocket while the plan is still generating
+  const [streamedTasks, setStreamedTasks] = useState<PlanTask[]>([]);
+  // Last progress sequence id seen, so a new connection resumes instead of starting over
+  const lastSeqRef = useRef<number | null>(null);
+  // Run whose streamed tasks the preview shows; a hedged plan request streams from two runs
+  const streamRunRef = useRef<string | null>(null);
 
   // Helper: connect WebSocket for real-time agent progress (with JWT auth)
   async function connectProgressWs(): Promise<WebSocket | null> {
@@ -244,13 +251,43 @@ export function useDailyPlan(): UseDailyPlanReturn {
 
       const wsUrl = (process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000")
         .replace(/^http/, "ws");
-      const ws = new WebSocket(`${wsUrl}/ws/agent-progress/${user.id}?token=${token}`);
+      const resume = lastSeqRef.current !== null ? `&lastSeq=${lastSeqRef.current}` : "";
+      const ws = new WebSocket(`${wsUrl}/ws/agent-progress/${user.id}?token=${token}${resume}`);
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
-          if (data.type !== "heartbeat" && data.message) {
-            setProgressMessage(data.message);
+          // The server coalesces bursts into one "batch" frame; apply it as a single state update
+          const events: Array<{
+            type: string; seq?: number; runId?: string; kind?: string; message?: string;
+            task?: { index: number; title: string; description?: string; duration_minutes?: number; category?: string };
+          }> = data.type === "batch" ? data.events : [data];
+          const newTasks: PlanTask[] = [];
+          let message: string | null = null;
+          for (const e of events) {
+            if (typeof e.seq === "number") lastSeqRef.current = e.seq;
+            if (e.type === "task_streamed" && e.kind === "plan" && e.task) {
+              const runId = e.runId ?? "";
+              streamRunRef.current ??= runId;
+              if (runId !== streamRunRef.current) continue;
+              const t = e.task;
+              newTasks.push({
+                id: `${runId}:${t.index}`,
+                title: t.title,
+                description: t.description,
+                duration: t.duration_minutes,
+                type: (t.category ?? "routine") as TaskType,
+                completed: false,
+              });
+            }
+            if (e.type !== "heartbeat" && e.message) message = e.message;
           }
+          if (newTasks.length > 0) {
+            setStreamedTasks((prev) => [
+              ...prev,
+              ...newTasks.filter((t) => !prev.some((p) => p.id === t.id)),
+            ]);
+          }
+          if (message) setProgressMessage(message);
         } catch { /* ignore parse errors */ }
       };
       ws.onerror = () => { /* silently ignore WS errors — HTTP API is primary */ };
@@ -266,6 +303,8 @@ export function useDailyPlan(): UseDailyPlanReturn {
       setIsGenerating(true);
       setError(null);
       setIntervention(null);
+      setStreamedTasks([]);
+      streamRunRef.current = null;
       setProgressMessage("Connecting to AI agents...");
 
       const ws = await connectProgressWs();
@@ -315,6 +354,7 @@ export function useDailyPlan(): UseDailyPlanReturn {
       } finally {
         ws?.close();
         setIsGenerating(false);
+        setStreamedTasks([]);
         setProgressMessage(null);
       }
     },
@@ -403,7 +443,7 @@ export function useDailyPlan(): UseDailyPlanReturn {
 
   return {
     brainState, setBrainState,
-    plan, isGenerating, progressMessage, generateDailyPlan,
+    plan, isGenerating, progressMessage, streamedTasks, generateDailyPlan,
     isIntervening, intervention, triggerStuck, clearIntervention,
     toggleTaskComplete, resetPlan, error,
   };